@@ -30,6 +30,10 @@ class FileForm(forms.Form):
     byte_size = fields.hidden(fields.int(required=False))
     filepath = fields.hidden(fields.chars(max_length=255, required=False))
     filetype = fields.hidden(fields.chars(max_length=255, required=False))
+    # The byte size of each chunk the JS will send.
+    chunk_size = fields.hidden(fields.int(required=False))
+    # An earlier file_uuid of the same file, to resume the upload.
+    file_uuid = fields.hidden(fields.chars(max_length=64, required=False))
 
     # class Meta:
     #     fields = ('query',)
@@ -48,6 +52,10 @@ class FilesForm(forms.Form):
     byte_size = fields.hidden(fields.int(required=False))
     filepath = fields.hidden(fields.chars(max_length=255, required=False))
     filetype = fields.hidden(fields.chars(max_length=255, required=False))
+    # The byte size of each chunk the JS will send.
+    chunk_size = fields.hidden(fields.int(required=False))
+    # An earlier file_uuid of the same file, to resume the upload.
+    file_uuid = fields.hidden(fields.chars(max_length=64, required=False))
 
     # class Meta:
     #     fields = ('query',)
@@ -69,6 +77,8 @@ class FileChunkForm(forms.Form):
     chunk_index = fields.integer()
     # The 'file' expecting bytes for a partial file
     filepart = fields.file()
+    # The optional hex hash of the chunk bytes, checked as they are stored.
+    chunk_hash = forms.CharField(max_length=128, required=False)
 
     # class Meta:
     #     fields = ('query',)
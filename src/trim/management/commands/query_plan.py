@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from trim.views.planner import plan_report
+
+
+class Command(BaseCommand):
+    help = "Report the query count of reading model rows, without and with a plan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="The model label, such as books.Book.")
+        parser.add_argument(
+            "--fields",
+            default=None,
+            help="Comma separated lookups of each row, such as title,author__name.",
+        )
+        parser.add_argument(
+            "--many",
+            action="store_true",
+            help="Prefetch every many-to-many field when no fields are given.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=100, help="The count of rows read."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        fields = options["fields"]
+        if fields:
+            fields = [x.strip() for x in fields.split(",") if x.strip()]
+        queryset = model._default_manager.all()[: options["limit"]]
+        self.out(plan_report(queryset, fields or None, many=options["many"]))
+
+    def out(self, *a):
+        self.stdout.write(self.style.SUCCESS(" ".join(map(str, a))))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from trim import upload_cleanup
+
+
+class Command(BaseCommand):
+    help = "Remove abandoned chunked uploads and empty the upload trash"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            default=None,
+            help="Seconds an upload is untouched before removal.",
+        )
+        parser.add_argument(
+            "--trash-only",
+            action="store_true",
+            help="Only empty the trash.",
+        )
+
+    def handle(self, *args, **options):
+        if options["trash_only"]:
+            stats = upload_cleanup.empty_trash()
+        else:
+            stats = upload_cleanup.sweep(ttl=options["ttl"])
+        self.out("Reclaimed", stats)
+
+    def out(self, *a):
+        self.stdout.write(self.style.SUCCESS(" ".join(map(str, a))))
@@ -1,8 +1,20 @@
+import hashlib
+import io
+import json
 import os
+import time
 from pathlib import Path
 
+# The upper bound of bytes given to one kernel copy call. The kernel moves
+# the data, so this does not cost process memory.
+COPY_SLICE_SIZE = 64 * 1024 * 1024
+# The userspace fallback buffer, reused for every part.
+BUFFER_SIZE = 1024 * 1024
 
-def recombine(dir_path, output_filepath=None):
+
+def recombine(
+    dir_path, output_filepath=None, progress=None, buffer_size=None, hasher=None
+):
     """
     Merge multiple split file parts from a directory into a single file.
 
@@ -10,6 +22,12 @@ def recombine(dir_path, output_filepath=None):
     extensions like .part_0, .part_1, etc.) and recombines them into a single
     output file. The parts are merged in numerical order based on their suffix.
 
+    The parts are copied file-to-file by the kernel (`os.copy_file_range` or
+    `os.sendfile`) where the platform allows, falling back to a single reused
+    buffer of `buffer_size` bytes. The memory used is constant, whatever the
+    size of a part. The output is preallocated with `os.posix_fallocate` when
+    available.
+
     Args:
         dir_path (str or Path): The directory path containing the split file parts
             to be recombined.
@@ -18,6 +36,13 @@ def recombine(dir_path, output_filepath=None):
             If a directory is provided, the output filename will be derived from
             the first part file (without the .part_N extension). If None, defaults
             to the input directory. Defaults to None.
+        progress (callable, optional): A function called with a `MergeStats`
+            after each copied slice, and once more when the merge is complete.
+        buffer_size (int, optional): The size of the fallback copy buffer.
+            Defaults to `BUFFER_SIZE`.
+        hasher (hashlib hash, optional): Updated with every byte of the output
+            as it is written. The parts are read once through the buffer
+            (the kernel copy is skipped) so the hash costs no extra read.
 
     Returns:
         Path: The Path object pointing to the created merged file.
@@ -42,19 +67,25 @@ def recombine(dir_path, output_filepath=None):
             >>> output = recombine('/path/to/parts/', '/output/dir/')
             >>> # Creates merged file in /output/dir/filename
 
+        Report the throughput:
+
+            >>> recombine('/path/to/parts/', progress=lambda s: print(s.rate))
+
     Notes:
         - Part files must have extensions in the format .part_0, .part_1, etc.
+        - Other files within the directory are ignored
         - Parts are sorted numerically before merging
         - The function prints progress information during the merge process
-        - The output file size is printed upon completion
+        - The output file size and throughput is printed upon completion
         - If output file exists, FileExists exception is raised to prevent overwriting
 
     See Also:
         split_i: Helper function used to extract part numbers for sorting
+        copy_range: The per-part copy engine
     """
 
     # get all files
-    dir_files = os.listdir(dir_path)
+    dir_files = [x for x in os.listdir(dir_path) if is_part(x)]
     print("Found", len(dir_files))
 
     newname = Path(dir_files[0]).stem  # drops the .part_0
@@ -73,24 +104,397 @@ def recombine(dir_path, output_filepath=None):
         raise FileExists(output_filepath)
 
     ordered_files = sorted(dir_files, key=split_i)
+    sizes = tuple(os.path.getsize(Path(dir_path) / x) for x in ordered_files)
+
+    stats = MergeStats(sum(sizes))
+    buffer = bytearray(buffer_size or BUFFER_SIZE)
+
+    def on_copied(count):
+        stats.add(count)
+        if progress is not None:
+            progress(stats)
+
     # now merge
-    with open(output_filepath, "wb+") as write_stream:
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    write_fd = os.open(output_filepath, flags, 0o644)
+    try:
         print("Writing", output_filepath)
-        for filename in ordered_files:
+        preallocate(write_fd, stats.total)
+        for filename, size in zip(ordered_files, sizes):
             subfile = Path(dir_path) / filename
             print("  ", filename)
             with open(subfile, "rb") as read_stream:
-                write_stream.write(read_stream.read())
+                copy_range(
+                    read_stream.fileno(), write_fd, size, buffer, on_copied, hasher
+                )
         print("Complete", output_filepath.name)
+    finally:
+        os.close(write_fd)
+
+    stats.done()
+    if progress is not None:
+        progress(stats)
 
     print("Size: ", os.path.getsize(output_filepath))
+    print("Rate: ", stats)
 
     return output_filepath
 
 
+def copy_range(read_fd, write_fd, count, buffer=None, on_copied=None, hasher=None):
+    """Copy `count` bytes from the current position of `read_fd` to the
+    current position of `write_fd`, returning the number of bytes copied.
+
+    The fastest available method is used; `os.copy_file_range`, then
+    `os.sendfile`, then a `readinto` loop through the given `buffer`.
+    If a `hasher` is given the buffered loop is used, so the hash may see
+    the bytes.
+    """
+    if hasher is not None:
+        return copy_buffered(read_fd, write_fd, count, buffer, on_copied, hasher)
+
+    done = 0
+    for method in (_copy_file_range, _sendfile):
+        if method is None:
+            continue
+        try:
+            done += method(read_fd, write_fd, count - done, on_copied)
+        except CopyUnsupported:
+            # Not supported for this pair (e.g. cross-device or a
+            # filesystem without the syscall). Continue with the next.
+            continue
+        if done >= count:
+            return done
+
+    return done + copy_buffered(read_fd, write_fd, count - done, buffer, on_copied)
+
+
+def copy_buffered(read_fd, write_fd, count, buffer=None, on_copied=None, hasher=None):
+    """Copy `count` bytes through one reused userspace `buffer`, updating
+    the optional `hasher` with each block.
+    """
+    buffer = buffer or bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    reader = io.FileIO(read_fd, closefd=False)
+    done = 0
+    while done < count:
+        size = reader.readinto(view[: min(len(view), count - done)])
+        if size == 0:
+            break
+        if hasher is not None:
+            hasher.update(view[:size])
+        written = 0
+        while written < size:
+            written += os.write(write_fd, view[written:size])
+        done += size
+        if on_copied is not None:
+            on_copied(size)
+    return done
+
+
+def _kernel_copy(call):
+    def copier(read_fd, write_fd, count, on_copied=None):
+        done = 0
+        while done < count:
+            try:
+                size = call(read_fd, write_fd, min(COPY_SLICE_SIZE, count - done))
+            except OSError as err:
+                if done == 0:
+                    raise CopyUnsupported(err)
+                raise
+            if size == 0:
+                break
+            done += size
+            if on_copied is not None:
+                on_copied(size)
+        return done
+
+    return copier
+
+
+_copy_file_range = None
+if hasattr(os, "copy_file_range"):
+    _copy_file_range = _kernel_copy(os.copy_file_range)
+
+_sendfile = None
+if hasattr(os, "sendfile") and hasattr(os, "SEEK_CUR"):
+
+    def _sendfile_call(read_fd, write_fd, count):
+        # sendfile reads from an explicit offset; advance the source to match.
+        offset = os.lseek(read_fd, 0, os.SEEK_CUR)
+        size = os.sendfile(write_fd, read_fd, offset, count)
+        os.lseek(read_fd, offset + size, os.SEEK_SET)
+        return size
+
+    _sendfile = _kernel_copy(_sendfile_call)
+
+
+def preallocate(fd, size):
+    """Reserve `size` bytes for the open file `fd`. Silently skipped if the
+    platform or filesystem does not support `posix_fallocate`.
+    """
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        return False
+    return True
+
+
+class MergeStats(object):
+    """Throughput counters for a running merge."""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.written = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, count):
+        self.written += count
+
+    def done(self):
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        """Bytes per second."""
+        elapsed = self.elapsed
+        return (self.written / elapsed) if elapsed > 0 else 0
+
+    @property
+    def eta(self):
+        """Estimated seconds remaining, or None if unknown."""
+        rate = self.rate
+        if rate <= 0:
+            return None
+        return (self.total - self.written) / rate
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "written": self.written,
+            "elapsed": self.elapsed,
+            "rate": self.rate,
+            "eta": self.eta,
+            "done": self.finished is not None,
+        }
+
+    def __str__(self):
+        mib = self.rate / (1024 * 1024)
+        return f"{self.written} bytes in {self.elapsed:.3f}s ({mib:.2f} MiB/s)"
+
+
+def is_part(item):
+    suffix = Path(item).suffix
+    return suffix.startswith(".part_") and suffix[6:].isdigit()
+
+
 def split_i(item):
     return int(Path(item).suffix.split("_")[1])
 
 
 class FileExists(Exception):
     pass
+
+
+class CopyUnsupported(Exception):
+    """The kernel copy call is not available for the given file pair."""
+
+
+def create_sparse(filepath, size):
+    """Create (or resize) `filepath` as a sparse file of `size` bytes, ready
+    for chunks to be written at their offsets with `write_at`.
+    """
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    return Path(filepath)
+
+
+def hashing(chunks, hasher):
+    """Yield each of `chunks` after updating the `hasher` with it, to hash
+    a stream while it is written.
+    """
+    for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+
+def chunks_digest(digests, algorithm="sha256"):
+    """Return a digest over the ordered hex chunk `digests`. The value
+    identifies the whole file without reading it again, given each chunk
+    was verified on arrival.
+    """
+    hasher = hashlib.new(algorithm)
+    for digest in digests:
+        hasher.update(bytes.fromhex(digest))
+    return hasher.hexdigest()
+
+
+def write_at(filepath, offset, chunks):
+    """Write the iterable of byte `chunks` into the existing `filepath`,
+    starting at `offset`. Return the count of bytes written.
+
+    `os.pwrite` is used where available so concurrent writers of other
+    offsets do not share a file position.
+    """
+    fd = os.open(filepath, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    done = 0
+    try:
+        for chunk in chunks:
+            view = memoryview(chunk)
+            while len(view):
+                size = _pwrite(fd, view, offset + done)
+                view = view[size:]
+                done += size
+    finally:
+        os.close(fd)
+    return done
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+def promote(filepath, output_filepath):
+    """Move a completed in-place file to its `output_filepath` with a rename.
+    If `output_filepath` is a directory, the name of `filepath` is kept.
+
+    Raises `FileExists` if the output already exists.
+    """
+    output_filepath = Path(output_filepath)
+    if output_filepath.is_dir():
+        output_filepath = output_filepath / Path(filepath).name
+
+    if output_filepath.exists():
+        raise FileExists(output_filepath)
+
+    os.replace(filepath, output_filepath)
+    return output_filepath
+
+
+class ChunkMap(object):
+    """A record of received chunks for in-place uploads, stored as one byte
+    per chunk within a file beside the target.
+
+    A single byte per chunk (rather than a packed bit) allows each writer
+    to flag its own index with one positional write, without reading or
+    locking the rest of the map.
+
+        chunk_map = ChunkMap(path, count=10).create()
+        chunk_map.mark(3)
+        chunk_map.missing()  # [0, 1, 2, 4, ...]
+    """
+
+    def __init__(self, filepath, count=None):
+        self.filepath = Path(filepath)
+        self._count = count
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = os.path.getsize(self.filepath)
+        return self._count
+
+    def create(self):
+        create_sparse(self.filepath, self.count)
+        return self
+
+    def mark(self, index):
+        if index < 0 or index >= self.count:
+            raise IndexError(f"chunk index {index} outside 0-{self.count - 1}")
+        write_at(self.filepath, index, (b"\x01",))
+
+    def read(self):
+        return self.filepath.read_bytes()
+
+    def received(self):
+        return [i for i, v in enumerate(self.read()) if v]
+
+    def missing(self):
+        return [i for i, v in enumerate(self.read()) if not v]
+
+    def is_full(self):
+        data = self.read()
+        return len(data) == self.count and data.count(0) == 0
+
+
+def chunk_count(size, chunk_size):
+    """Return the number of chunks of `chunk_size` for `size` bytes."""
+    return max(1, -(-size // chunk_size))
+
+
+class ChunkManifest(object):
+    """A durable, append-only record of an upload, kept beside its chunks
+    as JSON lines. The first `session` line holds the upload details, and
+    each `chunk` line records a received chunk:
+
+        {"session": {"filename": "movie.mp4", "bytesize": 1000, ...}}
+        {"chunk": 0, "size": 100, "hash": "ab12...", "verified": true}
+
+    Each line is written with a single `O_APPEND` write, so many workers
+    may record chunks without a lock. A later line for the same chunk
+    replaces an earlier one.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = Path(filepath)
+
+    def exists(self):
+        return self.filepath.exists()
+
+    def append(self, record):
+        line = (json.dumps(record, default=str) + "\n").encode()
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        fd = os.open(self.filepath, flags, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def write_session(self, info):
+        self.append({"session": info})
+
+    def add_chunk(self, index, size, digest=None, verified=False):
+        self.append(
+            {"chunk": index, "size": size, "hash": digest, "verified": verified}
+        )
+
+    def read(self):
+        """Return a tuple of the (last) session dict and a dict of chunk
+        records, keyed by the string chunk index.
+        """
+        session, chunks = None, {}
+        if self.exists() is False:
+            return session, chunks
+
+        with open(self.filepath, "rb") as stream:
+            for line in stream:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crashed writer.
+                    continue
+                if "session" in record:
+                    session = record["session"]
+                elif "chunk" in record:
+                    index = record.pop("chunk")
+                    chunks[str(index)] = record
+        return session, chunks
+
+    def session(self):
+        return self.read()[0]
+
+    def chunks(self):
+        return self.read()[1]
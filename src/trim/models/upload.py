@@ -0,0 +1,28 @@
+from django.db import models
+
+from . import fields
+
+
+class AbstractUploadSession(models.Model):
+    """The base of a database backed upload session store. Subclass within
+    an app and point the `trim.upload_store.ModelStore` to it:
+
+        # uploads/models.py
+        from trim.models.upload import AbstractUploadSession
+
+        class UploadSession(AbstractUploadSession):
+            pass
+
+        # settings.py
+        CHUNK_UPLOAD_STORE = {
+            "BACKEND": "trim.upload_store.ModelStore",
+            "OPTIONS": {"model": "uploads.UploadSession"},
+        }
+    """
+
+    key = fields.chars(max_length=64, unique=True, nil=False)
+    data = fields.json(default=dict)
+    updated = fields.dt_updated(db_index=True)
+
+    class Meta:
+        abstract = True
@@ -1,9 +1,331 @@
+import mimetypes
+import mmap
+import os
+import threading
+from collections import OrderedDict, namedtuple
 from pathlib import Path
+from urllib.parse import quote
 
-from django.http import FileResponse
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import smart_str
+from django.utils.http import http_date, parse_http_date_safe
 
+try:
+    import magic
+except ImportError:
+    magic = None
 
-def content_type_response(filepath, ext=None, content_types=None, default=None):
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# The content types of `content_type_response`, by extension.
+CONTENT_TYPES = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+}
+# The count of files in the metadata cache.
+FILE_META_SIZE = 2048
+# The bytes of a mapped file sent at once.
+MAPPED_BLOCK_SIZE = 64 * 1024
+
+# The offload MODE and the header naming the file for the front server.
+OFFLOAD_HEADERS = {
+    "x-accel-redirect": "X-Accel-Redirect",
+    "x-sendfile": "X-Sendfile",
+    "x-lighttpd-send-file": "X-LIGHTTPD-send-file",
+}
+
+
+def get_offload():
+    """Return the `DOWNLOAD_OFFLOAD` setting, to hand file downloads to the
+    front web server:
+
+        DOWNLOAD_OFFLOAD = {
+            # "x-accel-redirect" (nginx), "x-sendfile" (Apache), or
+            # "x-lighttpd-send-file"; None to stream from Django.
+            "MODE": "x-accel-redirect",
+            # Real path prefix: the prefix served by the front server.
+            "PREFIXES": {"/srv/uploads/finished/": "/protected/"},
+        }
+    """
+    return getattr(settings, "DOWNLOAD_OFFLOAD", None) or {}
+
+
+def offload_path(path, prefixes=None):
+    """Return the path or URI of the real `path` for the front server,
+    mapped by the longest matching prefix. Without `prefixes` the path is
+    unchanged. Return None if no prefix matches.
+    """
+    path = os.path.abspath(path)
+    if not prefixes:
+        return path
+    for real, served in sorted(prefixes.items(), key=lambda x: -len(x[0])):
+        real = os.path.abspath(real)
+        if path == real or path.startswith(real.rstrip(os.sep) + os.sep):
+            rest = path[len(real) :].lstrip(os.sep).replace(os.sep, "/")
+            return served.rstrip("/") + "/" + rest
+    return None
+
+
+def offload_response(path, content_type=None):
+    """Return an empty response naming the file at `path` in the header of
+    the `DOWNLOAD_OFFLOAD` mode, for the front server to send (with ranges
+    and conditional requests). Return None if offload is off, or the path
+    is not mapped.
+    """
+    conf = get_offload()
+    mode = (conf.get("MODE") or "").lower()
+    if not mode:
+        return None
+    if mode not in OFFLOAD_HEADERS:
+        raise ImproperlyConfigured(f"Unknown DOWNLOAD_OFFLOAD MODE {mode!r}")
+    target = offload_path(path, conf.get("PREFIXES"))
+    if target is None:
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-accel-redirect":
+        # nginx takes a URI of an `internal` location.
+        target = quote(target)
+    response[OFFLOAD_HEADERS[mode]] = smart_str(target)
+    return response
+
+
+def file_validators(path, stat_result=None):
+    """Return the strong `ETag` and the `Last-Modified` timestamp of the
+    file at `path`. The ETag is a fingerprint of the inode, mtime and size,
+    so no bytes of the file are read.
+    """
+    st = stat_result or os.stat(path)
+    etag = f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+    return etag, int(st.st_mtime)
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def conditional_response(request, etag, last_modified):
+    """Return a 304 Not Modified (or 412) response if the `If-None-Match`
+    or `If-Modified-Since` (etc.) headers of the `request` allow it,
+    otherwise None.
+    """
+    if request is None:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def if_range_matches(request, etag, last_modified):
+    """Return True if a `Range` of the `request` applies to the current
+    file: there is no `If-Range`, or it names this ETag (strongly) or this
+    Last-Modified date.
+    """
+    value = request.META.get("HTTP_IF_RANGE", "").strip() if request else ""
+    if not value:
+        return True
+    if value.startswith(('"', "W/")):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+FileMeta = namedtuple(
+    "FileMeta", "path size mtime content_type etag last_modified stat_result"
+)
+
+
+def guess_content_type(path):
+    """Return the content type of the file at `path`, by its name, or by
+    its first bytes with `python-magic` (if installed). Return None if it
+    is unknown.
+    """
+    content_type = mimetypes.guess_type(os.fspath(path))[0]
+    if content_type is None and magic is not None:
+        try:
+            content_type = magic.from_file(os.fspath(path), mime=True)
+        except (OSError, magic.MagicException):
+            content_type = None
+    return content_type
+
+
+class FileMetaCache(object):
+    """An LRU cache of the `FileMeta` of files: size, mtime, content type
+    and validators. Each lookup costs one `stat`, to validate the entry by
+    inode, mtime and size; the content type is resolved (and sniffed) once
+    per version of a file.
+    """
+
+    def __init__(self, max_entries=FILE_META_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, stat_result=None):
+        key = os.fspath(path)
+        st = stat_result or os.stat(key)
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]._replace(stat_result=st)
+            self.misses += 1
+
+        etag, last_modified = file_validators(key, st)
+        meta = FileMeta(
+            path=key,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            content_type=guess_content_type(key),
+            etag=etag,
+            last_modified=last_modified,
+            stat_result=st,
+        )
+        with self.lock:
+            self.entries[key] = (version, meta)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return meta
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+file_meta_cache = FileMetaCache()
+
+
+def get_file_meta(path, stat_result=None):
+    """Return the `FileMeta` of the file at `path`, from the shared cache
+    of the download helpers. Raise `FileNotFoundError` if it is missing.
+    """
+    return file_meta_cache.get(path, stat_result)
+
+
+class MappedFileCache(object):
+    """An LRU cache of read-only `mmap` mappings of files, keyed by path and
+    validated by inode, mtime and size. A hit serves the file without an
+    open or read. Mappings are held within `max_bytes`, and files larger
+    than `max_file_size` are not mapped.
+
+    An evicted mapping is released once the last response using it is
+    done. Replace cached files (write aside and rename) rather than
+    truncate them in place: reading a truncated mapping raises SIGBUS.
+    """
+
+    def __init__(self, max_bytes=0, max_file_size=None):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size or max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, stat_result=None):
+        """Return a `memoryview` of the whole file, or None if the file is
+        not cacheable.
+        """
+        key = os.fspath(path)
+        st = stat_result or os.stat(key)
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.drop(key)
+            self.misses += 1
+
+        if st.st_size == 0 or st.st_size > min(self.max_file_size, self.max_bytes):
+            return None
+
+        with open(key, "rb") as stream:
+            view = memoryview(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ))
+
+        with self.lock:
+            self.drop(key)
+            self.entries[key] = (version, view)
+            self.size += len(view)
+            while self.size > self.max_bytes:
+                self.drop(next(iter(self.entries)))
+        return view
+
+    def drop(self, key):
+        # The mapping closes when the last view of it is released.
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_mapped_caches = {}
+
+
+def get_mapped_cache():
+    """Return the (process cached) `MappedFileCache` of the
+    `RESPONSE_MMAP_CACHE` setting, or None if it is not enabled:
+
+        RESPONSE_MMAP_CACHE = {
+            "MAX_BYTES": 64 * 1024 * 1024,
+            "MAX_FILE_SIZE": 8 * 1024 * 1024,
+        }
+    """
+    conf = getattr(settings, "RESPONSE_MMAP_CACHE", None) or {}
+    if not conf.get("MAX_BYTES"):
+        return None
+    key = repr(sorted(conf.items()))
+    cache = _mapped_caches.get(key)
+    if cache is None:
+        cache = MappedFileCache(conf["MAX_BYTES"], conf.get("MAX_FILE_SIZE"))
+        _mapped_caches[key] = cache
+    return cache
+
+
+def iter_mapped(view, block_size=MAPPED_BLOCK_SIZE):
+    """Yield `memoryview` slices of the mapping `view`, so the file is
+    never copied whole.
+    """
+    for start in range(0, len(view), block_size):
+        yield view[start : start + block_size]
+
+
+def mapped_response(path, content_type, stat_result=None):
+    """Return a `StreamingHttpResponse` of the file at `path` from the mmap
+    cache, or None if the cache is off or the file is not cacheable. The
+    body is sent in slices of the cached mapping.
+    """
+    cache = get_mapped_cache()
+    if cache is None:
+        return None
+    view = cache.get(path, stat_result)
+    if view is None:
+        return None
+    response = StreamingHttpResponse(iter_mapped(view), content_type=content_type)
+    response["Content-Length"] = len(view)
+    return response
+
+
+def content_type_response(
+    filepath, ext=None, content_types=None, default=None, request=None
+):
     """Return a `FileResponse` type with the Content-Disposition applied.
 
     from trim.response import content_type_response
@@ -11,20 +333,34 @@ def content_type_response(filepath, ext=None, content_types=None, default=None):
     real_filepath = Path('real/file.js')
     return content_type_response(real_filepath)
 
+    The content type is that of `content_types` (by extension), else the
+    `default`, else the type guessed (or sniffed) by the metadata cache.
+
+    The `ETag` and `Last-Modified` headers are set. Given the `request`, a
+    304 Not Modified is returned if the client holds the current file.
+    With `DOWNLOAD_OFFLOAD`, the front server sends the file. With
+    `RESPONSE_MMAP_CACHE`, small files are served from memory mappings.
     """
-    default = default or "application/octet-stream"
+    meta = get_file_meta(filepath)
+    content_type = (content_types or CONTENT_TYPES).get(Path(filepath).suffix[1:])
+    if content_type is None:
+        content_type = default or meta.content_type or DEFAULT_CONTENT_TYPE
 
-    content_type_map = content_types or {
-        "png": "image/png",
-        "pdf": "application/pdf",
-        "unknown": default,
-    }
+    response = offload_response(filepath, content_type)
+    if response is not None:
+        response["Content-Disposition"] = "filename={}".format(filepath.name)
+        return response
 
-    content_type = content_type_map.get(Path(filepath).suffix[1:], default)
+    response = conditional_response(request, meta.etag, meta.last_modified)
+    if response is not None:
+        return response
 
-    response = FileResponse(filepath.open("rb"), content_type=content_type)
+    response = mapped_response(filepath, content_type, meta.stat_result)
+    if response is None:
+        response = FileResponse(filepath.open("rb"), content_type=content_type)
 
     response["Content-Disposition"] = "filename={}".format(filepath.name)
+    set_validators(response, meta.etag, meta.last_modified)
     return response
 
 
@@ -36,17 +372,20 @@ def content_data_response(filedata, filename, content_types=None, default=None):
     real_filedata = Path('real/file.js')
     return content_type_response(real_filedata)
 
+    The `filedata` may be the data, a file object, or the `Path` (an
+    `os.PathLike`) of a file; a path may be served from the
+    `RESPONSE_MMAP_CACHE`. A `str` is data, not a path.
     """
-    default = default or "application/octet-stream"
-
-    content_type_map = content_types or {
-        "png": "image/png",
-        "pdf": "application/pdf",
-        "unknown": default,
-    }
-
+    default = default or DEFAULT_CONTENT_TYPE
+    content_type_map = content_types or CONTENT_TYPES
     content_type = content_type_map.get(Path(filename).suffix[1:], default)
 
-    response = FileResponse(filedata, content_type=content_type)
+    response = None
+    if isinstance(filedata, os.PathLike):
+        response = mapped_response(filedata, content_type)
+        if response is None:
+            filedata = open(filedata, "rb")
+    if response is None:
+        response = FileResponse(filedata, content_type=content_type)
     response["Content-Disposition"] = "filename={}".format(filename)
     return response
@@ -35,12 +35,18 @@ const formSubmitHandler = function(ev, fieldName='file') {
 
     setFileField(form, formData, 'filetype', f.type)
     setFileField(form, formData, 'filepath', realName)
+    // The server may write each chunk at index * chunk_size.
+    setFileField(form, formData, 'chunk_size', chunkSize)
 
     if(name.length == 0) {
         // setFileField(form, formData, 'filename', realName)
         formData.set('filename', realName)
     }
 
+    // Offer the uuid of an unfinished upload of this file, to resume it.
+    let resumeKey = getResumeKey(f)
+    setFileField(form, formData, 'file_uuid', localStorage.getItem(resumeKey) || '')
+
     return fetch(form.action, {
             method: 'POST',
             body: formData,
@@ -52,6 +58,10 @@ const formSubmitHandler = function(ev, fieldName='file') {
         .then(function(d){
             document.querySelector('.merge-link').dataset.uuid = d.file_uuid
             UPLOADS.uuid = d.file_uuid
+            localStorage.setItem(resumeKey, d.file_uuid)
+            if(d.resumed) {
+                console.log('Resuming', d.file_uuid, d.missing)
+            }
             let eachFunc = function(d){
                 console.log('eachFunc', d)
                 d.timeTaken
@@ -109,7 +119,7 @@ const countBytes = function(file) {
 }
 
 
-const chunkSize = 1024 * 1024 * UPLOADS.allowances.max_file_size; // size of each chunk (1MB)
+const chunkSize = 1024 * 1024 * ((UPLOADS.allowances || {}).max_file_size || 1); // size of each chunk (1MB)
 const submitParts = function(form, extra, eachFunc){
     // Read the file
     // make a new form to the parts endpoint.
@@ -117,12 +127,18 @@ const submitParts = function(form, extra, eachFunc){
     let files = formData.getAll('file')
 
     for(let file of files) {
-        submitFileForm(file, extra, (x) => allDoneFunc(form, x), eachFunc)
+        submitFileForm(file, extra, (x) => allDoneFunc(form, file), eachFunc)
     }
 }
 
+const getResumeKey = function(file) {
+    return `trim-upload:${file.name}:${file.size}:${file.lastModified}`
+}
+
+
 const allDoneFunc = function(form, file){
     console.log('Done', form, file)
+    localStorage.removeItem(getResumeKey(file))
     if(UPLOADS.autoContinue) {
         // press the recombine button.
         let uuid = UPLOADS.uuid;
@@ -141,8 +157,10 @@ const progressBarLabel = function(){
 
 
 const submitFileForm = function(file, extra, allDoneFunc, eachFunc) {
-    let doneCount = 0;
-    let pc = Math.ceil(file.size / chunkSize)
+    let pc = Math.max(1, Math.ceil(file.size / chunkSize))
+    // A resumed upload sends only the missing chunks.
+    let missing = extra.missing
+    let doneCount = missing ? pc - missing.length : 0;
 
     let pg = progressBar()
     let pgl = progressBarLabel()
@@ -173,8 +191,11 @@ const submitFileForm = function(file, extra, allDoneFunc, eachFunc) {
 
     console.log(getSize(file), pc, 'chunks')
     // let sent = chunkFileUpload(file, extra, _eachFunc)
-    let sent = chunkFileUploadLinear(file, extra, _eachFunc, _allDoneFunc)
-    console.log('sent', sizeString(sent))
+    // let sent = chunkFileUploadLinear(file, extra, _eachFunc, _allDoneFunc)
+    let sent = missing
+        ? chunkIndexesUpload(file, extra, missing, _eachFunc, _allDoneFunc, UPLOADS.parallel || 4)
+        : chunkFileUploadParallel(file, extra, _eachFunc, _allDoneFunc)
+    console.log('sent', sizeString(file.size))
 }
 
 
@@ -289,6 +310,67 @@ function chunkFileUploadLinearLoop(file, extra, index=0, start=0, chunkHandler=u
 }
 
 
+/* Send the chunks of a file with `UPLOADS.parallel` requests in flight.
+Each worker takes the next unsent index until none remain. A failed chunk
+is re-sent (up to `UPLOADS.retries` times), the server accepts a repeated
+`chunk_index` as a replacement.
+*/
+function chunkFileUploadParallel(file, extra, chunkHandler, doneHandler, parallel) {
+    parallel = parallel || UPLOADS.parallel || 4
+    let count = Math.max(1, Math.ceil(file.size / chunkSize))
+    let indexes = Array.from({ length: count }, (v, i) => i)
+    return chunkIndexesUpload(file, extra, indexes, chunkHandler, doneHandler, parallel)
+}
+
+
+function chunkIndexesUpload(file, extra, indexes, chunkHandler, doneHandler, parallel) {
+    let queue = indexes.slice()
+
+    let worker = function() {
+        if(queue.length == 0) {
+            return Promise.resolve()
+        }
+        let index = queue.shift()
+        let start = index * chunkSize
+        let bits = file.slice(start, start + chunkSize);
+        let newExtra = Object.assign({}, extra, { index })
+
+        return sendChunkRetry(bits, newExtra, UPLOADS.retries || 3)
+            .then((r)=>{
+                let v = Object.assign(r, { chunkSize: chunkSize })
+                chunkHandler && chunkHandler(v);
+                return r
+            })
+            .then(worker)
+    }
+
+    let workers = []
+    for(let i = 0; i < Math.min(parallel, queue.length); i++) {
+        workers.push(worker())
+    }
+
+    return Promise.all(workers).then(()=> doneHandler && doneHandler(file))
+}
+
+
+function sendChunkRetry(bits, extra, retries) {
+    return sendChunk(bits, extra)
+        .then((r)=>{
+            if(r.ok === false) {
+                throw new Error(r.error)
+            }
+            return r
+        })
+        .catch((err)=>{
+            if(retries <= 0) {
+                throw err
+            }
+            console.warn('Retry chunk', extra.index, err)
+            return sendChunkRetry(bits, extra, retries - 1)
+        })
+}
+
+
 function sendChunk(bits, extra){
 
     let _extra = {
@@ -296,7 +378,9 @@ function sendChunk(bits, extra){
             chunk_index: extra.index,
         }
 
-    let fetchPromise = uploadChunk(bits, _extra)
+    let send = UPLOADS.rawChunkURL ? uploadChunkRaw : uploadChunk
+    let fetchPromise = hashChunk(bits, extra.hash_algorithm)
+                        .then((chunk_hash)=> send(bits, Object.assign(_extra, { chunk_hash })))
                         .then((response)=> response.json())
                         ;
     // return start
@@ -304,6 +388,37 @@ function sendChunk(bits, extra){
 }
 
 
+/* The Web Crypto names of the server `hash_algorithm` values. */
+const SUBTLE_HASHES = {
+    sha1: 'SHA-1',
+    sha256: 'SHA-256',
+    sha384: 'SHA-384',
+    sha512: 'SHA-512',
+}
+
+
+/* Resolve the hex digest of the chunk, by the `algorithm` of the server
+(the `hash_algorithm` of the upload response, default sha256), for the
+server to check as it stores the chunk. Resolves an empty string (no
+check) if hashing is disabled with `UPLOADS.hashChunks = false`, or the
+browser cannot hash with the algorithm (such as md5 or blake2b).
+*/
+function hashChunk(chunk, algorithm) {
+    let subtle = window.crypto && window.crypto.subtle
+    let name = SUBTLE_HASHES[(algorithm || 'sha256').toLowerCase().replace('-', '')]
+    if(!subtle || !name || UPLOADS.hashChunks === false) {
+        return Promise.resolve('')
+    }
+
+    return chunk.arrayBuffer()
+        .then((buffer)=> subtle.digest(name, buffer))
+        .then((digest)=> Array.from(new Uint8Array(digest))
+                            .map((b)=> b.toString(16).padStart(2, '0'))
+                            .join('')
+        )
+}
+
+
 function uploadChunk(chunk, extra) {
     let uploadForm = document.querySelector('.file-chunk-form form')
     let formUrl = uploadForm.action
@@ -331,6 +446,30 @@ function uploadChunk(chunk, extra) {
 }
 
 
+/* Send the chunk as the raw request body to `UPLOADS.rawChunkURL`
+(an `UploadRawChunkView`), naming it with headers. This skips the
+multipart encoding of `uploadChunk`.
+*/
+function uploadChunkRaw(chunk, extra) {
+    let index = extra.chunk_index
+    let headers = {
+        'Content-Type': 'application/octet-stream',
+        'X-File-UUID': extra.file_uuid,
+        'X-Chunk-Index': index,
+    }
+    if(extra.chunk_hash) {
+        headers['X-Chunk-Hash'] = extra.chunk_hash
+    }
+
+    console.log('Sending Raw Chunk', index);
+    return fetch(UPLOADS.rawChunkURL, {
+        method: 'POST',
+        body: chunk,
+        headers,
+    });
+}
+
+
 function wait(milliseconds) {
     return new Promise(resolve => setTimeout(resolve, milliseconds));
 }
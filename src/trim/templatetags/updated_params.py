@@ -38,3 +38,23 @@ def updated_params(context, **kwargs):
     res = context["request"].GET.copy()
     res.update(kwargs)
     return res.urlencode()
+
+
+@register.simple_tag(takes_context=True)
+def cursor_params(context, page, cursor=None):
+    """Return the query string of the current request with the cursor of
+    the keyset `page` (see `trim.views.keyset`) set to `cursor`, or
+    removed if None, for the first page. A `page` number is removed.
+
+    Examples:
+        {% load updated_params %}
+
+        <a href="?{% cursor_params page_obj page_obj.next_cursor %}">next</a>
+        <a href="?{% cursor_params page_obj %}">first</a>
+    """
+    res = context["request"].GET.copy()
+    res.pop("page", None)
+    res.pop(page.cursor_field, None)
+    if cursor is not None:
+        res[page.cursor_field] = cursor
+    return res.urlencode()
@@ -0,0 +1,236 @@
+"""Remove the files of merged and abandoned uploads, away from the request.
+
+A parts directory is first moved into the trash (`CHUNK_UPLOAD_DIR/.trash`)
+with one rename, then removed in batches by a job on the upload runner (see
+`trim.upload_tasks`).
+
+Uploads untouched for `CHUNK_UPLOAD_SWEEP_TTL` seconds (default one day) are
+abandoned, and removed by `sweep()`. Run it on a schedule (such as cron)
+with the management command:
+
+    python manage.py upload_sweep
+
+or within the web process, by setting `CHUNK_UPLOAD_SWEEP_INTERVAL` to the
+seconds between sweeps.
+"""
+
+import errno
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .upload_store import get_store
+from .upload_tasks import get_runner
+
+TRASH_NAME = ".trash"
+# Files removed between pauses of `remove_tree`.
+BATCH_SIZE = 500
+DEFAULT_SWEEP_TTL = 60 * 60 * 24
+
+
+class CleanupStats(object):
+    """Counters of the files and directories removed, and bytes reclaimed."""
+
+    def __init__(self):
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, other):
+        with self.lock:
+            self.files += other.files
+            self.dirs += other.dirs
+            self.bytes += other.bytes
+
+    def as_dict(self):
+        return {"files": self.files, "dirs": self.dirs, "bytes": self.bytes}
+
+    def __str__(self):
+        return f"{self.files} files, {self.dirs} dirs, {self.bytes} bytes"
+
+
+# The counters of every cleanup within this process.
+totals = CleanupStats()
+
+
+def get_root(root=None):
+    return Path(root or settings.CHUNK_UPLOAD_DIR)
+
+
+def get_trash_dir(root=None):
+    return get_root(root) / TRASH_NAME
+
+
+def trash(path, root=None):
+    """Move the directory `path` into the trash with one rename, returning
+    its new path. If the trash is on another device, `path` is returned
+    unmoved.
+    """
+    trash_dir = get_trash_dir(root)
+    trash_dir.mkdir(parents=True, exist_ok=True)
+    target = trash_dir / f"{uuid.uuid4().hex}-{Path(path).name}"
+    try:
+        os.rename(path, target)
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        return Path(path)
+    return target
+
+
+def remove_tree(path, batch_size=BATCH_SIZE, pause=0, stats=None):
+    """Remove the directory `path` and everything within it, without
+    recursion. Files are listed with `os.scandir`, and every `batch_size`
+    files the remover sleeps for `pause` seconds, to share the disk with
+    requests. Entries removed by another process are skipped.
+
+    Return the `CleanupStats` of the removal.
+    """
+    stats = stats or CleanupStats()
+    pending = [os.fspath(path)]
+    # Directories in the order found; removed in reverse, children first.
+    found = []
+    removed = 0
+
+    while pending:
+        current = pending.pop()
+        try:
+            entries = list(os.scandir(current))
+        except FileNotFoundError:
+            continue
+        found.append(current)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+                continue
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            stats.files += 1
+            stats.bytes += size
+            removed += 1
+            if pause and removed % batch_size == 0:
+                time.sleep(pause)
+
+    for current in reversed(found):
+        try:
+            os.rmdir(current)
+        except FileNotFoundError:
+            continue
+        stats.dirs += 1
+    return stats
+
+
+def purge(path, batch_size=BATCH_SIZE, pause=0):
+    """The background job removing a trashed directory."""
+    stats = remove_tree(path, batch_size, pause)
+    totals.add(stats)
+    print("Purged", path, stats)
+    return stats.as_dict()
+
+
+def empty_trash(root=None, stats=None):
+    """Remove everything within the trash."""
+    stats = stats or CleanupStats()
+    trash_dir = get_trash_dir(root)
+    if trash_dir.exists() is False:
+        return stats
+    for entry in os.scandir(trash_dir):
+        if entry.is_dir(follow_symlinks=False):
+            remove_tree(entry.path, stats=stats)
+            continue
+        # Another cleanup (a sweep, or a purge job) may remove it first.
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+        stats.bytes += size
+        stats.files += 1
+    return stats
+
+
+def is_upload_dir(entry):
+    """Return True if the `os.DirEntry` is the parts directory of an
+    upload, named by its UUID.
+    """
+    if entry.is_dir(follow_symlinks=False) is False:
+        return False
+    try:
+        return str(uuid.UUID(entry.name)) == entry.name
+    except ValueError:
+        return False
+
+
+def last_modified(path):
+    """Return the newest mtime of the directory and its direct entries."""
+    newest = os.stat(path).st_mtime
+    for entry in os.scandir(path):
+        newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+    return newest
+
+
+def get_sweep_ttl():
+    return getattr(settings, "CHUNK_UPLOAD_SWEEP_TTL", DEFAULT_SWEEP_TTL)
+
+
+def find_abandoned(root=None, ttl=None):
+    """Return the parts directories (`root/<username>/<uuid>`) untouched for
+    `ttl` seconds.
+    """
+    root = get_root(root)
+    ttl = get_sweep_ttl() if ttl is None else ttl
+    cutoff = time.time() - ttl
+    res = []
+    if root.exists() is False:
+        return res
+    for user_dir in os.scandir(root):
+        if user_dir.name == TRASH_NAME or not user_dir.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(user_dir.path):
+            if is_upload_dir(entry) and last_modified(entry.path) < cutoff:
+                res.append(Path(entry.path))
+    return res
+
+
+def sweep(root=None, ttl=None):
+    """Remove abandoned uploads and empty the trash. Expired sessions are
+    evicted from the session store. Return the `CleanupStats`.
+    """
+    stats = CleanupStats()
+    for path in find_abandoned(root, ttl):
+        print("Abandoned", path)
+        if trash(path, root) == path:
+            remove_tree(path, stats=stats)
+    empty_trash(root, stats)
+    get_store().evict()
+    totals.add(stats)
+    print("Swept", stats)
+    return stats
+
+
+last_sweep = None
+
+
+def schedule_sweep():
+    """Queue a `sweep()` on the upload runner if `CHUNK_UPLOAD_SWEEP_INTERVAL`
+    seconds have passed since the last within this process. Return True if
+    a sweep was queued.
+    """
+    global last_sweep
+    interval = getattr(settings, "CHUNK_UPLOAD_SWEEP_INTERVAL", None)
+    if not interval:
+        return False
+    now = time.monotonic()
+    if last_sweep is not None and now - last_sweep < interval:
+        return False
+    last_sweep = now
+    get_runner().submit("trim.upload_cleanup.sweep")
+    return True
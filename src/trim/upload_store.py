@@ -0,0 +1,358 @@
+"""Upload session stores for the chunked upload views.
+
+The session of an upload (filename, size, mode, progress) must be visible
+to every worker receiving its chunks. Choose a backend with the
+`CHUNK_UPLOAD_STORE` setting:
+
+    CHUNK_UPLOAD_STORE = {
+        "BACKEND": "trim.upload_store.SQLiteStore",
+        "TTL": 60 * 60 * 24,
+        "OPTIONS": {"path": "/dev/shm/uploads.sqlite3"},
+    }
+
++ `DjangoCacheStore` (default): the Django cache framework. Use a shared
+  cache (redis, memcached, database) to span workers and nodes.
++ `ModelStore`: a concrete model of `trim.models.upload.AbstractUploadSession`.
++ `SQLiteStore`: a SQLite file shared by all workers of one node.
++ `LocalStore`: a per-process dict, for a single worker or tests.
+
+Sessions untouched for `TTL` seconds are dropped by `evict()`, and never
+returned by `get()`.
+
+Use `lock()` to read-modify-write a session while other workers receive
+chunks of the same upload:
+
+    with store.lock(file_uuid):
+        info = store.get(file_uuid)
+        info["done"] = True
+        store.set(file_uuid, info)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_TTL = 60 * 60 * 24
+DEFAULT_BACKEND = "trim.upload_store.DjangoCacheStore"
+# Seconds to wait for a session lock before raising `LockTimeout`.
+LOCK_TIMEOUT = 30
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class UploadStore(object):
+    """The interface of an upload session store. A session is a JSON
+    serializable dict, stored against the upload `file_uuid`.
+
+    Dict style access is supported:
+
+        store = get_store()
+        store[file_uuid] = {"filename": "movie.mp4"}
+        info = store.get(file_uuid)
+
+    Mutating a returned dict does not update the store; `set()` it again.
+    """
+
+    def __init__(self, ttl=None, **options):
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.options = options
+        self._local_locks = {}
+        self._local_locks_lock = threading.Lock()
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def evict(self):
+        """Remove expired sessions, returning the count removed."""
+        return 0
+
+    @contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT):
+        """Hold an exclusive lock of the session `key`. The default is a
+        lock within this process only. Locks are not reentrant.
+        """
+        with self._local_locks_lock:
+            key_lock = self._local_locks.setdefault(key, threading.Lock())
+        if key_lock.acquire(timeout=timeout) is False:
+            raise LockTimeout(key)
+        try:
+            yield
+        finally:
+            key_lock.release()
+
+    def expires(self):
+        return time.time() + self.ttl
+
+    def dumps(self, value):
+        return json.dumps(value, default=str)
+
+    def loads(self, value):
+        return json.loads(value)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class LocalStore(UploadStore):
+    """A dict within the current process. Not shared between workers."""
+
+    def __init__(self, ttl=None, **options):
+        super().__init__(ttl, **options)
+        self.data = {}
+
+    def get(self, key, default=None):
+        row = self.data.get(key)
+        if row is None or row[0] < time.time():
+            return default
+        return self.loads(row[1])
+
+    def set(self, key, value):
+        self.data[key] = (self.expires(), self.dumps(value))
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def evict(self):
+        now = time.time()
+        keys = [k for k, (expires, _) in self.data.items() if expires < now]
+        for key in keys:
+            del self.data[key]
+        return len(keys)
+
+
+class DjangoCacheStore(UploadStore):
+    """Store sessions in a Django cache; the cache applies the TTL.
+
+    OPTIONS:
+        alias: The `CACHES` alias. Default "default".
+        prefix: The key prefix. Default "trim-upload:".
+    """
+
+    def get_cache(self):
+        from django.core.cache import caches
+
+        return caches[self.options.get("alias", "default")]
+
+    def make_key(self, key):
+        return f"{self.options.get('prefix', 'trim-upload:')}{key}"
+
+    def get(self, key, default=None):
+        value = self.get_cache().get(self.make_key(key))
+        if value is None:
+            return default
+        return self.loads(value)
+
+    def set(self, key, value):
+        self.get_cache().set(self.make_key(key), self.dumps(value), self.ttl)
+
+    def delete(self, key):
+        self.get_cache().delete(self.make_key(key))
+
+    @contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT):
+        """A lock shared through the cache with an atomic `add()`. The lock
+        key expires after `timeout` should the holder die.
+        """
+        cache = self.get_cache()
+        lock_key = f"{self.make_key(key)}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while cache.add(lock_key, token, timeout) is False:
+            if time.monotonic() > deadline:
+                raise LockTimeout(key)
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+
+class ModelStore(UploadStore):
+    """Store sessions as rows of a model subclassing
+    `trim.models.upload.AbstractUploadSession`.
+
+    OPTIONS:
+        model: The model label, e.g. "uploads.UploadSession".
+    """
+
+    def get_model(self):
+        from django.apps import apps
+
+        return apps.get_model(self.options["model"])
+
+    def get_cutoff(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def get(self, key, default=None):
+        model = self.get_model()
+        row = model.objects.filter(key=key, updated__gte=self.get_cutoff()).first()
+        if row is None:
+            return default
+        return row.data
+
+    def set(self, key, value):
+        model = self.get_model()
+        # Round trip the value to apply the same encoding as other stores.
+        data = self.loads(self.dumps(value))
+        model.objects.update_or_create(key=key, defaults={"data": data})
+
+    def delete(self, key):
+        self.get_model().objects.filter(key=key).delete()
+
+    @contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT):
+        """Lock the session row with `select_for_update` for the duration
+        of a transaction.
+        """
+        from django.db import transaction
+
+        model = self.get_model()
+        with transaction.atomic():
+            model.objects.select_for_update().filter(key=key).first()
+            yield
+
+    def evict(self):
+        model = self.get_model()
+        count, _ = model.objects.filter(updated__lt=self.get_cutoff()).delete()
+        return count
+
+
+class SQLiteStore(UploadStore):
+    """Store sessions in a SQLite file, shared by every process on the node.
+    Place the file on a tmpfs (such as `/dev/shm`) for a memory backed store.
+
+    OPTIONS:
+        path: The database file. Default `CHUNK_UPLOAD_DIR/sessions.sqlite3`.
+        timeout: Seconds to wait on a locked database. Default 30.
+    """
+
+    table = "trim_upload_session"
+
+    def __init__(self, ttl=None, **options):
+        super().__init__(ttl, **options)
+        self.local = threading.local()
+
+    def get_path(self):
+        path = self.options.get("path")
+        if path is None:
+            path = Path(settings.CHUNK_UPLOAD_DIR) / "sessions.sqlite3"
+        return Path(path)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            return conn
+
+        path = self.get_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            str(path),
+            timeout=self.options.get("timeout", 30),
+            isolation_level=None,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_expires "
+            f"ON {self.table} (expires)"
+        )
+        self.local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = (
+            self.connect()
+            .execute(
+                f"SELECT data FROM {self.table} WHERE key = ? AND expires >= ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return default
+        return self.loads(row[0])
+
+    def set(self, key, value):
+        self.connect().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, data, expires) "
+            "VALUES (?, ?, ?)",
+            (key, self.dumps(value), self.expires()),
+        )
+
+    def delete(self, key):
+        self.connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    @contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT):
+        """Hold the database write lock; other processes wait up to the
+        connection timeout. The lock covers every session in the file.
+        """
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as err:
+            raise LockTimeout(key) from err
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def evict(self):
+        cursor = self.connect().execute(
+            f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+
+_stores = {}
+
+
+def get_store():
+    """Return the (process cached) store defined by `CHUNK_UPLOAD_STORE`."""
+    conf = getattr(settings, "CHUNK_UPLOAD_STORE", None) or {}
+    key = repr(sorted(conf.items()))
+    store = _stores.get(key)
+    if store is None:
+        store_class = conf.get("BACKEND", DEFAULT_BACKEND)
+        if isinstance(store_class, str):
+            store_class = import_string(store_class)
+        store = store_class(conf.get("TTL"), **conf.get("OPTIONS", {}))
+        _stores[key] = store
+    return store
@@ -0,0 +1,152 @@
+"""Run upload jobs, such as the merge, outside of the request.
+
+A job is the dotted path of a function and JSON serializable keyword
+arguments, so any runner (or task queue) may carry it. Choose a runner with
+the `CHUNK_UPLOAD_RUNNER` setting:
+
+    CHUNK_UPLOAD_RUNNER = {
+        "BACKEND": "trim.upload_tasks.ThreadRunner",
+        "OPTIONS": {"workers": 2},
+    }
+
++ `ThreadRunner` (default): a thread pool within the web process.
++ `ProcessRunner`: a process pool; each worker process runs `django.setup()`.
++ `ImmediateRunner`: run the job within the request, for tests or debugging.
+
+Adapt a task queue by subclassing `Runner`:
+
+    class CeleryRunner(Runner):
+        def submit(self, job, **kwargs):
+            run_upload_job.delay(job, kwargs)
+
+    @shared_task
+    def run_upload_job(job, kwargs):
+        upload_tasks.call(job, **kwargs)
+
+The progress of a job is kept in the upload session store, so it is visible
+to every worker; see `trim.views.upload.UploadProgressView`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = "trim.upload_tasks.ThreadRunner"
+DEFAULT_WORKERS = 2
+
+
+def call(job, **kwargs):
+    """Import and run the job function at the dotted path `job`."""
+    return import_string(job)(**kwargs)
+
+
+def call_closing(job, **kwargs):
+    """Run a job on a pool worker, closing the DB connections it opened."""
+    from django.db import connections
+
+    try:
+        return call(job, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def report(future):
+    err = future.exception()
+    if err is not None:
+        print("Upload job failed", repr(err))
+
+
+class Runner(object):
+    """The interface of a job runner."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def submit(self, job, **kwargs):
+        """Start the job, the dotted path of a function, with `kwargs` and
+        return without waiting.
+        """
+        raise NotImplementedError
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class ImmediateRunner(Runner):
+    """Run the job at once, within the caller."""
+
+    def submit(self, job, **kwargs):
+        return call(job, **kwargs)
+
+
+class PoolRunner(Runner):
+    executor_class = None
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            workers = self.options.get("workers", DEFAULT_WORKERS)
+            options = self.get_executor_options()
+            self.executor = self.executor_class(max_workers=workers, **options)
+        return self.executor
+
+    def get_executor_options(self):
+        return {}
+
+    def submit(self, job, **kwargs):
+        future = self.get_executor().submit(call_closing, job, **kwargs)
+        future.add_done_callback(report)
+        return future
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+class ThreadRunner(PoolRunner):
+    """A thread pool within the current process. Jobs are lost if the
+    process exits before they finish.
+
+    OPTIONS:
+        workers: The count of threads. Default 2.
+    """
+
+    executor_class = ThreadPoolExecutor
+
+
+class ProcessRunner(PoolRunner):
+    """A pool of worker processes, keeping large merges away from the
+    threads serving requests.
+
+    OPTIONS:
+        workers: The count of processes. Default 2.
+    """
+
+    executor_class = ProcessPoolExecutor
+
+    def get_executor_options(self):
+        import django
+
+        return {"initializer": django.setup}
+
+
+_runners = {}
+
+
+def get_runner():
+    """Return the (process cached) runner defined by `CHUNK_UPLOAD_RUNNER`."""
+    conf = getattr(settings, "CHUNK_UPLOAD_RUNNER", None) or {}
+    key = repr(sorted(conf.items()))
+    runner = _runners.get(key)
+    if runner is None:
+        runner_class = conf.get("BACKEND", DEFAULT_BACKEND)
+        if isinstance(runner_class, str):
+            runner_class = import_string(runner_class)
+        runner = runner_class(**conf.get("OPTIONS", {}))
+        _runners[key] = runner
+    return runner
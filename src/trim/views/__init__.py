@@ -1,7 +1,8 @@
 from . import errors
 from .auth import *
 from .base import *
-from .download import streamfile_response
+from .download import StreamFileView, streamfile_response, streamzip_response
 from .errors import Custom404
 from .list import OrderPaginatedListView
+from .planner import QueryPlanMixin, plan_queryset
 from .serialized import JsonDetailView, JsonListView, JSONResponseMixin, JsonView
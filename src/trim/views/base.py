@@ -32,10 +32,14 @@ Permissioned = PermissionRequiredMixin
 
 from trim import names as trim_names
 
+from .planner import QueryPlanMixin
+
 ALL = "__ALL__"
 
 
-class ShortMixin:
+class ShortMixin(QueryPlanMixin):
+    # Enabled for the generated list and detail views; see `crud`.
+    query_plan = False
 
     def get_template_names(self):
         v = super().get_template_names()
@@ -262,6 +266,10 @@ def crud(
             updateview,
             deleteview,
         )
+
+    The list and detail views load the relations of `plan_fields` (or
+    every foreign key); see `trim.views.planner`. Give `query_plan=False`
+    to keep the queryset as is.
     """
     appname, mod_first, name = extract_location(model)
 
@@ -269,11 +277,16 @@ def crud(
     base_definition.setdefault("model", model)
     success_url_d = {"success_url": reverse_lazy(lazy_url)}
     create_update_def = {"fields": "__all__", **success_url_d}
+    # Load the relations of the list and detail rows; see `trim.views.planner`.
+    plan_d = {"query_plan": base_definition.pop("query_plan", True)}
 
     parts = (
         # Order is important here.
         # ( (ShortMixin, CreateView, ), (base_definition, create_update_def), ),
-        ListView,
+        (
+            ListView,
+            plan_d,
+        ),
         (
             CreateView,
             create_update_def,
@@ -282,7 +295,10 @@ def crud(
             UpdateView,
             create_update_def,
         ),
-        DetailView,
+        (
+            DetailView,
+            plan_d,
+        ),
         (DeleteView, success_url_d),
     )
 
@@ -1,84 +1,556 @@
-import mimetypes
+import asyncio
+import fnmatch
 import os
 import re
-from wsgiref.util import FileWrapper
+import threading
+import time
+import uuid
+import zipfile
+import zlib
 
-from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.encoding import smart_str
+from django.views.generic import View
+
+from ..response import (
+    DEFAULT_CONTENT_TYPE,
+    conditional_response,
+    file_validators,
+    get_file_meta,
+    if_range_matches,
+    offload_response,
+    set_validators,
+)
 
 range_re = re.compile(r"bytes\s*=\s*(\d+)\s*-\s*(\d*)", re.I)
 
+# The read size when the server cannot send the file itself. Large blocks
+# keep the per-byte cost of the Python fallback low.
+BLOCK_SIZE = 256 * 1024
+# A Range header of more parts is ignored, and the whole file served.
+MAX_RANGES = 64
 
-def stream(request, path):
+# The content codings of precompressed siblings (`<path><suffix>`), in
+# order of preference.
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# The content types gzipped on the fly, by default.
+COMPRESSIBLE_TYPES = (
+    "text/*",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+)
+COMPRESS_LEVEL = 6
+# Smaller files are sent as is; the gzip framing outweighs the saving.
+COMPRESS_MIN_SIZE = 1024
+# The seconds a client is asked to wait when its downloads are at the limit.
+RETRY_AFTER = 10
+# The expiry of the stream counters, so a counter leaked by a crashed
+# worker is dropped.
+STREAMS_TIMEOUT = 6 * 60 * 60
+
+# The content types stored, not deflated, within a zip: compressed already.
+STORED_TYPES = (
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "image/avif",
+    "audio/*",
+    "video/*",
+    "application/zip",
+    "application/gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+)
+
+
+class RangeNotSatisfiable(Exception):
+    """No range of the Range header overlaps the file."""
+
+
+def parse_ranges(header, size, max_ranges=MAX_RANGES):
+    """Parse an RFC 7233 `Range` header for a file of `size` bytes. Return a
+    sorted list of inclusive `(first, last)` byte ranges, with overlapping
+    and adjacent ranges coalesced:
+
+        >>> parse_ranges("bytes=0-99,50-150,-100", 1000)
+        [(0, 150), (900, 999)]
+
+    Return None (serve the whole file) if the header is missing, invalid,
+    not in bytes, or has more than `max_ranges` ranges. Raise
+    `RangeNotSatisfiable` if no range overlaps the file.
     """
-    Stream a file to the client with support for HTTP range requests.
+    unit, _, specs = (header or "").partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
 
-    This function handles file streaming with support for partial content requests
-    (HTTP 206) using the Range header. It's useful for streaming large files,
-    videos, or audio where clients may request specific byte ranges.
+    specs = [x.strip() for x in specs.split(",") if x.strip()]
+    if len(specs) > max_ranges:
+        return None
 
-    Args:
-        request (HttpRequest): The Django HTTP request object containing headers
-            and metadata for the file request.
-        path (str): The filesystem path to the file that should be streamed.
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition("-")
+        first, last = first.strip(), last.strip()
+        # Digits either side, one side optional.
+        if not dash or not (first + last).isdigit():
+            return None
 
-    Returns:
-        StreamingHttpResponse: A Django streaming response object with appropriate
-            headers set for content type, length, and range information.
+        if not first:
+            # A suffix range: the final `last` bytes.
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                continue
+            ranges.append((max(0, size - suffix), size - 1))
+            continue
 
-    Raises:
-        OSError: If the file at the specified path cannot be accessed or opened.
-        FileNotFoundError: If the file at the specified path does not exist.
+        first = int(first)
+        last = int(last) if last else size - 1
+        if first >= size:
+            continue
+        if last < first:
+            return None
+        ranges.append((first, min(last, size - 1)))
 
-    Notes:
-        - Supports HTTP Range requests (RFC 7233) for partial content delivery
-        - Automatically detects content type using mimetypes
-        - Falls back to 'application/octet-stream' if content type cannot be determined
-        - Returns status 206 (Partial Content) for range requests
-        - Returns status 200 for full file requests
-        - Sets 'Accept-Ranges: bytes' to indicate range request support
+    if not ranges:
+        raise RangeNotSatisfiable(header)
 
-    Examples:
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        prev_first, prev_last = merged[-1]
+        if first <= prev_last + 1:
+            merged[-1] = (prev_first, max(prev_last, last))
+        else:
+            merged.append((first, last))
+    return merged
 
-        from django.views import View
-        class MyFileView(View):
-            def get(self, request, *args, **kwargs):
-                file_path = '/path/to/my/largefile.mp4'
-                return stream(request, file_path)
 
-    Security Warning:
-        This function does not perform any path validation or authorization checks.
-        Ensure proper validation is implemented to prevent directory traversal
-        attacks and unauthorized file access before calling this function.
+def get_compression():
+    """Return the `DOWNLOAD_COMPRESSION` setting, to negotiate the
+    `Content-Encoding` of whole (not ranged) downloads. It is off unless
+    set:
+
+        DOWNLOAD_COMPRESSION = {
+            # Serve `<file>.br` or `<file>.gz`, if present and not older.
+            "PRECOMPRESSED": True,
+            # Else gzip on the fly the files of these content types.
+            "TYPES": ["text/*", "application/json", "image/svg+xml"],
+            "LEVEL": 6,
+            "MIN_SIZE": 1024,
+        }
     """
-    range_header = request.META.get("HTTP_RANGE", "").strip()
-    range_match = range_re.match(range_header)
-    size = os.path.getsize(path)
-    content_type, encoding = mimetypes.guess_type(path)
-    content_type = content_type or "application/octet-stream"
-    if range_match:
-        first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte) if last_byte else size - 1
-        if last_byte >= size:
-            last_byte = size - 1
-        length = last_byte - first_byte + 1
-        resp = StreamingHttpResponse(
-            RangeFileWrapper(open(path, "rb"), offset=first_byte, length=length),
-            status=206,
-            content_type=content_type,
+    return getattr(settings, "DOWNLOAD_COMPRESSION", None) or {}
+
+
+def accepted_codings(header):
+    """Return a dict of the content codings of an `Accept-Encoding` header
+    and their q values:
+
+        >>> accepted_codings("gzip, br;q=0.5, *;q=0")
+        {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    """
+    res = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        res[coding] = q
+    return res
+
+
+def negotiate_encoding(header, codings):
+    """Return the coding of `codings` (in order of preference) the
+    `Accept-Encoding` header wants most, or None for the identity.
+    """
+    accepted = accepted_codings(header)
+    best, best_q = None, 0
+    for coding in codings:
+        q = accepted.get(coding, accepted.get("*", 0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def match_type(content_type, types):
+    """Return True if the `content_type` matches a pattern of `types`,
+    such as `"text/*"`.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return any(fnmatch.fnmatchcase(content_type, x.lower()) for x in types)
+
+
+def is_compressible(content_type, types=COMPRESSIBLE_TYPES):
+    return match_type(content_type, types)
+
+
+def precompressed_siblings(path, stat_result):
+    """Return a dict of `coding: (path, stat_result)` of the precompressed
+    siblings of the file at `path`, skipping those older than the file.
+    """
+    res = {}
+    for coding, suffix in PRECOMPRESSED:
+        sibling = f"{os.fspath(path)}{suffix}"
+        try:
+            st = os.stat(sibling)
+        except OSError:
+            continue
+        if st.st_mtime_ns >= stat_result.st_mtime_ns:
+            res[coding] = (sibling, st)
+    return res
+
+
+def encoded_response(
+    path, stat_result, content_type, request, chunk_size=None, conf=None
+):
+    """Return a response of the file at `path` in the content coding the
+    `Accept-Encoding` of the `request` prefers: a precompressed sibling,
+    or gzip on the fly for a compressible `content_type`. Return None to
+    send the file as is.
+
+    Each coding has its own `ETag`, and answers conditional requests.
+    Raise `TooManyStreams` if the `DOWNLOAD_LIMITS` refuse the download.
+    """
+    conf = get_compression() if conf is None else conf
+    header = request.META.get("HTTP_ACCEPT_ENCODING") if request else None
+    if not conf or not header:
+        return None
+
+    if conf.get("PRECOMPRESSED", True):
+        siblings = precompressed_siblings(path, stat_result)
+        coding = negotiate_encoding(
+            header, [x for x, _ in PRECOMPRESSED if x in siblings]
         )
-        resp["Content-Length"] = str(length)
-        resp["Content-Range"] = "bytes %s-%s/%s" % (first_byte, last_byte, size)
-    else:
-        resp = StreamingHttpResponse(
-            FileWrapper(open(path, "rb")), content_type=content_type
+        if coding is not None:
+            sibling, st = siblings[coding]
+            etag, last_modified = file_validators(sibling, st)
+            resp = conditional_response(request, etag, last_modified)
+            if resp is None:
+                resp = limited_response(
+                    request,
+                    lambda: file_stream_response(
+                        RangeFileWrapper(
+                            open_file(sibling), chunk_size, length=st.st_size
+                        ),
+                        content_type=content_type,
+                    ),
+                )
+                resp["Content-Encoding"] = coding
+                set_validators(resp, etag, last_modified)
+            return resp
+
+    types = conf.get("TYPES", COMPRESSIBLE_TYPES)
+    if (
+        stat_result.st_size < conf.get("MIN_SIZE", COMPRESS_MIN_SIZE)
+        or not is_compressible(content_type, types)
+        or negotiate_encoding(header, ["gzip"]) is None
+    ):
+        return None
+
+    etag, last_modified = file_validators(path, stat_result)
+    # A weak ETag of its own: the bytes depend on the zlib build.
+    etag = f'W/{etag[:-1]}-gzip"'
+    resp = conditional_response(request, etag, last_modified)
+    if resp is None:
+        level = conf.get("LEVEL", COMPRESS_LEVEL)
+        resp = limited_response(
+            request,
+            lambda: StreamingHttpResponse(
+                GzipFileWrapper(open_file(path), chunk_size, level),
+                content_type=content_type,
+            ),
         )
-        resp["Content-Length"] = str(size)
-    resp["Accept-Ranges"] = "bytes"
+        resp["Content-Encoding"] = "gzip"
+        set_validators(resp, etag, last_modified)
     return resp
 
 
+def get_limits():
+    """Return the `DOWNLOAD_LIMITS` setting, to share the uplink between
+    downloads and page traffic. Every key is optional:
+
+        DOWNLOAD_LIMITS = {
+            # Bytes a second of each download, and its burst.
+            "RATE": 1024 * 1024,
+            "BURST": 256 * 1024,
+            # Bytes a second of every download within the process.
+            "GLOBAL_RATE": 20 * 1024 * 1024,
+            # Concurrent downloads of one user (or address), and of all.
+            "USER_STREAMS": 2,
+            "TOTAL_STREAMS": 50,
+            # The cache counting the streams, shared by every worker.
+            "CACHE": "default",
+        }
+    """
+    return getattr(settings, "DOWNLOAD_LIMITS", None) or {}
+
+
+class TokenBucket(object):
+    """Allow `rate` bytes a second, in bursts of up to `burst` bytes (default
+    one second of the rate). A bucket may be shared between threads; the
+    debt of one consumer delays the next.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def take(self, amount):
+        """Take `amount` tokens, and return the seconds until they are
+        earned, without sleeping.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, amount):
+        """Take `amount` tokens, sleeping until they are earned. Return the
+        seconds slept.
+        """
+        wait = self.take(amount)
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+_global_buckets = {}
+
+
+def get_global_bucket(conf):
+    """Return the (process cached) bucket of the `GLOBAL_RATE`, or None."""
+    rate = conf.get("GLOBAL_RATE")
+    if not rate:
+        return None
+    bucket = _global_buckets.get(rate)
+    if bucket is None:
+        bucket = _global_buckets.setdefault(rate, TokenBucket(rate))
+    return bucket
+
+
+class StreamSlots(object):
+    """Counters of the concurrent downloads in a Django cache, so every
+    worker sees them.
+    """
+
+    def __init__(self, cache, timeout=STREAMS_TIMEOUT, prefix="trim-download:"):
+        self.cache = cache
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def acquire(self, name, limit):
+        """Count a stream against `name`, and return True if it is within
+        the `limit`.
+        """
+        key = self.prefix + name
+        self.cache.add(key, 0, self.timeout)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Expired since the add.
+            self.cache.add(key, 1, self.timeout)
+            count = 1
+        if count > limit:
+            self.release(name)
+            return False
+        return True
+
+    def release(self, name):
+        try:
+            self.cache.decr(self.prefix + name)
+        except ValueError:
+            pass
+
+
+def stream_owner(request):
+    """Return the name counting the downloads of the `request`: the user,
+    or the address of an anonymous client.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
+
+
+class TooManyStreams(Exception):
+    """The user, or the server, has as many downloads as allowed."""
+
+
+def take_streams(request, conf):
+    """Take a slot of the `USER_STREAMS` and `TOTAL_STREAMS` limits for the
+    `request`, and return a function releasing the slots taken. Raise
+    `TooManyStreams` if a limit is reached.
+    """
+    slots = StreamSlots(caches[conf.get("CACHE", "default")])
+    limits = []
+    if conf.get("USER_STREAMS") and request is not None:
+        limits.append((stream_owner(request), conf["USER_STREAMS"]))
+    if conf.get("TOTAL_STREAMS"):
+        limits.append(("all", conf["TOTAL_STREAMS"]))
+
+    taken = []
+
+    def release():
+        while taken:
+            slots.release(taken.pop())
+
+    for name, limit in limits:
+        if not slots.acquire(name, limit):
+            release()
+            raise TooManyStreams(name)
+        taken.append(name)
+    return release
+
+
+def too_many_streams(conf=None):
+    conf = get_limits() if conf is None else conf
+    response = HttpResponse(status=429)
+    response["Retry-After"] = str(conf.get("RETRY_AFTER", RETRY_AFTER))
+    return response
+
+
+def limited_response(request, build, conf=None):
+    """Return the streaming response of `build()` within the
+    `DOWNLOAD_LIMITS`. The stream slots of the `request` are taken before
+    `build` opens a file, and released when the body ends; the body is
+    paced by the token buckets. Raise `TooManyStreams` if a limit is
+    reached.
+
+    A paced response is not offered to `wsgi.file_wrapper`, as a `sendfile`
+    would skip the pacing.
+    """
+    conf = get_limits() if conf is None else conf
+    if not conf:
+        return build()
+
+    release = take_streams(request, conf)
+    try:
+        response = build()
+    except BaseException:
+        release()
+        raise
+
+    buckets = [get_global_bucket(conf)]
+    if conf.get("RATE"):
+        buckets.append(TokenBucket(conf["RATE"], conf.get("BURST")))
+    buckets = [x for x in buckets if x is not None]
+    if buckets:
+        response.file_to_stream = None
+    limited = LimitedStream(response.streaming_content, buckets, release)
+    response.streaming_content = limited
+    # Kept for `async_response`, which paces without a thread.
+    response.limited_stream = limited
+    return response
+
+
+class LimitedStream(object):
+    """Iterate the body `content`, pacing each block by the token `buckets`,
+    and call `release` once, when the body ends or is closed.
+    """
+
+    def __init__(self, content, buckets=(), release=None):
+        self.content = content
+        self.buckets = buckets
+        self.release = release
+        # Blocks are split to the smallest burst, so no pause is long.
+        self.slice_size = min((int(x.capacity) for x in buckets), default=None)
+
+    def close(self):
+        release, self.release = self.release, None
+        if release is not None:
+            release()
+
+    def slices(self, data):
+        view = memoryview(data)
+        step = max(1, self.slice_size)
+        for start in range(0, len(view), step):
+            yield view[start : start + step]
+
+    def __iter__(self):
+        try:
+            for data in self.content:
+                if not self.buckets:
+                    yield data
+                    continue
+                for piece in self.slices(data):
+                    for bucket in self.buckets:
+                        bucket.consume(len(piece))
+                    yield bytes(piece)
+        finally:
+            self.close()
+
+    async def aiter(self):
+        """Iterate the body as an async iterator. The blocks are read on the
+        executor (see `aiter_content`), and the pauses are awaited on the
+        event loop, so no thread is held while the body is paced.
+        """
+        try:
+            async for data in aiter_content(self.content):
+                if not self.buckets:
+                    yield data
+                    continue
+                for piece in self.slices(data):
+                    for bucket in self.buckets:
+                        wait = bucket.take(len(piece))
+                        if wait:
+                            await asyncio.sleep(wait)
+                    yield bytes(piece)
+        finally:
+            self.close()
+
+
+def open_file(path):
+    """Open `path` for streaming. The file is unbuffered, as whole blocks
+    are read at once, and the file position is then exact for `sendfile`.
+    """
+    return open(path, "rb", buffering=0)
+
+
+def file_stream_response(wrapper, **kwargs):
+    """Return a `StreamingHttpResponse` of the `RangeFileWrapper`.
+
+    Under WSGI the file is offered to the server (`wsgi.file_wrapper`), so a
+    server such as gunicorn may `sendfile` it: `Content-Length` bytes from
+    the wrapper offset. Otherwise the wrapper is iterated in `chunk_size`
+    blocks.
+    """
+    response = StreamingHttpResponse(wrapper, **kwargs)
+    response.file_to_stream = wrapper
+    response.block_size = wrapper.chunk_size
+    if wrapper.length is not None:
+        response["Content-Length"] = str(wrapper.length)
+    return response
+
+
 def stream(request, path):
     """
     Stream a file to the client with support for HTTP range requests.
@@ -101,13 +573,17 @@ def stream(request, path):
         FileNotFoundError: If the file at the specified path does not exist.
 
     Notes:
-        - Supports HTTP Range requests (RFC 7233) for partial content delivery
-        - Automatically detects content type using mimetypes
+        - Supports HTTP Range requests (RFC 7233) for partial content delivery,
+          including suffix ranges and several ranges (`multipart/byteranges`)
+        - Returns status 416 if no requested range overlaps the file
+        - Automatically detects content type using mimetypes (or python-magic),
+          once per file version, with the shared `get_file_meta` cache
         - Falls back to 'application/octet-stream' if content type cannot be determined
         - Returns status 206 (Partial Content) for range requests
         - Returns status 200 for full file requests
         - Sets 'Accept-Ranges: bytes' to indicate range request support
-        - Content-Length headers are intentionally omitted in this version
+        - The file is offered to `wsgi.file_wrapper`, for a `sendfile` of
+          the full file or range
 
     Examples:
 
@@ -122,40 +598,152 @@ def stream(request, path):
         Ensure proper validation is implemented to prevent directory traversal
         attacks and unauthorized file access before calling this function.
     """
-    range_header = request.META.get("HTTP_RANGE", "").strip()
-    range_match = range_re.match(range_header)
-    size = os.path.getsize(path)
-    content_type, encoding = mimetypes.guess_type(path)
-    content_type = content_type or "application/octet-stream"
-    if range_match:
-        first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte) if last_byte else size - 1
-        if last_byte >= size:
-            last_byte = size - 1
+    return range_response(path, request.META.get("HTTP_RANGE"), request=request)
+
+
+def range_response(
+    path, range_header=None, content_type=None, chunk_size=None, request=None
+):
+    """Return a response of the file at `path` for the `Range` header:
+
+    + 200 and the whole file, without a (usable) Range header
+    + 206 and the one range requested
+    + 206 and a `multipart/byteranges` body of several ranges
+    + 416 if no range overlaps the file
+
+    Responses carry a strong `ETag` and `Last-Modified`. Given the
+    `request`, a 304 is returned for a current `If-None-Match` or
+    `If-Modified-Since`, and a stale `If-Range` drops the range.
+
+    With `DOWNLOAD_OFFLOAD` (see `trim.response.get_offload`) the response
+    is empty, and the front server sends the file and handles the range.
+
+    With `DOWNLOAD_COMPRESSION` (see `get_compression`) a request without a
+    Range may receive a precompressed sibling, or gzip on the fly.
+
+    With `DOWNLOAD_LIMITS` (see `get_limits`) the body is paced, and a 429
+    is returned to a user at the limit of concurrent downloads.
+    """
+    meta = get_file_meta(path)
+    content_type = content_type or meta.content_type or DEFAULT_CONTENT_TYPE
+    offloaded = offload_response(path, content_type)
+    if offloaded is not None:
+        return offloaded
+
+    stat_result = meta.stat_result
+    size = meta.size
+    compression = get_compression()
+    if compression and not range_header:
+        # Ranges are of the identity; never compressed.
+        try:
+            encoded = encoded_response(
+                path, stat_result, content_type, request, chunk_size, compression
+            )
+        except TooManyStreams:
+            return too_many_streams()
+        if encoded is not None:
+            patch_vary_headers(encoded, ("Accept-Encoding",))
+            return encoded
+
+    etag, last_modified = meta.etag, meta.last_modified
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        not_modified["Accept-Ranges"] = "bytes"
+        if compression:
+            patch_vary_headers(not_modified, ("Accept-Encoding",))
+        return not_modified
+
+    if range_header and not if_range_matches(request, etag, last_modified):
+        range_header = None
+
+    try:
+        ranges = parse_ranges(range_header, size)
+    except RangeNotSatisfiable:
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = "bytes */%s" % size
+        resp["Accept-Ranges"] = "bytes"
+        return resp
+
+    try:
+        resp = limited_response(
+            request,
+            lambda: ranges_body_response(path, ranges, size, content_type, chunk_size),
+        )
+    except TooManyStreams:
+        return too_many_streams()
+    resp["Accept-Ranges"] = "bytes"
+    set_validators(resp, etag, last_modified)
+    if compression:
+        patch_vary_headers(resp, ("Accept-Encoding",))
+    return resp
+
+
+def ranges_body_response(path, ranges, size, content_type, chunk_size=None):
+    """Return the streaming response of the `ranges` (of `parse_ranges`) of
+    the file at `path`: the whole file for None, 206 for one range, and a
+    `multipart/byteranges` body for several.
+    """
+    if ranges is None:
+        return file_stream_response(
+            RangeFileWrapper(open_file(path), chunk_size, length=size),
+            content_type=content_type,
+        )
+
+    if len(ranges) == 1:
+        first_byte, last_byte = ranges[0]
         length = last_byte - first_byte + 1
-        resp = StreamingHttpResponse(
-            RangeFileWrapper(open(path, "rb"), offset=first_byte, length=length),
+        resp = file_stream_response(
+            RangeFileWrapper(
+                open_file(path), chunk_size, offset=first_byte, length=length
+            ),
             status=206,
             content_type=content_type,
         )
-        # resp['Content-Length'] = str(length)
         resp["Content-Range"] = "bytes %s-%s/%s" % (first_byte, last_byte, size)
-    else:
-        resp = StreamingHttpResponse(
-            FileWrapper(open(path, "rb")), content_type=content_type
-        )
-        # resp['Content-Length'] = str(size)
-    resp["Accept-Ranges"] = "bytes"
+        return resp
+
+    wrapper = ByteRangesWrapper(open_file(path), ranges, size, content_type, chunk_size)
+    resp = StreamingHttpResponse(
+        wrapper,
+        status=206,
+        content_type=f"multipart/byteranges; boundary={wrapper.boundary}",
+    )
+    resp["Content-Length"] = str(wrapper.length)
     return resp
 
 
 class RangeFileWrapper(object):
-    def __init__(self, stream, chunk_size=8192, offset=0, length=None):
+    """A file-like view of `length` bytes of the file `stream` from
+    `offset`. Iterate it for `chunk_size` blocks, or `read()` it.
+
+    `fileno()` and the stream position (set to `offset`) let a server
+    `sendfile` the range without reading it through Python.
+    """
+
+    def __init__(self, stream, chunk_size=None, offset=0, length=None):
         self.stream = stream
         self.stream.seek(offset, os.SEEK_SET)
+        self.offset = offset
+        self.length = length
         self.remaining = length
-        self.chunk_size = chunk_size
+        self.chunk_size = chunk_size or BLOCK_SIZE
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            # If remaining is None, we're reading the entire file.
+            return self.stream.read(size)
+
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size <= 0:
+            return b""
+
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
 
     def close(self):
         if hasattr(self.stream, "close"):
@@ -164,31 +752,100 @@ class RangeFileWrapper(object):
     def __iter__(self):
         return self
 
-    def next(self):
-        if self.remaining is None:
-            # If remaining is None, we're reading the entire file.
-            data = self.stream.read(self.chunk_size)
-            if data:
-                return data
+    def __next__(self):
+        data = self.read(self.chunk_size)
+        if not data:
             raise StopIteration()
+        return data
 
-        if self.remaining <= 0:
-            raise StopIteration()
+    next = __next__
 
-        data = self.stream.read(min(self.remaining, self.chunk_size))
-        if not data:
-            raise StopIteration()
 
-        self.remaining -= len(data)
-        return data
+class ByteRangesWrapper(object):
+    """Iterate a `multipart/byteranges` body of several `ranges` of the file
+    `stream`, reading each range lazily in `chunk_size` blocks. `length` is
+    the exact size of the body.
+    """
+
+    def __init__(self, stream, ranges, size, content_type, chunk_size=None):
+        self.stream = stream
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.chunk_size = chunk_size or BLOCK_SIZE
+        self.boundary = uuid.uuid4().hex
+        self.length = sum(len(self.part_head(i)) for i in range(len(ranges)))
+        self.length += sum(last - first + 1 for first, last in ranges)
+        self.length += len(self.tail())
+
+    def part_head(self, index):
+        first, last = self.ranges[index]
+        head = (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Range: bytes {first}-{last}/{self.size}\r\n\r\n"
+        )
+        if index > 0:
+            head = f"\r\n{head}"
+        return head.encode("latin-1")
+
+    def tail(self):
+        return f"\r\n--{self.boundary}--\r\n".encode("latin-1")
+
+    def close(self):
+        self.stream.close()
+
+    def __iter__(self):
+        try:
+            for index, (first, last) in enumerate(self.ranges):
+                yield self.part_head(index)
+                self.stream.seek(first, os.SEEK_SET)
+                remaining = last - first + 1
+                while remaining > 0:
+                    data = self.stream.read(min(self.chunk_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            yield self.tail()
+        finally:
+            self.close()
+
+
+class GzipFileWrapper(object):
+    """Iterate the gzip compression of the file `stream`, read in
+    `chunk_size` blocks. The length is unknown until the end, so the
+    response is chunked.
+    """
+
+    def __init__(self, stream, chunk_size=None, level=COMPRESS_LEVEL):
+        self.stream = stream
+        self.chunk_size = chunk_size or BLOCK_SIZE
+        self.level = level
+
+    def close(self):
+        self.stream.close()
+
+    def __iter__(self):
+        # wbits 31: a gzip header and trailer.
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        try:
+            for block in iter(lambda: self.stream.read(self.chunk_size), b""):
+                data = compressor.compress(block)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            self.close()
 
 
 def streamfile_response(
     real_filepath,
     output_filename,
-    chunk_size=8192,
+    chunk_size=None,
     content_type=None,
     range_header=None,
+    request=None,
 ):
     """Generate a StreamingHttpResponse for the given `real_filepath`. Return
     directly to the client as the response object, e.g: from `get()`.
@@ -197,58 +854,221 @@ def streamfile_response(
 
     Elements applied:
 
-    + A wsgi FileWrapper
+    + A `RangeFileWrapper`, offered to the server for `sendfile`
     + Auto content_type
     + StreamingHttpResponse response object
     + Content-Length
+    + Single, multiple (`multipart/byteranges`) and 416 ranges of the
+      `range_header` (default, the Range of the `request`)
+    + ETag and Last-Modified, with 304 responses given the `request`
     + Content-Disposition
-    + X-Sendfile
-    """
-    filename = os.path.basename(real_filepath)
-    size = os.path.getsize(real_filepath)
-    handle = open(real_filepath, "rb")
-    # if ranges was given, seek the handle up to the point.
-    wrapper = FileWrapper(handle, chunk_size)
-    content_type = content_type or mimetypes.guess_type(real_filepath)[0]
+    + X-Accel-Redirect or X-Sendfile, with the `DOWNLOAD_OFFLOAD` setting
+    + Content-Encoding of `.br`/`.gz` siblings or gzip, with the
+      `DOWNLOAD_COMPRESSION` setting and the `request`
+    + Bandwidth and concurrent download limits, with the `DOWNLOAD_LIMITS`
+      setting
+    """
     safe_filename = smart_str(output_filename)
+    if range_header is None and request is not None:
+        range_header = request.META.get("HTTP_RANGE")
+    response = range_response(
+        real_filepath, range_header, content_type, chunk_size, request=request
+    )
+    if response.status_code in (304, 412, 416, 429):
+        return response
 
     # You can also set any other required headers: Cache-Control, etc.
-    response_pv = {
-        # for bytes ranging partial downloads
-        "Accept-Ranges": "bytes",
-        "Content-Disposition": f"attachment; filename={safe_filename}",
-        "X-Sendfile": smart_str(real_filepath),
-    }
-
-    status_ref = {}
-    # range_header = request.META.get('HTTP_RANGE', '').strip()
-    range_match = range_re.match(range_header or "")
-    if range_match:
-        status_ref = {
-            "status": 206,
-        }
+    response["Content-Disposition"] = f"attachment; filename={safe_filename}"
+    return response
 
-        first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte) if last_byte else size - 1
-        if last_byte >= size:
-            last_byte = size - 1
-        length = last_byte - first_byte + 1
-        response_pv["Content-Range"] = "bytes %s-%s/%s" % (first_byte, last_byte, size)
 
-        size = length
-        wrapper = RangeFileWrapper(handle, offset=first_byte, length=length)
+class ZipStreamBuffer(object):
+    """An unseekable file collecting the bytes a `ZipFile` writes, until
+    they are taken. Unseekable, the `ZipFile` follows each entry with a
+    data descriptor, rather than seeking back to its header.
+    """
 
-    # response = HttpResponse(mimetype='application/force-download')
-    response = StreamingHttpResponse(
-        wrapper,
-        **status_ref,
-        content_type=content_type,
-        # mimetype='application/force-download',
-    )
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def zip_entries(paths):
+    """Return a `ZipInfo` for each file of `paths`: a path (stored by its
+    name) or a `(path, arcname)` pair. Files are stat-ed now, so a missing
+    file raises before the response starts.
+    """
+    res = []
+    for item in paths:
+        path, arcname = item if isinstance(item, (tuple, list)) else (item, None)
+        path = os.fspath(path)
+        info = zipfile.ZipInfo.from_file(path, arcname or os.path.basename(path))
+        if match_type(get_file_meta(path).content_type, STORED_TYPES):
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        res.append((path, info))
+    return res
+
+
+def iter_zip(entries, chunk_size=None):
+    """Yield a ZIP64 archive of the `(path, ZipInfo)` entries as it is
+    written. Each file is read in `chunk_size` blocks, and deflated (or
+    stored) with its CRC computed on the fly, so memory holds about one
+    block whatever the size of the archive.
+    """
+    chunk_size = chunk_size or BLOCK_SIZE
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for path, info in entries:
+            with open_file(path) as source:
+                with archive.open(info, "w", force_zip64=True) as dest:
+                    for block in iter(lambda: source.read(chunk_size), b""):
+                        dest.write(block)
+                        data = buffer.take()
+                        if data:
+                            yield data
+            # The rest of the entry, and its data descriptor.
+            data = buffer.take()
+            if data:
+                yield data
+    # The central directory.
+    yield buffer.take()
 
-    response["Content-Length"] = str(size)
 
-    for k, v in response_pv.items():
-        response[k] = v
+def streamzip_response(paths, output_filename, chunk_size=None, request=None):
+    """Generate a StreamingHttpResponse of a zip archive of the files of
+    `paths`, written while the client reads it; no archive is built on
+    disk. Each item is a path, or a `(path, arcname)` pair:
+
+        response = streamzip_response(
+            ['/real/a.mp4', ('/real/b.txt', 'notes/b.txt')], 'bundle.zip'
+        )
+
+    Compressed media (`STORED_TYPES`) is stored as is, other files are
+    deflated. The archive is ZIP64, so has no limit of 4 GiB. Its length is
+    not known ahead, so the response has no Content-Length.
+
+    The `DOWNLOAD_LIMITS` apply, counting the streams of the `request`.
+    """
+    entries = zip_entries(paths)
+    try:
+        response = limited_response(
+            request,
+            lambda: StreamingHttpResponse(
+                iter_zip(entries, chunk_size), content_type="application/zip"
+            ),
+        )
+    except TooManyStreams:
+        return too_many_streams()
+    safe_filename = smart_str(output_filename)
+    response["Content-Disposition"] = f"attachment; filename={safe_filename}"
     return response
+
+
+async def aiter_content(content):
+    """Iterate the sync body `content` as an async iterator. Each block is
+    read on the default executor of the event loop, rather than the single
+    thread of `sync_to_async`, so a long download holds neither the loop
+    nor the thread of sync views.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(content)
+    end = object()
+    while True:
+        data = await loop.run_in_executor(None, next, iterator, end)
+        if data is end:
+            break
+        yield data
+
+
+def async_response(response):
+    """Give the streaming `response` an async body, for an ASGI server to
+    send without adapting a sync iterator (and warning). A paced body (see
+    `limited_response`) awaits its pauses. The response is returned; the
+    body closes with it.
+    """
+    if response.streaming and not response.is_async:
+        limited = getattr(response, "limited_stream", None)
+        if limited is not None:
+            response.streaming_content = limited.aiter()
+        else:
+            response.streaming_content = aiter_content(response.streaming_content)
+    return response
+
+
+def is_async_request(request):
+    return isinstance(request, ASGIRequest)
+
+
+async def astream(request, path):
+    """The async `stream`: the response is built on a worker thread, and
+    the body is an async iterator.
+    """
+    response = await sync_to_async(stream, thread_sensitive=False)(request, path)
+    return async_response(response)
+
+
+async def astreamfile_response(real_filepath, output_filename, **kwargs):
+    """The async `streamfile_response`, for async views."""
+    func = sync_to_async(streamfile_response, thread_sensitive=False)
+    response = await func(real_filepath, output_filename, **kwargs)
+    return async_response(response)
+
+
+class StreamFileView(View):
+    """Download the file of `get_path()`, with ranges, validators and the
+    download settings of `streamfile_response`.
+
+        class ReportView(StreamFileView):
+            def get_path(self):
+                return reports_dir / f"{self.kwargs['pk']}.pdf"
+
+    Under ASGI the body is an async iterator (see `async_response`), so the
+    sync thread is only held while the response is prepared. Under WSGI the
+    file is offered to the server for `sendfile`.
+    """
+
+    # Set False to serve inline (no Content-Disposition).
+    attachment = True
+    chunk_size = None
+    content_type = None
+
+    def get_path(self):
+        raise ImproperlyConfigured(f"{self.__class__.__name__} is missing get_path()")
+
+    def get_filename(self, path):
+        return os.path.basename(path)
+
+    def get(self, request, *args, **kwargs):
+        path = os.fspath(self.get_path())
+        if self.attachment:
+            response = streamfile_response(
+                path,
+                self.get_filename(path),
+                self.chunk_size,
+                self.content_type,
+                request=request,
+            )
+        else:
+            response = range_response(
+                path,
+                request.META.get("HTTP_RANGE"),
+                self.content_type,
+                self.chunk_size,
+                request=request,
+            )
+        if is_async_request(request):
+            response = async_response(response)
+        return response
@@ -0,0 +1,140 @@
+"""Cache the JSON bodies of serialized views, keyed by generation tokens.
+
+A cached body is keyed by the view, its model label, the object pk, the
+fields and the querystring, and the current token of each model it reads.
+A change of a row (`post_save`, `post_delete` or `m2m_changed`) replaces the
+tokens of its model, so older keys are never read again and expire with
+their timeout. Nothing is deleted, and no key is scanned.
+
+Each model has three kinds of token:
+
++ `<label>`: replaced on every change; read by list responses.
++ `<label>:<pk>`: replaced on a change of the row; read by detail
+  responses.
++ `<label>:*`: replaced when the changed rows are unknown (such as a
+  many-to-many clear); read by detail responses.
+
+The signal receivers are connected when a caching view names the model.
+Changes signals don't see, such as `QuerySet.update()`, or a process that
+never imports the view, should call `invalidate(model)`.
+
+    JSON_RESPONSE_CACHE = {
+        "CACHE": "default",
+        "TIMEOUT": 300,
+    }
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+DEFAULT_TIMEOUT = 300
+KEY_PREFIX = "trim-json:"
+
+# The cache aliases of each watched model.
+_watched = {}
+
+
+def get_conf():
+    """Return the `JSON_RESPONSE_CACHE` settings, with defaults."""
+    conf = getattr(settings, "JSON_RESPONSE_CACHE", None) or {}
+    return {"CACHE": "default", "TIMEOUT": DEFAULT_TIMEOUT, **conf}
+
+
+def token_key(model, pk=None):
+    key = f"{KEY_PREFIX}token:{model._meta.label_lower}"
+    return key if pk is None else f"{key}:{pk}"
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def get_tokens(cache, keys):
+    """Return the tokens of the `keys`, in order. A missing token (never
+    set, or evicted) is replaced with a new one.
+    """
+    found = cache.get_many(keys)
+    return [found.get(key) or cache.get_or_set(key, new_token, None) for key in keys]
+
+
+def response_key(parts):
+    """Return the cache key of a response, from the `parts` naming it."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"{KEY_PREFIX}response:{digest}"
+
+
+def payload_etag(content):
+    """Return the strong `ETag` of the response body `content`."""
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def invalidate(model, pks=None, alias=None):
+    """Replace the tokens of the `model`, and of the rows of `pks` (every
+    row if None), in the cache of `alias`, or every cache the model is
+    watched in.
+    """
+    aliases = [alias] if alias else _watched.get(model) or [get_conf()["CACHE"]]
+    keys = [token_key(model)]
+    if pks is None:
+        keys.append(token_key(model, "*"))
+    else:
+        keys.extend(token_key(model, pk) for pk in pks)
+    for name in aliases:
+        caches[name].set_many({key: new_token() for key in keys}, None)
+
+
+def on_change(sender, instance, **kwargs):
+    invalidate(sender, [instance.pk])
+
+
+def on_m2m_change(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if type(instance) in _watched:
+        invalidate(type(instance), [instance.pk])
+    if model in _watched:
+        invalidate(model, pk_set or None)
+
+
+def through_models(model):
+    """Return the through models of the many-to-many relations of the
+    `model`, either side.
+    """
+    res = []
+    for field in model._meta.get_fields():
+        if field.many_to_many:
+            through = getattr(field, "through", None) or field.remote_field.through
+            res.append(through)
+    return res
+
+
+def watch(model, alias):
+    """Invalidate the cached responses of the `model` in the cache of
+    `alias` as its rows change.
+    """
+    aliases = _watched.setdefault(model, set())
+    if alias in aliases:
+        return
+    aliases.add(alias)
+    uid = f"trim.views.json_cache:{model._meta.label_lower}"
+    post_save.connect(on_change, sender=model, dispatch_uid=uid)
+    post_delete.connect(on_change, sender=model, dispatch_uid=uid)
+    for through in through_models(model):
+        # One receiver of each through model, for the models either side.
+        m2m_changed.connect(
+            on_m2m_change, sender=through, dispatch_uid="trim.views.json_cache"
+        )
+
+
+def watch_models(models, alias=None):
+    """Watch each of the `models` (None is skipped) in the cache of `alias`,
+    or the `JSON_RESPONSE_CACHE` cache.
+    """
+    alias = alias or get_conf()["CACHE"]
+    for model in models:
+        if model is not None:
+            watch(model, alias)
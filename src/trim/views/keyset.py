@@ -0,0 +1,237 @@
+"""Keyset (cursor) pagination.
+
+A page is found by the ordering keys of the row before it, rather than an
+OFFSET, so the database reads an index range from the row, and page 5,000
+costs the same as page 1. No `COUNT(*)` is run.
+
+The cursor is the keys of the last (or first) row of a page, signed with
+the `SECRET_KEY`. It is opaque to the client, and a tampered cursor, or one
+of another ordering, is refused.
+
+Keys are compared as values, so the ordering fields should not be NULL.
+The primary key is appended to the ordering, so rows of equal keys keep a
+stable order.
+"""
+
+import datetime
+
+from django.core import signing
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, Q
+from django.http import Http404
+
+CURSOR_SALT = "trim.views.keyset"
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Encode the dates, Decimals and UUIDs of keys. Times keep their
+    microseconds, so a key compares equal to its row.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorSerializer(signing.JSONSerializer):
+    def dumps(self, obj):
+        return CursorEncoder(separators=(",", ":")).encode(obj).encode("latin-1")
+
+
+def get_key_value(obj, name):
+    """Return the value of the ordering key `name` (such as `"pk"` or
+    `"product__name"`) of the model instance `obj`.
+    """
+    value = obj
+    for part in name.split("__"):
+        value = getattr(value, part)
+    if isinstance(value, Model):
+        value = value.pk
+    return value
+
+
+class KeysetPage(object):
+    """A page of rows, and the cursors of the pages either side.
+
+    Pages are not numbered: `number`, the page numbers either side and the
+    `num_pages` of the paginator are None, so the numbered page templates
+    render no links. The `trim/page-buttons.html` and
+    `trim/paginate-buttons.html` templates link the cursors instead.
+    """
+
+    # Read by the templates to link cursors, rather than page numbers.
+    keyset = True
+    number = None
+    # The GET parameter of the cursor; set by `KeysetPaginationMixin`.
+    cursor_field = "cursor"
+
+    def __init__(
+        self, object_list, next_cursor=None, previous_cursor=None, paginator=None
+    ):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return None
+
+    def previous_page_number(self):
+        return None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self)}>"
+
+
+class KeysetPaginator(object):
+    """Page the `queryset` by the `ordering` (field names, `-` for
+    descending), `per_page` rows at a time:
+
+        paginator = KeysetPaginator(Product.objects.all(), 50, ["-price"])
+        page = paginator.page(request.GET.get("cursor"))
+        page.object_list, page.next_cursor, page.previous_cursor
+    """
+
+    # Keyset pages are not counted or numbered.
+    count = None
+    num_pages = None
+    page_range = ()
+
+    def __init__(self, queryset, per_page, ordering, salt=CURSOR_SALT):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = self.get_ordering(ordering)
+        self.salt = salt
+
+    def get_ordering(self, ordering):
+        if isinstance(ordering, str):
+            ordering = [x.strip() for x in ordering.split(",") if x.strip()]
+        ordering = list(ordering or ())
+        pk_name = self.queryset.model._meta.pk.attname
+        names = {x.lstrip("-") for x in ordering}
+        if not names & {"pk", pk_name}:
+            ordering.append("pk")
+        return ordering
+
+    @property
+    def keys(self):
+        """The `(name, descending)` of each ordering key."""
+        return [(x.lstrip("-"), x.startswith("-")) for x in self.ordering]
+
+    def encode_cursor(self, obj, forward=True):
+        values = [get_key_value(obj, name) for name, _ in self.keys]
+        payload = {"o": self.ordering, "v": values, "d": "n" if forward else "p"}
+        return signing.dumps(
+            payload, salt=self.salt, serializer=CursorSerializer, compress=True
+        )
+
+    def decode_cursor(self, cursor):
+        """Return the `(values, forward)` of the `cursor`. Raise
+        `InvalidCursor` if it is tampered, or of another ordering.
+        """
+        try:
+            payload = signing.loads(cursor, salt=self.salt, serializer=CursorSerializer)
+        except signing.BadSignature:
+            raise InvalidCursor("Invalid cursor")
+        if payload.get("o") != self.ordering or len(payload.get("v", ())) != len(
+            self.ordering
+        ):
+            raise InvalidCursor("The cursor is of another ordering")
+        return payload["v"], payload.get("d") != "p"
+
+    def keyset_q(self, values, forward=True):
+        """Return the `Q` of the rows after (or before) the row of the key
+        `values`: `(a > x) OR (a = x AND b > y) ...`, with `<` for
+        descending keys.
+        """
+        q = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            lookup = "lt" if descending == forward else "gt"
+            q |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return q
+
+    def page(self, cursor=None):
+        """Return the `KeysetPage` of the `cursor`; the first page if None.
+        One query is run, of `per_page + 1` rows.
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        if not cursor:
+            rows = list(queryset[: self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            return self.make_page(rows, has_next=more, has_previous=False)
+
+        values, forward = self.decode_cursor(cursor)
+        if forward:
+            rows = list(queryset.filter(self.keyset_q(values))[: self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            return self.make_page(rows, has_next=more, has_previous=True)
+
+        reverse = [x[1:] if x.startswith("-") else f"-{x}" for x in self.ordering]
+        queryset = self.queryset.order_by(*reverse)
+        rows = list(queryset.filter(self.keyset_q(values, False))[: self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page][::-1]
+        return self.make_page(rows, has_next=True, has_previous=more)
+
+    def make_page(self, rows, has_next, has_previous):
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], forward=False)
+        return KeysetPage(rows, next_cursor, previous_cursor, paginator=self)
+
+
+class KeysetPaginationMixin(object):
+    """Page a list view by keyset, with the cursor of the `cursor_field`
+    GET parameter.
+    """
+
+    keyset_pagination = False
+    cursor_field = "cursor"
+    keyset_paginator_class = KeysetPaginator
+
+    def get_keyset_ordering(self):
+        return self.get_ordering()
+
+    def get_cursor(self):
+        return self.request.GET.get(self.cursor_field) or None
+
+    def paginate_keyset(self, queryset, page_size):
+        """Return the `(paginator, page)` of the request cursor. Raise
+        `Http404` for an invalid cursor.
+        """
+        paginator = self.keyset_paginator_class(
+            queryset, page_size, self.get_keyset_ordering()
+        )
+        try:
+            page = paginator.page(self.get_cursor())
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        page.cursor_field = self.cursor_field
+        return paginator, page
@@ -2,10 +2,16 @@ from django.utils.functional import cached_property
 from django.views.generic import ListView
 
 from ..forms import list as forms
+from .keyset import KeysetPaginationMixin
 
 
-class OrderPaginatedListView(ListView):
-    """A ListView with prepared ordering and pagination."""
+class OrderPaginatedListView(KeysetPaginationMixin, ListView):
+    """A ListView with prepared ordering and pagination.
+
+    Set `keyset_pagination = True` to page by cursor (`?cursor=...`) over
+    the selected ordering, rather than by page number; see
+    `trim.views.keyset`.
+    """
 
     default_orderby = "default_orderby_field"
     default_selected_orderby = "name"
@@ -126,3 +132,9 @@ class OrderPaginatedListView(ListView):
 
     def clamp_paginate_by(self, v):
         return min(max(self.min_paginate_by, v or 0), self.max_paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.keyset_pagination:
+            return super().paginate_queryset(queryset, page_size)
+        paginator, page = self.paginate_keyset(queryset, page_size)
+        return (paginator, page, page.object_list, page.has_other_pages())
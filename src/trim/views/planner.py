@@ -0,0 +1,271 @@
+"""Plan the relation loading of a view queryset.
+
+A template or serializer reading `book.author.name` for each row of a list
+runs one query per row. The planner reads the field names a view shows
+(such as `["title", "author__name", "tags"]`) and applies:
+
++ `select_related()` for the foreign keys and one-to-one fields of the path,
+  joined into the one query,
++ `prefetch_related()` for many-to-many and reverse relations, one query
+  each,
++ `only()` for the named columns, when every name is a field.
+
+With no field names, every forward foreign key is selected; many-to-many
+fields are prefetched with `many=True`.
+
+    queryset = plan_queryset(Book.objects.all(), ["title", "author__name"])
+
+Compare the query count of a plan, reading each field of every row:
+
+    print(plan_report(Book.objects.all()[:100], ["title", "author__name"]))
+
+or with the management command:
+
+    python manage.py query_plan books.Book --fields title,author__name
+"""
+
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.manager import BaseManager
+from django.test.utils import CaptureQueriesContext
+
+QueryPlan = namedtuple("QueryPlan", "select_related prefetch_related only")
+
+
+def resolve_lookup(model, name):
+    """Return the list of fields along the lookup `name` (such as
+    `"author__name"`) of the `model`, or None if a part is not a field.
+    """
+    opts = model._meta
+    path = []
+    for part in name.split(LOOKUP_SEP):
+        if opts is None:
+            return None
+        try:
+            field = opts.pk if part == "pk" else opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        path.append(field)
+        related = field.related_model if field.is_relation else None
+        # The attname of a foreign key (`author_id`) is its column.
+        if related is None or part != field.name:
+            opts = None
+        else:
+            opts = related._meta
+    return path
+
+
+def is_single(field):
+    """Return True if the relation `field` may be joined by
+    `select_related()`.
+    """
+    if field.related_model is None:
+        # A generic foreign key.
+        return False
+    return field.many_to_one and field.concrete or field.one_to_one
+
+
+def is_relation(field, part):
+    return field.is_relation and part == field.name
+
+
+def plan(model, fields=None, many=False):
+    """Return the `QueryPlan` of the `model` rows, reading the lookups of
+    `fields`. With no `fields` (or `"__all__"`), select every forward
+    foreign key, and prefetch every many-to-many field if `many`.
+    """
+    opts = model._meta
+    if fields in (None, "__all__"):
+        select = [f.name for f in opts.concrete_fields if f.is_relation]
+        prefetch = [f.name for f in opts.many_to_many] if many else []
+        return QueryPlan(select, prefetch, None)
+
+    select, prefetch, only = [], [], []
+    complete = True
+    for name in fields:
+        path = resolve_lookup(model, name)
+        if path is None:
+            # A property or method; its reads are unknown.
+            complete = False
+            continue
+        parts = name.split(LOOKUP_SEP)
+        relations = [i for i, x in enumerate(path) if is_relation(x, parts[i])]
+        many_at = next((i for i in relations if not is_single(path[i])), None)
+
+        if many_at is None:
+            if relations:
+                select.append(LOOKUP_SEP.join(parts[: relations[-1] + 1]))
+            if path[0].concrete:
+                only.append(name)
+            continue
+
+        if many_at > 0:
+            select.append(LOOKUP_SEP.join(parts[:many_at]))
+            only.append(LOOKUP_SEP.join(parts[:many_at]))
+        prefetch.append(LOOKUP_SEP.join(parts[: relations[-1] + 1]))
+
+    only = drop_longer(only) if complete and only else None
+    return QueryPlan(drop_within(select), drop_within(prefetch), only)
+
+
+def drop_within(names):
+    """Drop repeated names and those within a longer lookup; the relations
+    of `select_related()`.
+    """
+    res = []
+    for name in names:
+        within = any(x.startswith(name + LOOKUP_SEP) for x in names)
+        if name not in res and not within:
+            res.append(name)
+    return res
+
+
+def drop_longer(names):
+    """Drop repeated names and lookups through a named field; the columns
+    of `only()`, as a named relation loads all of its columns.
+    """
+    res = []
+    for name in names:
+        longer = any(name.startswith(x + LOOKUP_SEP) for x in names)
+        if name not in res and not longer:
+            res.append(name)
+    return res
+
+
+def ordering_names(queryset):
+    """Return the field names of the `queryset` ordering."""
+    res = []
+    for name in queryset.query.order_by or queryset.model._meta.ordering:
+        if isinstance(name, str) and name != "?":
+            res.append(name.lstrip("-"))
+    return res
+
+
+def plan_queryset(queryset, fields=None, many=False, only=True):
+    """Return the `queryset` with the relation loading of `plan()`. The
+    ordering fields are read with the `fields`. A `values()` queryset is
+    returned as is, and one already deferring fields keeps its columns.
+    """
+    if queryset._fields is not None:
+        return queryset
+    if fields not in (None, "__all__"):
+        fields = list(fields) + ordering_names(queryset)
+    query_plan = plan(queryset.model, fields, many)
+    if query_plan.select_related:
+        queryset = queryset.select_related(*query_plan.select_related)
+    if query_plan.prefetch_related:
+        queryset = queryset.prefetch_related(*query_plan.prefetch_related)
+    deferred = queryset.query.deferred_loading != (frozenset(), True)
+    if only and query_plan.only and not deferred:
+        queryset = queryset.only(*query_plan.only)
+    return queryset
+
+
+def read_lookup(obj, name):
+    """Read the lookup `name` of the model instance `obj`, through every
+    row of a many-valued relation.
+    """
+    parts = name.split(LOOKUP_SEP)
+    value = obj
+    for i, part in enumerate(parts):
+        if value is None:
+            return
+        value = getattr(value, part)
+        if isinstance(value, BaseManager):
+            rest = LOOKUP_SEP.join(parts[i + 1 :])
+            for item in value.all():
+                if rest:
+                    read_lookup(item, rest)
+            return
+
+
+class PlanReport(object):
+    """The query counts of reading rows without, and with, a plan."""
+
+    def __init__(self, query_plan, rows, before, after):
+        self.plan = query_plan
+        self.rows = rows
+        self.before = before
+        self.after = after
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "before": self.before,
+            "after": self.after,
+            **self.plan._asdict(),
+        }
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows: {self.before} queries before, {self.after} after; "
+            f"select_related={self.plan.select_related} "
+            f"prefetch_related={self.plan.prefetch_related} only={self.plan.only}"
+        )
+
+
+def count_reads(queryset, names):
+    """Return the `(rows, queries)` of reading the `names` of every row."""
+    connection = connections[queryset.db]
+    with CaptureQueriesContext(connection) as context:
+        rows = 0
+        for obj in queryset:
+            for name in names:
+                read_lookup(obj, name)
+            rows += 1
+    return rows, len(context.captured_queries)
+
+
+def plan_report(queryset, fields=None, many=False):
+    """Read the `fields` of every row of the `queryset`, as is and planned,
+    and return the `PlanReport` of the query counts.
+    """
+    query_plan = plan(queryset.model, fields, many)
+    if fields in (None, "__all__"):
+        names = query_plan.select_related + query_plan.prefetch_related
+    else:
+        names = list(fields)
+    rows, before = count_reads(queryset.all(), names)
+    _, after = count_reads(plan_queryset(queryset.all(), fields, many), names)
+    return PlanReport(query_plan, rows, before, after)
+
+
+class QueryPlanMixin(object):
+    """Plan the relation loading of the view queryset, by the field names of
+    `plan_fields`, or `fields` if None.
+    """
+
+    # Set False to keep the queryset as is.
+    query_plan = True
+    # The lookups read by the template, such as `["author__name", "tags"]`.
+    plan_fields = None
+    # Prefetch every many-to-many field when no fields are named.
+    plan_many = False
+
+    def get_plan_fields(self):
+        if self.plan_fields is not None:
+            return self.plan_fields
+        return getattr(self, "fields", None)
+
+    def plan_queryset(self, queryset):
+        if not self.query_plan:
+            return queryset
+        fields = self.get_plan_fields()
+        if fields not in (None, "__all__") and getattr(
+            self, "keyset_pagination", False
+        ):
+            # Rows are paged by their keys; load them with the row.
+            ordering = self.get_keyset_ordering() or ()
+            if isinstance(ordering, str):
+                ordering = ordering.split(",")
+            fields = list(fields) + [x.strip().lstrip("-") for x in ordering]
+        return plan_queryset(queryset, fields, many=self.get_plan_many())
+
+    def get_plan_many(self):
+        return self.plan_many
+
+    def get_queryset(self):
+        return self.plan_queryset(super().get_queryset())
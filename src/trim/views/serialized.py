@@ -1,8 +1,74 @@
+import json
+
+from django import http
 from django.core import serializers
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.serializers.python import Serializer
-from django.http import JsonResponse
+from django.db.models import Model, QuerySet
+from django.db.models.query import ModelIterable
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.views.generic import DetailView, ListView, TemplateView
 
+from . import json_cache
+from .keyset import KeysetPaginationMixin
+from .planner import QueryPlanMixin
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def dumps(data):
+    """Return the JSON bytes of `data`, encoded by orjson or ujson when
+    installed, else the standard library. Values JSON lacks (dates, times,
+    Decimal, UUID, lazy strings) convert as with `DjangoJSONEncoder`.
+    """
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(data, default=_django_encoder.default, option=option)
+    if ujson is not None:
+        text = ujson.dumps(
+            data, default=_django_encoder.default, escape_forward_slashes=False
+        )
+        return text.encode()
+    return _django_encoder.encode(data).encode()
+
+
+class JsonResponse(http.JsonResponse):
+    """A `django.http.JsonResponse`, encoded by `dumps()`. A custom `encoder`
+    or `json_dumps_params` encode with `json.dumps()`, as Django does.
+    """
+
+    def __init__(
+        self,
+        data,
+        encoder=DjangoJSONEncoder,
+        safe=True,
+        json_dumps_params=None,
+        **kwargs,
+    ):
+        if encoder is not DjangoJSONEncoder or json_dumps_params:
+            super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+            return
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        HttpResponse.__init__(self, content=dumps(data), **kwargs)
+
 
 class JsonSerializer(Serializer):
     # pass
@@ -19,8 +85,103 @@ class JsonSerializer(Serializer):
 class JSONResponseMixin(object):
     """
     A mixin that can be used to render a JSON response.
+
+    Set `cache_response = True` to keep the body of GET responses in the
+    Django cache, keyed by the model label, pk, fields and querystring. The
+    body is replaced when a row of the `model` (or `cache_models`) changes;
+    see `trim.views.json_cache`. Responses carry an `ETag` of the body, and
+    a matching `If-None-Match` returns a 304.
     """
 
+    cache_response = False
+    # The cache alias and seconds; `JSON_RESPONSE_CACHE` if None.
+    cache_alias = None
+    cache_timeout = None
+    # Other models read by the response, such as those of related fields.
+    cache_models = ()
+    # Key the body by the user, for responses of the user's own rows.
+    cache_per_user = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.cache_response:
+            models = [getattr(cls, "model", None), *cls.cache_models]
+            json_cache.watch_models(models, cls.cache_alias)
+
+    def watch_cache_models(self):
+        json_cache.watch_models(self.get_cache_models(), self.get_cache_alias())
+
+    def get_cache_alias(self):
+        return self.cache_alias or json_cache.get_conf()["CACHE"]
+
+    def get_cache_timeout(self):
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return json_cache.get_conf()["TIMEOUT"]
+
+    def get_cache_model(self):
+        return getattr(self, "model", None)
+
+    def get_cache_models(self):
+        model = self.get_cache_model()
+        return ([model] if model is not None else []) + list(self.cache_models)
+
+    def get_cache_pk(self):
+        """Return the pk of the one object of the response, or None for a
+        list.
+        """
+        return None
+
+    def get_cache_key_parts(self):
+        """Return the values naming the response, less the model tokens."""
+        cls = type(self)
+        model = self.get_cache_model()
+        parts = [
+            f"{cls.__module__}.{cls.__qualname__}",
+            model._meta.label_lower if model is not None else None,
+            self.get_cache_pk(),
+            repr(getattr(self, "fields", None)),
+            sorted(self.request.GET.lists()),
+        ]
+        if self.cache_per_user:
+            parts.append(self.request.user.pk)
+        return parts
+
+    def get_cache_key(self, cache):
+        model = self.get_cache_model()
+        pk = self.get_cache_pk()
+        if model is not None and pk is not None:
+            keys = [json_cache.token_key(model, pk), json_cache.token_key(model, "*")]
+        else:
+            keys = [json_cache.token_key(model)] if model is not None else []
+        keys += [json_cache.token_key(x) for x in self.cache_models]
+        tokens = json_cache.get_tokens(cache, keys)
+        return json_cache.response_key(self.get_cache_key_parts() + tokens)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.cache_response or request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+        # The models of `as_view()` arguments are watched on first use.
+        self.watch_cache_models()
+        cache = caches[self.get_cache_alias()]
+        key = self.get_cache_key(cache)
+        entry = cache.get(key)
+        if entry is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            content = response.content
+            entry = (
+                json_cache.payload_etag(content),
+                content,
+                response["Content-Type"],
+            )
+            cache.set(key, entry, self.get_cache_timeout())
+        else:
+            response = HttpResponse(entry[1], content_type=entry[2])
+        response["ETag"] = entry[0]
+        return get_conditional_response(request, etag=entry[0], response=response)
+
     def render_to_json_response(self, context, **response_kwargs):
         """
         Returns a JSON response, transforming 'context' to make the payload.
@@ -94,6 +255,11 @@ class JsonView(JSONResponseMixin, TemplateView):
 
 class JSONListResponseMixin(object):
     fields = None
+    # The rows read (and serialized) at once by a stream.
+    stream_chunk_size = 2000
+    # Read the rows of a QuerySet as `values_list()` tuples, when the
+    # output is the same; see `get_values_fields`.
+    values_fast_path = True
 
     def render_to_json_response(self, context, **response_kwargs):
         """
@@ -101,6 +267,107 @@ class JSONListResponseMixin(object):
         """
         return JsonResponse(context, **response_kwargs)
 
+    def render_to_json_stream(self, prop, result, extra=None, **response_kwargs):
+        """
+        Returns a StreamingHttpResponse of the JSON object
+        `{prop: [...result], **extra}`, written while the client reads it.
+        """
+        return StreamingHttpResponse(
+            self.iter_json(prop, result, extra),
+            content_type="application/json",
+            **response_kwargs,
+        )
+
+    def iter_chunks(self, rows):
+        """Yield lists of up to `stream_chunk_size` of the `rows`."""
+        size = self.stream_chunk_size
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def iter_serialized(self, result):
+        """Yield the serialized rows of the `result`, a chunk at a time. A
+        QuerySet is read with `.iterator()`, so its rows are not cached.
+        """
+        size = self.stream_chunk_size
+        fields = None
+        if type(self).serialize_result is JSONListResponseMixin.serialize_result:
+            fields = self.get_values_fields(result)
+        if fields is not None:
+            rows = result.values_list(*fields).iterator(chunk_size=size)
+            for chunk in self.iter_chunks(rows):
+                yield [dict(zip(fields, row)) for row in chunk]
+            return
+
+        if isinstance(result, QuerySet):
+            rows = result.iterator(chunk_size=size)
+        else:
+            rows = iter(result)
+        for chunk in self.iter_chunks(rows):
+            yield self.serialize_result(chunk)
+
+    def iter_json(self, prop, result, extra=None):
+        """Yield the JSON bytes of `{prop: [...], **extra}`, one chunk of
+        rows at a time.
+        """
+        yield b"{" + dumps(prop) + b": ["
+        first = True
+        for items in self.iter_serialized(result):
+            # The list, without its brackets.
+            items = dumps(items)[1:-1]
+            if items:
+                yield items if first else b"," + items
+                first = False
+        tail = b"".join(
+            b", " + dumps(key) + b": " + dumps(value)
+            for key, value in (extra or {}).items()
+        )
+        yield b"]" + tail + b"}"
+
+    def has_default_dump(self):
+        """Return True if rows are dumped by the default `get_dump_object`
+        and serializer, so may skip the serializer.
+        """
+        cls = type(self)
+        return (
+            cls.get_dump_object is JSONListResponseMixin.get_dump_object
+            and cls.get_serialiser is JSONListResponseMixin.get_serialiser
+        )
+
+    def get_values_fields(self, result):
+        """Return the field names to read from the QuerySet `result` with
+        `values_list()`, building each row dict from a tuple rather than a
+        model instance and the serializer. Return None to serialize the
+        instances: the `result` is not a QuerySet of instances, a field is
+        not a concrete column (by its attname), or `get_dump_object` or
+        `get_serialiser` is overridden.
+        """
+        if (
+            not self.values_fast_path
+            or not isinstance(result, QuerySet)
+            or result._iterable_class is not ModelIterable
+            or not self.has_default_dump()
+        ):
+            return None
+
+        opts = result.model._meta
+        if self.fields in (None, "__all__"):
+            return [field.attname for field in opts.fields]
+
+        for name in self.fields:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.many_to_many or field.attname != name:
+                return None
+        return list(self.fields)
+
     def get_dump_object(self, obj):
         keys = self.fields or "__all__"
 
@@ -126,28 +393,106 @@ class JSONListResponseMixin(object):
             def serialize_result(self, result):
                 # return a list of ids
                 return [x.id for x in result]
+
+        A QuerySet is read with `values_list()` when the output is the same;
+        see `get_values_fields`. A list or QuerySet of instances is dumped
+        directly, without the serializer reading each many-to-many field.
         """
+        fields = self.get_values_fields(result)
+        if fields is not None:
+            return [dict(zip(fields, row)) for row in result.values_list(*fields)]
+        if (
+            self.values_fast_path
+            and isinstance(result, (list, QuerySet))
+            and self.has_default_dump()
+            and all(isinstance(x, Model) for x in result)
+        ):
+            return [self.get_dump_object(x) for x in result]
         serial = self.get_serialiser()
         return serial.serialize(result)
 
 
-class JsonListView(JSONResponseMixin, JSONListResponseMixin, DetailView):
+class JsonListView(
+    KeysetPaginationMixin,
+    QueryPlanMixin,
+    JSONResponseMixin,
+    JSONListResponseMixin,
+    DetailView,
+):
     model = None
     prop = "object_list"
     # Apply any extra dictionary data to append into the response dictionary
     # _after_ serialisation.
     response_extra = None
+    # Stream the list while it is serialized, rather than building it in
+    # memory; for large exports.
+    stream = False
+    # Set False to drop the "count" of the response.
+    include_count = True
+    # With `keyset_pagination = True`, the rows of a page, and its ordering;
+    # the model ordering if None.
+    paginate_by = 50
+    ordering = None
+    # The rows of the whole `result`, once serialized by `get()`.
+    result_rows = None
 
     def get_results(self):
-        return self.model.objects.all()
+        return self.plan_queryset(self.model.objects.all())
+
+    def plan_queryset(self, queryset):
+        """Load the relations of the `fields`; see `trim.views.planner`. Rows
+        read with `values_list()` are returned as is.
+        """
+        if self.get_values_fields(queryset) is not None:
+            return queryset
+        return super().plan_queryset(queryset)
+
+    def get_plan_many(self):
+        # The serializer reads every many-to-many field of each row.
+        return self.plan_many or not self.has_default_dump()
+
+    def get_ordering(self):
+        return self.ordering or self.model._meta.ordering or ["pk"]
+
+    def get_keyset_data(self, result):
+        """Return the page of the request cursor, and the cursors either
+        side (None at either end). No count is taken.
+        """
+        paginator, page = self.paginate_keyset(result, self.paginate_by)
+        return {
+            self.prop: self.serialize_result(page.object_list),
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+            **(self.response_extra or {}),
+        }
+
+    def get_count(self, result):
+        """Return the count of the `result`. Rows already serialized by the
+        default `serialize_result` are counted, and a QuerySet otherwise
+        unread is counted with one `COUNT(*)`, rather than read.
+        """
+        rows = self.result_rows
+        default = type(self).serialize_result is JSONListResponseMixin.serialize_result
+        if rows is not None and default:
+            return len(rows)
+        if isinstance(result, QuerySet):
+            return result.count()
+        return len(result)
 
     def get_response_extra(self, result):
-        return {"count": len(result), **(self.response_extra or {})}
+        extra = {"count": self.get_count(result)} if self.include_count else {}
+        return {**extra, **(self.response_extra or {})}
 
     def get(self, request, *args, **kwargs):
         result = self.get_results()
+        if self.keyset_pagination:
+            return self.render_to_json_response(self.get_keyset_data(result))
+        if self.stream:
+            extra = self.get_response_extra(result)
+            return self.render_to_json_stream(self.prop, result, extra)
+        self.result_rows = self.serialize_result(result)
         data = {
-            self.prop: self.serialize_result(result),
+            self.prop: self.result_rows,
             **self.get_response_extra(result),
         }
         return self.render_to_json_response(data, **kwargs)
@@ -156,8 +501,11 @@ class JsonListView(JSONResponseMixin, JSONListResponseMixin, DetailView):
 class JsonDetailView(JsonListView):
     prop = "object"
 
+    def get_cache_pk(self):
+        return self.kwargs["pk"]
+
     def get_results(self):
-        return self.model.objects.get(id=self.kwargs["pk"])
+        return self.plan_queryset(self.model.objects.all()).get(id=self.kwargs["pk"])
 
     def get(self, request, *args, **kwargs):
         return self.json_response(**kwargs)
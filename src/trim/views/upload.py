@@ -1,18 +1,40 @@
+import hashlib
 import json
 import os
+import time
 import uuid
 from pathlib import Path
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connections
 from django.http import JsonResponse
-from django.urls import reverse
+from django.urls import NoReverseMatch, reverse
 from django.utils.decorators import method_decorator
+from django.utils.module_loading import import_string
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
 from ..forms.upload import FileChunkForm, FileForm, FilesForm, MergeConfirmForm
-from ..merge import FileExists, recombine
-from .base import FormView, TemplateView
+from ..merge import (
+    ChunkManifest,
+    ChunkMap,
+    FileExists,
+    chunk_count,
+    chunks_digest,
+    create_sparse,
+    hashing,
+    is_part,
+    promote,
+    recombine,
+    split_i,
+    write_at,
+)
+from ..upload_cleanup import remove_tree, schedule_sweep, trash
+from ..upload_store import get_store
+from ..upload_tasks import get_runner
+from .base import FormView, TemplateView, View
 
 HERE = Path(__file__).parent
 ROOT = HERE.parent.parent.parent
@@ -20,52 +42,191 @@ UPLOADS = ROOT / "uploads"
 
 # fs = FileSystemStorage(location=UPLOADS)
 
-cache = {}
+# Chunks are stored as `.part_N` files and recombined at merge.
+PARTS = "parts"
+# Chunks are written at their offset within one sparse file; the merge is
+# a rename.
+INPLACE = "inplace"
+
+INPLACE_SUFFIX = ".partial"
+CHUNK_MAP_NAME = "chunks.map"
+MANIFEST_NAME = "manifest.jsonl"
+
+# The states of a merge, kept in the session store under `merge_key()`.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Seconds without a progress update before a running merge is presumed
+# dead, and may be started again.
+MERGE_STALE = 5 * 60
+# Seconds between progress writes to the session store.
+PROGRESS_INTERVAL = 0.5
+
+
+class ChunkError(Exception):
+    """A chunk cannot be accepted; the message is returned to the client."""
+
+    status = 400
 
 
 def get_cache():
-    return cache
+    """Return the upload session store, shared by all workers.
+    See `trim.upload_store` and the `CHUNK_UPLOAD_STORE` setting.
+    """
+    return get_store()
 
 
 def unlink_dir_files(dir_path):
-    res = ()
-    for root, dirs, files in os.walk(dir_path):
-        for f in files:
-            os.unlink(os.path.join(root, f))
-            # res += (Path(f).relative_to(dir_path),)
-            res += (f,)
-        for d in dirs:
-            shutil.rmtree(os.path.join(root, d))
-            # res += (Path(d).relative_to(dir_path),)
-            res += (d,)
-
-    c = 0
-    for root, dirs, files in os.walk(dir_path):
-        c += len(files)
-        c += len(dirs)
+    """Remove the contents of `dir_path` in place, keeping the directory.
+    The merge view moves the directory to the trash instead; see
+    `trim.upload_cleanup`.
+    """
+    res = []
+    for entry in os.scandir(dir_path):
+        if entry.is_dir(follow_symlinks=False):
+            remove_tree(entry.path)
+        else:
+            os.unlink(entry.path)
+        res.append(entry.name)
 
     return {
         "files": res,
         "old_count": len(res),
-        "new_count": c,
+        "new_count": len(os.listdir(dir_path)),
     }
 
 
+def merge_key(file_uuid):
+    """Return the session store key of the merge state of an upload."""
+    return f"{file_uuid}:merge"
+
+
+def write_merge_state(file_uuid, state, **values):
+    info = {"state": state, "updated": time.time(), **values}
+    get_cache().set(merge_key(file_uuid), info)
+    return info
+
+
+def merge_job(view, file_uuid, username, delete_cache=False, options=None):
+    """The background merge, run by the `trim.upload_tasks` runner. `view` is
+    the dotted path of the `MergeAssetView` (sub)class starting the merge,
+    built with the attributes of `options`; see `MergeAssetView.merge_options`.
+    """
+    try:
+        view = import_string(view)(**(options or {}))
+    except Exception as err:
+        # Release the claim now, rather than after `MERGE_STALE`.
+        write_merge_state(file_uuid, FAILED, error=str(err))
+        raise
+    view.setup(None, uuid=file_uuid)
+    view.username = username
+    return view.run_merge(delete_cache)
+
+
+def call_closing(func, *args, **kwargs):
+    """Run `func` on a pool thread, closing the DB connections it opened
+    (such as those of a `ModelStore`). The request cycle closes only the
+    connections of its own thread.
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def is_uuid(value):
+    """Return True if `value` is a UUID string, safe for use in a path."""
+    try:
+        return str(uuid.UUID(str(value))) == str(value)
+    except ValueError:
+        return False
+
+
 def verify_file(asset):
     res = {"size": asset["output"]["size"] == asset["bytesize"]}
 
+    chunks = asset.get("chunks") or {}
+    if asset.get("chunk_size"):
+        # Every expected chunk arrived and matched the hash sent with it.
+        count = chunk_count(asset["bytesize"] or 0, asset["chunk_size"])
+        verified = [chunks.get(str(i), {}).get("verified") for i in range(count)]
+        res["chunks"] = all(verified)
+
     return res
 
 
 class AssetMixin(object):
 
     upload_dir_settings_key = "CHUNK_UPLOAD_DIR"
+    # The owner of the upload, for a view running outside of a request.
+    username = None
+    # The hashlib name for chunk and file hashes. If None, the
+    # CHUNK_UPLOAD_HASH setting is used.
+    hash_algorithm = None
+    # Hash the whole file while a `PARTS` merge writes it. The bytes then
+    # pass through a buffer, rather than a kernel copy. If None, the
+    # CHUNK_UPLOAD_HASH_FILE setting is used.
+    hash_file = None
+
+    def get_hash_algorithm(self):
+        return self.hash_algorithm or getattr(settings, "CHUNK_UPLOAD_HASH", "sha256")
+
+    def get_hash_file(self):
+        if self.hash_file is not None:
+            return self.hash_file
+        return getattr(settings, "CHUNK_UPLOAD_HASH_FILE", False)
+
+    def get_hasher(self):
+        return hashlib.new(self.get_hash_algorithm())
 
     def get_uuid(self):
         return self.kwargs["uuid"]
 
-    def get_asset(self):
-        return cache[self.get_uuid()]
+    def get_asset(self, file_uuid=None):
+        file_uuid = file_uuid or self.get_uuid()
+        info = self.find_asset(file_uuid)
+        if info is None:
+            raise KeyError(file_uuid)
+        return info
+
+    def find_asset(self, file_uuid):
+        """Return the session of the upload, or None. A session missing
+        from the store (expired, or the store was lost) is restored from
+        its manifest on disk.
+        """
+        if is_uuid(file_uuid) is False:
+            return None
+        info = get_cache().get(file_uuid)
+        if info is None:
+            info = self.restore_asset(file_uuid)
+        return info
+
+    def restore_asset(self, file_uuid):
+        info = self.get_manifest(file_uuid).session()
+        if info is not None:
+            print("Restored", file_uuid)
+            get_cache().set(file_uuid, info)
+        return info
+
+    def get_manifest(self, file_uuid=None):
+        fs = self.get_fs()
+        parts_dir = Path(fs.location) / self.get_parts_dir(file_uuid)
+        return ChunkManifest(parts_dir / MANIFEST_NAME)
+
+    def set_asset(self, asset, file_uuid=None):
+        """Write the (changed) asset dict back to the session store."""
+        get_cache().set(file_uuid or self.get_uuid(), asset)
+        return asset
+
+    def get_merge_state(self, file_uuid=None):
+        """Return the merge state and progress of the upload, or None if
+        no merge has started.
+        """
+        return get_cache().get(merge_key(file_uuid or self.get_uuid()))
+
+    def set_merge_state(self, state, file_uuid=None, **values):
+        return write_merge_state(file_uuid or self.get_uuid(), state, **values)
 
     def ensure_dir(self, location):
         fullpath = location
@@ -87,26 +248,70 @@ class AssetMixin(object):
         return FileSystemStorage(location=uploads)
 
     def get_current_username(self):
+        if self.username is not None:
+            return self.username
         username = self.request.user.username
         if len(username) == 0 and self.request.user.is_anonymous:
             username = "anonymous"
         return username
 
-    def get_parts_dir(self):
-        file_uuid = self.get_uuid()
-        info = cache[file_uuid]
-        name = info["internal_name"]
-        suffix = info["suffix"]
+    def get_parts_dir(self, file_uuid=None):
+        file_uuid = file_uuid or self.get_uuid()
         username = self.get_current_username()
         make_name = Path(username) / file_uuid
         return make_name
 
+    def get_target_path(self, info, file_uuid=None):
+        """Return the absolute path of the single file receiving the
+        chunks of an `INPLACE` upload.
+        """
+        fs = self.get_fs()
+        name = f"{info['internal_name']}{info['suffix']}{INPLACE_SUFFIX}"
+        return Path(fs.location) / self.get_parts_dir(file_uuid) / name
+
+    def get_chunk_map(self, file_uuid=None, count=None):
+        fs = self.get_fs()
+        parts_dir = Path(fs.location) / self.get_parts_dir(file_uuid)
+        return ChunkMap(parts_dir / CHUNK_MAP_NAME, count)
+
+    def get_chunk_count(self, info):
+        """Return the expected count of chunks, or None if the client did not
+        declare a `chunk_size`.
+        """
+        if not info.get("chunk_size"):
+            return None
+        return chunk_count(info["bytesize"] or 0, info["chunk_size"])
+
+    def get_received_chunks(self, info, file_uuid=None):
+        """Return a sorted list of the chunk indices stored so far."""
+        if info.get("mode") == INPLACE:
+            return self.get_chunk_map(file_uuid).received()
+
+        fs = self.get_fs()
+        parts_dir = Path(fs.location) / self.get_parts_dir(file_uuid)
+        if parts_dir.exists() is False:
+            return []
+        return sorted(split_i(x.name) for x in os.scandir(parts_dir) if is_part(x.name))
+
+    def get_missing_chunks(self, info, file_uuid=None):
+        """Return the chunk indices not yet received, or None if unknown."""
+        count = self.get_chunk_count(info)
+        if count is None:
+            return None
+        received = set(self.get_received_chunks(info, file_uuid))
+        return [i for i in range(count) if i not in received]
+
 
 class UploadAssetView(FormView, AssetMixin):
     """An upload file form view, with two forms."""
 
     form_class = FileForm
     template_name = "trim/upload/upload_view.html"
+    # PARTS or INPLACE. If None, the CHUNK_UPLOAD_MODE setting is used.
+    upload_mode = None
+
+    def get_upload_mode(self):
+        return self.upload_mode or getattr(settings, "CHUNK_UPLOAD_MODE", PARTS)
 
     def get_context_data(self, **kwargs):
         kwargs = super().get_context_data(**kwargs)
@@ -121,40 +326,123 @@ class UploadAssetView(FormView, AssetMixin):
 
         suffix = Path(data["filepath"]).suffix
         name = Path(data["filename"]).stem
-        cache = get_cache()
-        cache[file_uuid] = {
+        info = {
             "filetype": data["filetype"],
             "bytesize": data["byte_size"],
             "filepath": data["filepath"],
             "suffix": suffix,
             "internal_name": name,
             "done": False,
+            "mode": PARTS,
         }
 
-        cache[file_uuid]["filename"] = filename
+        info["filename"] = filename
+
+        chunk_size = data.get("chunk_size")
+        info["chunk_size"] = chunk_size
+        fs = self.get_fs()
+        self.ensure_dir(Path(fs.location) / self.get_parts_dir(file_uuid))
+        if self.get_upload_mode() == INPLACE and chunk_size:
+            self.prepare_inplace(info, file_uuid, chunk_size)
+
+        # The durable copy, for resuming after the session is lost.
+        self.get_manifest(file_uuid).write_session(info)
+        cache = get_cache()
+        # Drop abandoned sessions as new ones arrive.
+        cache.evict()
+        cache.set(file_uuid, info)
+        schedule_sweep()
         return file_uuid
 
+    def prepare_inplace(self, info, file_uuid, chunk_size):
+        """Create the sparse target file and an empty chunk map, so each
+        chunk may write directly to its offset.
+        """
+        bytesize = info["bytesize"] or 0
+        target = self.get_target_path(info, file_uuid)
+        self.ensure_dir(target.parent)
+        create_sparse(target, bytesize)
+        count = chunk_count(bytesize, chunk_size)
+        self.get_chunk_map(file_uuid, count).create()
+
+        info["mode"] = INPLACE
+        return target
+
     def form_valid(self, form):
         """Return an ajax response of content
         for the incoming chunks
         """
         data = form.cleaned_data
+        file_uuid = self.resume_asset(data)
+        if file_uuid is not None:
+            info = self.get_asset(file_uuid)
+            return JsonResponse(
+                {
+                    "ok": True,
+                    "file_uuid": file_uuid,
+                    "resumed": True,
+                    "missing": self.get_missing_chunks(info, file_uuid),
+                    "hash_algorithm": self.get_hash_algorithm(),
+                }
+            )
+
         file_uuid = self.save_asset(data)
 
         return JsonResponse(
             {
                 "ok": True,
                 "file_uuid": file_uuid,
+                # The client hashes each chunk with the same algorithm.
+                "hash_algorithm": self.get_hash_algorithm(),
             }
         )
 
+    def resume_asset(self, data):
+        """Return the `file_uuid` given by the client if the upload exists,
+        is unfinished and matches the file now offered. Otherwise return
+        None, to start a new upload.
+        """
+        file_uuid = data.get("file_uuid")
+        if not file_uuid:
+            return None
+
+        info = self.find_asset(file_uuid)
+        if info is None or info.get("done"):
+            return None
+
+        same = (
+            info["bytesize"] == data["byte_size"]
+            and info["filepath"] == data["filepath"]
+            and info.get("chunk_size") == data.get("chunk_size")
+        )
+        return file_uuid if same else None
+
 
 class UploadAssetSuccessView(TemplateView, AssetMixin):
+    """The result of an upload. While the merge runs, the progress template
+    polls the `progress_url` and reloads this page once the merge completes.
+    """
+
     template_name = "trim/file/upload_success.html"
+    progress_template_name = "trim/file/merge_progress.html"
+    progress_url_name = "file:upload_progress"
+
+    def get_template_names(self):
+        if self.get_asset().get("done"):
+            return [self.template_name]
+        return [self.progress_template_name]
+
+    def get_progress_url(self):
+        try:
+            return reverse(self.progress_url_name, args=(self.get_uuid(),))
+        except NoReverseMatch:
+            return None
 
     def get_context_data(self, **kwargs):
         kwargs = super().get_context_data(**kwargs)
         kwargs["asset"] = self.get_asset()
+        kwargs["merge"] = self.get_merge_state()
+        kwargs["progress_url"] = self.get_progress_url()
         return kwargs
 
 
@@ -175,27 +463,78 @@ class UploadChunkView(FormView, AssetMixin):
             if location.exists():
                 # ensure the parent is set correctly.
                 v = fullpath.relative_to(location)
-                fullpath.parent.mkdir(parents=True)
+                # Concurrent chunks may race to create the directory.
+                fullpath.parent.mkdir(parents=True, exist_ok=True)
                 print(v)
         return fullpath
 
     def save_file_part(self, data):
-        store_path = self.generate_store_path(data)
+        """Store one chunk. Chunks of one upload may arrive concurrently and
+        in any order; sending the same `chunk_index` again replaces it.
+        """
         # The stream chunk of file
         filepart = data["filepart"]
-        ok = self.write_file(filepart, store_path)
-        return ok
+        info = self.find_asset(data["file_uuid"])
+        if info is None:
+            raise ChunkError("Unknown upload")
+
+        self.check_chunk(info, data["chunk_index"], filepart.size)
+        # The hash is taken as the chunk streams to disk.
+        hasher = self.get_hasher()
+        expected_hash = data.get("chunk_hash") or None
+
+        if info.get("mode") == INPLACE:
+            # Write straight into the target, at the offset of the chunk.
+            store_path = self.get_target_path(info, data["file_uuid"])
+            offset = data["chunk_index"] * info["chunk_size"]
+            ok = self.write_file(
+                filepart,
+                store_path,
+                offset=offset,
+                hasher=hasher,
+                expected_hash=expected_hash,
+            )
+            self.get_chunk_map(data["file_uuid"]).mark(data["chunk_index"])
+        else:
+            store_path = self.generate_store_path(data)
+            ok = self.write_file(
+                filepart, store_path, hasher=hasher, expected_hash=expected_hash
+            )
+
+        self.record_chunk(data, filepart.size, hasher.hexdigest(), expected_hash)
+        return hasher.hexdigest()
+
+    def record_chunk(self, data, size, digest, expected_hash=None):
+        """Append the size and hash of a received chunk to the manifest."""
+        manifest = self.get_manifest(data["file_uuid"])
+        manifest.add_chunk(
+            data["chunk_index"], size, digest, verified=expected_hash is not None
+        )
+
+    def check_chunk(self, info, index, size):
+        """Raise a `ChunkError` if the chunk does not fit the declared file."""
+        count = self.get_chunk_count(info)
+        if index < 0 or (count is not None and index >= count):
+            raise ChunkError(f"chunk_index {index} out of range")
+
+        if info.get("mode") == INPLACE:
+            # Every chunk but the last is whole; a short one would leave a
+            # hole in the preallocated file.
+            offset = index * info["chunk_size"]
+            expected = min(info["chunk_size"], (info["bytesize"] or 0) - offset)
+            if size != expected:
+                raise ChunkError(f"chunk {index} is {size} bytes, expected {expected}")
 
     def generate_store_path(self, data):
         username = self.get_current_username()
 
-        info = cache.get(file_uuid)
+        # returned from the upload asset initial view.
+        file_uuid = data["file_uuid"]
+        info = self.find_asset(file_uuid)
         # The mapped name given to the form before the main upload
         name = info["internal_name"]
         suffix = info["suffix"]
 
-        # returned from the upload asset initial view.
-        file_uuid = data["file_uuid"]
         # The int chunk index
         index = data["chunk_index"]
         # The 'part' defines an extended suffix,
@@ -209,19 +548,217 @@ class UploadChunkView(FormView, AssetMixin):
 
     def form_valid(self, form):
         data = form.cleaned_data
-        ok = self.save_file_part(data)
+        try:
+            digest = self.save_file_part(data)
+        except ChunkError as err:
+            return JsonResponse({"ok": False, "error": str(err)}, status=err.status)
 
-        return JsonResponse({"ok": True})
+        return JsonResponse(
+            {"ok": True, "chunk_index": data["chunk_index"], "hash": digest}
+        )
 
-    def write_file(self, file, store_path, storage=None):
+    def write_file(
+        self,
+        file,
+        store_path,
+        storage=None,
+        offset=None,
+        hasher=None,
+        expected_hash=None,
+    ):
+        """Write the uploaded `file` to the `store_path`. If an `offset` is
+        given the bytes are written into the existing (preallocated) file
+        at that position.
+
+        If a `hasher` is given it is updated as the bytes are written. If an
+        `expected_hash` is given a mismatch raises a `ChunkError`, and the
+        chunk is not kept.
+        """
         print("Writing", store_path)
+        hasher = hasher or self.get_hasher()
+        chunks = hashing(file.chunks(), hasher)
+
+        if offset is not None:
+            write_at(store_path, offset, chunks)
+            self.check_hash(hasher, expected_hash)
+            return store_path.exists()
+
         storage = storage or self.get_fs()
+        # Write aside and rename, so a re-sent chunk replaces the part
+        # whole, and a concurrent reader never sees half a part.
+        temp_path = store_path.with_name(f"{store_path.name}.{uuid.uuid4().hex}.tmp")
         # with fs.open(store_path, 'wb+') as stream:
-        with storage.open(store_path, "wb+") as stream:
-            for chunk in file.chunks():
-                stream.write(chunk)
+        try:
+            with storage.open(temp_path, "wb+") as stream:
+                for chunk in chunks:
+                    stream.write(chunk)
+            self.check_hash(hasher, expected_hash)
+        except Exception:
+            # A bad hash, or a body cut short.
+            if temp_path.exists():
+                os.unlink(temp_path)
+            raise
+        os.replace(temp_path, store_path)
         return store_path.exists()
 
+    def check_hash(self, hasher, expected_hash=None):
+        if expected_hash is None:
+            return True
+        if hasher.hexdigest() != expected_hash.strip().lower():
+            raise ChunkError("chunk hash mismatch")
+        return True
+
+
+class RequestBody(object):
+    """The raw body of a request, read as the `chunks()` of an uploaded
+    file of `size` bytes.
+    """
+
+    block_size = 64 * 1024
+
+    def __init__(self, request, size):
+        self.request = request
+        self.size = size
+
+    def chunks(self, chunk_size=None):
+        remaining = self.size
+        block_size = chunk_size or self.block_size
+        while remaining > 0:
+            data = self.request.read(min(block_size, remaining))
+            if not data:
+                raise ChunkError("request body is shorter than Content-Length")
+            remaining -= len(data)
+            yield data
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class UploadRawChunkView(UploadChunkView):
+    """Receive a chunk as the raw request body (`application/octet-stream`),
+    without a multipart parse; the body streams straight to the part file
+    or offset (from the buffered body, under ASGI). The upload and chunk are named by the URL:
+
+        path("upload/raw/<str:uuid>/<int:index>/", UploadRawChunkView.as_view())
+
+    or by the `X-File-UUID` and `X-Chunk-Index` headers. An optional
+    `X-Chunk-Hash` header is checked as with `chunk_hash`.
+    """
+
+    http_method_names = ["post", "options"]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = self.get_chunk_data()
+            digest = self.save_file_part(data)
+        except ChunkError as err:
+            return JsonResponse({"ok": False, "error": str(err)}, status=err.status)
+
+        return JsonResponse(
+            {"ok": True, "chunk_index": data["chunk_index"], "hash": digest}
+        )
+
+    def get_chunk_data(self):
+        """Return the chunk `data`, as `FileChunkForm` would clean it."""
+        headers = self.request.headers
+        file_uuid = self.kwargs.get("uuid") or headers.get("X-File-UUID")
+        index = self.kwargs.get("index", headers.get("X-Chunk-Index"))
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            raise ChunkError("A chunk index is required")
+        try:
+            size = int(headers.get("Content-Length") or "")
+        except ValueError:
+            raise ChunkError("Content-Length is required")
+
+        return {
+            "file_uuid": file_uuid,
+            "chunk_index": index,
+            "filepart": RequestBody(self.request, size),
+            "chunk_hash": headers.get("X-Chunk-Hash", ""),
+        }
+
+
+class UploadStatusView(View, AssetMixin):
+    """Return the chunk state of an upload, so a client may send (or
+    re-send) the missing chunks:
+
+        {
+            "ok": true,
+            "file_uuid": "...",
+            "chunk_count": 12,
+            "received": [0, 1, 3],
+            "missing": [2, 4, 5, ...],
+            "done": false
+        }
+    """
+
+    def get(self, request, *args, **kwargs):
+        file_uuid = self.get_uuid()
+        info = self.find_asset(file_uuid)
+        if info is None:
+            return JsonResponse({"ok": False, "error": "Unknown upload"}, status=404)
+
+        return JsonResponse(
+            {
+                "ok": True,
+                "file_uuid": file_uuid,
+                "chunk_count": self.get_chunk_count(info),
+                "received": self.get_received_chunks(info),
+                "missing": self.get_missing_chunks(info),
+                "done": info.get("done", False),
+            }
+        )
+
+
+class UploadProgressView(View, AssetMixin):
+    """Return the merge progress of an upload:
+
+        {
+            "ok": true,
+            "file_uuid": "...",
+            "state": "running",
+            "total": 1073741824,
+            "written": 536870912,
+            "rate": 402653184.0,
+            "eta": 1.33,
+            "done": false
+        }
+
+    `state` is null before the merge is queued. Once `done`, the `redirect`
+    is the success URL (if it resolves).
+    """
+
+    success_url_name = "file:upload_success"
+
+    def get(self, request, *args, **kwargs):
+        file_uuid = self.get_uuid()
+        info = self.find_asset(file_uuid)
+        if info is None:
+            return JsonResponse({"ok": False, "error": "Unknown upload"}, status=404)
+
+        merge = self.get_merge_state() or {}
+        done = info.get("done", False)
+        return JsonResponse(
+            {
+                "ok": True,
+                "file_uuid": file_uuid,
+                "state": merge.get("state"),
+                "total": merge.get("total"),
+                "written": merge.get("written"),
+                "rate": merge.get("rate"),
+                "eta": merge.get("eta"),
+                "error": merge.get("error"),
+                "done": done,
+                "redirect": self.get_redirect_url() if done else None,
+            }
+        )
+
+    def get_redirect_url(self):
+        try:
+            return reverse(self.success_url_name, args=(self.get_uuid(),))
+        except NoReverseMatch:
+            return None
+
 
 class MergeAssetView(FormView, AssetMixin):
 
@@ -229,6 +766,15 @@ class MergeAssetView(FormView, AssetMixin):
     # template_name = "corsa/form.html"
     template_name = "trim/file/merge_view.html"
     skip_step = False
+    progress_written = 0
+    # The chunk indices found missing by `is_complete`.
+    missing_chunks = None
+    # The dotted path of the view class running the background merge; the
+    # class of this view if None. It must be importable by the runner.
+    merge_view = None
+    # The attributes given to the background merge view, so those of
+    # `as_view(**initkwargs)` apply. Values must be JSON serializable.
+    merge_options = ("upload_dir_settings_key", "hash_algorithm", "hash_file")
 
     def get(self, request, *args, **kwargs):
         """Handle GET requests: instantiate a blank version of the form."""
@@ -260,29 +806,138 @@ class MergeAssetView(FormView, AssetMixin):
         if not accept:
             return super().form_valid(form)
 
-        ok = self.perform_all(delete_cache)
+        # The merge runs in the background; the success view shows progress.
+        ok = self.start_merge(delete_cache)
 
         if ok:
             return super().form_valid(form)
 
-        print("Bad Path.")
+        print("Merge not started", self.get_uuid())
         return super().form_valid(form)
 
+    def start_merge(self, delete_cache=False):
+        """Queue the merge on the upload runner (see `trim.upload_tasks`).
+        Return False if the upload is merged, merging, or incomplete.
+        """
+        view = self.get_merge_view()
+        if self.claim_merge() is False:
+            return False
+        try:
+            get_runner().submit(
+                "trim.views.upload.merge_job",
+                view=view,
+                file_uuid=self.get_uuid(),
+                username=self.get_current_username(),
+                delete_cache=delete_cache,
+                options=self.get_merge_options(),
+            )
+        except Exception as err:
+            self.set_merge_state(FAILED, error=str(err))
+            raise
+        return True
+
+    def get_merge_view(self):
+        """Return the dotted path of the view class the background merge
+        runs. Raise `ImproperlyConfigured` if it cannot be imported, such
+        as a class made within a function.
+        """
+        view_class = type(self)
+        path = self.merge_view or f"{view_class.__module__}.{view_class.__qualname__}"
+        try:
+            found = import_string(path)
+        except ImportError:
+            found = None
+        if self.merge_view is None:
+            valid = found is view_class
+        else:
+            valid = isinstance(found, type) and issubclass(found, MergeAssetView)
+        if not valid:
+            raise ImproperlyConfigured(
+                f"The merge view {path!r} cannot be imported; set `merge_view` "
+                "to the dotted path of a MergeAssetView."
+            )
+        return path
+
+    def get_merge_options(self):
+        return {name: getattr(self, name) for name in self.merge_options}
+
     def perform_all(self, delete_cache=False):
+        """Merge within the current thread. Return True if the upload is
+        merged.
+        """
+        if self.claim_merge():
+            return self.run_merge(delete_cache)
+        return self.get_asset().get("done", False)
+
+    def claim_merge(self):
+        """Flag the merge as queued, so one merge runs per upload whichever
+        worker receives the request. Return False if the upload is merged,
+        merging, or incomplete.
+        """
+        with get_cache().lock(self.get_uuid()):
+            asset = self.get_asset()
+            if asset.get("done") or self.is_merging():
+                return False
+            dir_path = self.resolve_paths()["path"]
+            if dir_path.exists() is False or self.is_complete(asset) is False:
+                print("Incomplete upload", self.get_uuid(), self.missing_chunks)
+                return False
+            self.set_merge_state(QUEUED)
+            return True
+
+    def is_merging(self):
+        """Return True if a merge is queued or running, and has reported
+        within `MERGE_STALE` seconds.
+        """
+        merge = self.get_merge_state()
+        if merge is None or merge["state"] not in (QUEUED, RUNNING):
+            return False
+        return time.time() - merge["updated"] < MERGE_STALE
+
+    def run_merge(self, delete_cache=False):
+        """Merge a claimed upload, recording the progress and result in the
+        session store.
+        """
+        self.set_merge_state(RUNNING)
+        try:
+            asset = self.merge_asset(delete_cache)
+        except Exception as err:
+            self.set_merge_state(FAILED, error=str(err))
+            raise
+        size = asset["output"]["size"]
+        self.set_merge_state(DONE, total=size, written=size)
+        return True
+
+    def merge_asset(self, delete_cache=False):
         asset = self.get_asset()
         perform_asset = self.resolve_paths()
-        asset["input"] = perform_asset
+        asset["input"] = {k: str(v) for k, v in perform_asset.items()}
 
         dir_path = perform_asset["path"]
-
-        if dir_path.exists():
-            output = self.perform(asset, dir_path, out_path)
-            asset["output"] = output
-            if delete_cache:
-                self.delete_cache(asset)
-            return True
-            # return super().form_valid(form)
-        return False
+        out_path = perform_asset["output_path"]
+
+        asset["chunks"] = self.get_manifest().chunks()
+        output = self.perform(asset, dir_path, out_path)
+        asset["output"] = output
+        asset["output_path"] = output["path"]
+        asset["done"] = True
+        asset["verification"] = verify_file(asset)
+        # Flag the manifest as done, so the upload cannot be resumed.
+        self.get_manifest().write_session(asset)
+        if delete_cache:
+            self.delete_cache(asset)
+        self.set_asset(asset)
+        return asset
+
+    def on_progress(self, stats):
+        """Write the `MergeStats` of the running merge to the session store,
+        at most once per `PROGRESS_INTERVAL`.
+        """
+        now = time.monotonic()
+        if stats.finished is None and now - self.progress_written < PROGRESS_INTERVAL:
+            return
+        self.progress_written = now
+        self.set_merge_state(RUNNING, **stats.as_dict())
 
     def resolve_paths(self):
 
@@ -300,19 +955,62 @@ class MergeAssetView(FormView, AssetMixin):
         print("Delete")
         p = Path(asset["input"]["path"])
         if p.exists() and p.is_dir():
-            # scrub it
-            print("Delete", p)
-            deleted = unlink_dir_files(p)
-            asset["deletion"] = deleted
-            receipt = p / "delete-receipt.json"
-            receipt.write_text(json.dumps(deleted, indent=4))
+            # Move it aside at once, and scrub it in the background.
+            trashed = trash(p, self.get_upload_dir())
+            print("Delete", p, trashed)
+            asset["deletion"] = {"path": str(p), "trash": str(trashed)}
+            get_runner().submit("trim.upload_cleanup.purge", path=str(trashed))
         return p.exists() is False
 
+    def is_complete(self, asset):
+        """Return True if every chunk of the asset has arrived. The indices
+        of the `PARTS` chunks not yet received are kept as `missing_chunks`;
+        without a declared `chunk_size` the count is unknown, and the upload
+        is assumed complete.
+        """
+        if asset.get("mode") == INPLACE:
+            return self.get_chunk_map().is_full()
+        self.missing_chunks = self.get_missing_chunks(asset) or []
+        return not self.missing_chunks
+
+    def assemble(self, asset, dir_path, out_path, hasher=None, progress=None):
+        """Produce the final file within `out_path`, returning its path.
+        A given `hasher` receives the bytes of a recombined file as they
+        are written, and `progress` receives its `MergeStats`.
+        """
+        if asset.get("mode") == INPLACE:
+            # The chunks already sit in place, the merge is a rename.
+            target = self.get_target_path(asset)
+            name = target.name[: -len(INPLACE_SUFFIX)]
+            return promote(target, Path(out_path) / name)
+        return recombine(dir_path, out_path, progress=progress, hasher=hasher)
+
+    def get_hashes(self, asset, hasher=None):
+        """Return the file hashes known without reading the output again.
+        `chunks` is a digest of the ordered chunk hashes. `file` is the hash
+        of the whole file, if it was taken during the merge (see
+        `hash_file`).
+        """
+        chunks = asset.get("chunks") or {}
+        digests = [chunks[k]["hash"] for k in sorted(chunks, key=int)]
+        algorithm = self.get_hash_algorithm()
+        return {
+            "algorithm": algorithm,
+            "file": hasher.hexdigest() if hasher is not None else None,
+            "chunks": chunks_digest(digests, algorithm) if digests else None,
+        }
+
     def perform(self, asset, dir_path, out_path):
+        hasher = None
+        if asset.get("mode") != INPLACE and self.get_hash_file():
+            hasher = self.get_hasher()
         try:
-            output_path = recombine(dir_path, out_path)
+            output_path = self.assemble(
+                asset, dir_path, out_path, hasher, progress=self.on_progress
+            )
         except FileExists as err:
             output_path = err.args[0]
+            hasher = None
 
         output_path = Path(output_path)
         fs = self.get_fs()
@@ -323,10 +1021,68 @@ class MergeAssetView(FormView, AssetMixin):
             "size": os.path.getsize(output_path),
             "sub_path": output_path.relative_to(out_path).as_posix(),
             "uuid": self.get_uuid(),
+            "hash": self.get_hashes(asset, hasher),
         }
 
-        result["output_path"] = Path(result["output"]["path"]).as_posix()
-        result["done"] = True
-        result["verification"] = verify_file(result)
-
         return result
+
+
+class AsyncViewMixin(object):
+    """Serve the sync handlers of the view on a worker thread, as an async
+    view under ASGI. Nothing is streamed: Django's ASGI handler reads the
+    whole request body (into memory, or a temporary file past
+    `FILE_UPLOAD_MAX_MEMORY_SIZE`) before the view runs. The form parsing
+    and file writes then run on the thread, so the event loop is not held.
+    """
+
+    # False runs each request on the shared thread pool, rather than the
+    # single thread of sync_to_async, so writes of many uploads overlap.
+    # The DB connections a pool thread opens are closed after each call.
+    thread_sensitive = False
+
+    def to_thread(self, func, *args, **kwargs):
+        if self.thread_sensitive:
+            return sync_to_async(func, thread_sensitive=True)(*args, **kwargs)
+        wrapped = sync_to_async(call_closing, thread_sensitive=False)
+        return wrapped(func, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        return await self.to_thread(super().get, request, *args, **kwargs)
+
+
+class AsyncFormViewMixin(AsyncViewMixin):
+    """The async handlers of a `FormView`."""
+
+    async def post(self, request, *args, **kwargs):
+        return await self.to_thread(super().post, request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        # `FormView.put` calls `self.post`, the coroutine above; run the
+        # sync `post` of the view instead.
+        return await self.to_thread(super().post, request, *args, **kwargs)
+
+
+class AsyncUploadAssetView(AsyncFormViewMixin, UploadAssetView):
+    pass
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncUploadChunkView(AsyncFormViewMixin, UploadChunkView):
+    pass
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncUploadRawChunkView(AsyncFormViewMixin, UploadRawChunkView):
+    pass
+
+
+class AsyncUploadStatusView(AsyncViewMixin, UploadStatusView):
+    pass
+
+
+class AsyncUploadProgressView(AsyncViewMixin, UploadProgressView):
+    pass
+
+
+class AsyncMergeAssetView(AsyncFormViewMixin, MergeAssetView):
+    pass
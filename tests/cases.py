@@ -0,0 +1,19 @@
+"""
+Shared test cases of the django-trim test suite.
+"""
+
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class AuthTablesTestCase(TestCase):
+    """A `TestCase` of the `auth` models (users, groups and permissions).
+
+    The suite runs without a test database (see conftest); the tables of
+    the `auth` app are made on migrate, with their permissions.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        call_command("migrate", "auth", verbosity=0)
+        super().setUpClass()
@@ -0,0 +1,698 @@
+"""
+Test trim.views.download module.
+
+File responses expose the file and range to the server for `sendfile`, and
+iterate large blocks otherwise.
+"""
+
+import asyncio
+import gzip
+import io
+import os
+import unittest
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.utils.http import http_date
+
+from trim.response import content_type_response, offload_path
+from trim.views import download
+from trim.views.download import (
+    LimitedStream,
+    RangeFileWrapper,
+    RangeNotSatisfiable,
+    StreamFileView,
+    TokenBucket,
+    astream,
+    negotiate_encoding,
+    parse_ranges,
+    stream,
+    streamfile_response,
+    streamzip_response,
+)
+
+
+class DownloadTestCase(unittest.TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "movie.mp4"
+        self.path.write_bytes(self.content)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get(self, **headers):
+        return RequestFactory().get("/", headers=headers)
+
+    def body(self, response):
+        try:
+            return b"".join(response.streaming_content)
+        finally:
+            wrapper = getattr(response, "file_to_stream", None)
+            if wrapper is not None:
+                wrapper.close()
+
+
+class RangeFileWrapperTest(DownloadTestCase):
+    def test_iterates_range(self):
+        # Setup
+        wrapper = RangeFileWrapper(
+            download.open_file(self.path), chunk_size=1000, offset=100, length=2500
+        )
+
+        # Execute
+        blocks = list(wrapper)
+        wrapper.close()
+
+        # Assert
+        self.assertEqual([len(b) for b in blocks], [1000, 1000, 500])
+        self.assertEqual(b"".join(blocks), self.content[100:2600])
+
+    def test_file_like(self):
+        # Setup
+        wrapper = RangeFileWrapper(download.open_file(self.path), offset=10, length=20)
+
+        # Execute
+        position = os.lseek(wrapper.fileno(), 0, os.SEEK_CUR)
+        first = wrapper.read(5)
+        rest = wrapper.read()
+        wrapper.close()
+
+        # Assert
+        self.assertEqual(position, 10)
+        self.assertEqual(first + rest, self.content[10:30])
+        self.assertEqual(wrapper.read(), b"")
+        self.assertEqual(wrapper.next, wrapper.__next__)
+
+
+class StreamTest(DownloadTestCase):
+    def test_full_file(self):
+        # Execute
+        response = stream(self.get(), str(self.path))
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertIsInstance(response.file_to_stream, RangeFileWrapper)
+        self.assertEqual(response.block_size, download.BLOCK_SIZE)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_range(self):
+        # Execute
+        response = stream(self.get(Range="bytes=100-199"), str(self.path))
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(
+            response["Content-Range"], f"bytes 100-199/{len(self.content)}"
+        )
+        wrapper = response.file_to_stream
+        self.assertEqual(os.lseek(wrapper.fileno(), 0, os.SEEK_CUR), 100)
+        self.assertEqual(self.body(response), self.content[100:200])
+
+    def test_suffix_range(self):
+        # Execute
+        response = stream(self.get(Range="bytes=-500"), str(self.path))
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[-500:])
+
+    def test_multiple_ranges(self):
+        # Execute
+        response = stream(self.get(Range="bytes=0-9, 20-29"), str(self.path))
+        body = self.body(response)
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        content_type, boundary = response["Content-Type"].split("; boundary=")
+        self.assertEqual(content_type, "multipart/byteranges")
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        parts = body.split(f"--{boundary}".encode())
+        self.assertEqual(parts[0], b"")
+        self.assertEqual(parts[-1], b"--\r\n")
+        size = len(self.content)
+        self.assertEqual(
+            parts[1],
+            b"\r\nContent-Type: video/mp4\r\n"
+            + f"Content-Range: bytes 0-9/{size}\r\n\r\n".encode()
+            + self.content[0:10]
+            + b"\r\n",
+        )
+        self.assertIn(self.content[20:30] + b"\r\n", parts[2])
+
+    def test_not_satisfiable(self):
+        # Execute
+        response = stream(self.get(Range="bytes=99999-"), str(self.path))
+
+        # Assert
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+
+class ConditionalTest(DownloadTestCase):
+    """Validators, 304 responses and If-Range."""
+
+    def validators(self):
+        response = stream(self.get(), str(self.path))
+        self.body(response)
+        return response["ETag"], response["Last-Modified"]
+
+    def test_validators(self):
+        # Execute
+        etag, last_modified = self.validators()
+
+        # Assert
+        st = os.stat(self.path)
+        self.assertEqual(etag, f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"')
+        self.assertEqual(last_modified, http_date(int(st.st_mtime)))
+
+    def test_not_modified(self):
+        # Setup
+        etag, last_modified = self.validators()
+
+        # Execute
+        by_etag = stream(self.get(If_None_Match=etag), str(self.path))
+        by_date = stream(self.get(If_Modified_Since=last_modified), str(self.path))
+        changed = stream(self.get(If_None_Match='"other"'), str(self.path))
+
+        # Assert
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_etag["ETag"], etag)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.body(changed)
+
+    def test_if_range(self):
+        # Setup
+        etag, last_modified = self.validators()
+
+        # Execute
+        current = stream(self.get(Range="bytes=0-9", If_Range=etag), str(self.path))
+        by_date = stream(
+            self.get(Range="bytes=0-9", If_Range=last_modified), str(self.path)
+        )
+        stale = stream(self.get(Range="bytes=0-9", If_Range='"old"'), str(self.path))
+
+        # Assert
+        self.assertEqual(current.status_code, 206)
+        self.assertEqual(self.body(current), self.content[:10])
+        self.assertEqual(by_date.status_code, 206)
+        self.body(by_date)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.body(stale), self.content)
+
+    def test_streamfile_response(self):
+        # Setup
+        etag, last_modified = self.validators()
+
+        # Execute
+        request = self.get(If_None_Match=etag)
+        response = streamfile_response(str(self.path), "out.mp4", request=request)
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn("Content-Disposition", response)
+
+    def test_content_type_response(self):
+        # Setup
+        path = Path(self.tmpdir.name) / "image.png"
+        path.write_bytes(b"png")
+        first = content_type_response(path)
+        first.file_to_stream.close()
+
+        # Execute
+        request = self.get(If_None_Match=first["ETag"])
+        response = content_type_response(path, request=request)
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Last-Modified", first)
+
+
+class OffloadTest(DownloadTestCase):
+    """Responses naming the file for the front server."""
+
+    def offload(self, mode, prefixes=None):
+        return override_settings(
+            DOWNLOAD_OFFLOAD={"MODE": mode, "PREFIXES": prefixes or {}}
+        )
+
+    def test_accel_redirect(self):
+        # Setup
+        prefixes = {self.tmpdir.name: "/protected/"}
+
+        # Execute
+        with self.offload("x-accel-redirect", prefixes):
+            response = streamfile_response(
+                str(self.path), "out.mp4", range_header="bytes=0-9"
+            )
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/movie.mp4")
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertIn("filename=out.mp4", response["Content-Disposition"])
+
+    def test_sendfile(self):
+        # Execute
+        with self.offload("x-sendfile"):
+            response = stream(self.get(), str(self.path))
+
+        # Assert
+        self.assertEqual(response["X-Sendfile"], str(self.path.resolve()))
+
+    def test_unmapped_path_streams(self):
+        # Execute
+        with self.offload("x-accel-redirect", {"/elsewhere/": "/protected/"}):
+            response = stream(self.get(), str(self.path))
+
+        # Assert
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_offload_path(self):
+        prefixes = {"/srv/media/": "/m/", "/srv/media/private/": "/p/"}
+        self.assertEqual(offload_path("/srv/media/a b.mp4", prefixes), "/m/a b.mp4")
+        self.assertEqual(offload_path("/srv/media/private/x", prefixes), "/p/x")
+        self.assertIsNone(offload_path("/srv/mediax/a", prefixes))
+
+    def test_content_type_response(self):
+        # Setup
+        path = Path(self.tmpdir.name) / "image.png"
+        path.write_bytes(b"png")
+
+        # Execute
+        with self.offload("x-accel-redirect", {self.tmpdir.name: "/p/"}):
+            response = content_type_response(path)
+
+        # Assert
+        self.assertEqual(response["X-Accel-Redirect"], "/p/image.png")
+        self.assertEqual(response["Content-Type"], "image/png")
+
+
+class CompressionTest(DownloadTestCase):
+    """Accept-Encoding negotiation of whole downloads."""
+
+    content = b"trim " * 2000
+
+    def setUp(self):
+        super().setUp()
+        compression = {"TYPES": ["text/*"], "MIN_SIZE": 100}
+        settings = override_settings(DOWNLOAD_COMPRESSION=compression)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.path = Path(self.tmpdir.name) / "notes.txt"
+        self.path.write_bytes(self.content)
+
+    def test_gzip_on_the_fly(self):
+        # Execute
+        response = stream(self.get(accept_encoding="gzip, deflate"), str(self.path))
+
+        # Assert
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertTrue(response["ETag"].startswith("W/"))
+        self.assertNotIn("Content-Length", response)
+        self.assertEqual(gzip.decompress(self.body(response)), self.content)
+
+    def test_gzip_not_modified(self):
+        # Setup
+        first = stream(self.get(accept_encoding="gzip"), str(self.path))
+        self.body(first)
+
+        # Execute
+        response = stream(
+            self.get(accept_encoding="gzip", if_none_match=first["ETag"]),
+            str(self.path),
+        )
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+
+    def test_precompressed_sibling(self):
+        # Setup
+        Path(f"{self.path}.br").write_bytes(b"brotli bytes")
+        Path(f"{self.path}.gz").write_bytes(gzip.compress(self.content))
+
+        # Execute
+        response = stream(self.get(accept_encoding="gzip, br"), str(self.path))
+
+        # Assert
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(response["Content-Length"], "12")
+        self.assertEqual(self.body(response), b"brotli bytes")
+
+    def test_stale_sibling_is_skipped(self):
+        # Setup
+        sibling = Path(f"{self.path}.br")
+        sibling.write_bytes(b"old")
+        st = os.stat(self.path)
+        os.utime(sibling, ns=(st.st_atime_ns, st.st_mtime_ns - 10**9))
+
+        # Execute
+        response = stream(self.get(accept_encoding="br"), str(self.path))
+
+        # Assert
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_range_is_identity(self):
+        # Execute
+        response = stream(
+            self.get(accept_encoding="gzip", range="bytes=0-9"), str(self.path)
+        )
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(self.body(response), self.content[:10])
+
+    def test_type_not_allowed(self):
+        # Setup
+        path = Path(self.tmpdir.name) / "movie.mp4"
+        path.write_bytes(self.content)
+
+        # Execute
+        response = stream(self.get(accept_encoding="gzip"), str(path))
+
+        # Assert
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding("gzip, br", ["br", "gzip"]), "br")
+        self.assertEqual(negotiate_encoding("br;q=0.5, gzip", ["br", "gzip"]), "gzip")
+        self.assertEqual(negotiate_encoding("*", ["gzip"]), "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0", ["gzip"]))
+        self.assertIsNone(negotiate_encoding("identity", ["gzip"]))
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_burst_then_rate(self):
+        # Setup
+        bucket = TokenBucket(1000, burst=500, clock=self.clock, sleep=self.sleep)
+
+        # Execute
+        bucket.consume(500)
+        bucket.consume(250)
+        bucket.consume(1000)
+
+        # Assert
+        self.assertEqual(self.slept, [0.25, 1.0])
+
+    def test_idle_refill_is_capped(self):
+        # Setup
+        bucket = TokenBucket(1000, clock=self.clock, sleep=self.sleep)
+
+        # Execute
+        self.now += 60
+        bucket.consume(1500)
+
+        # Assert
+        self.assertEqual(self.slept, [0.5])
+
+    def test_stream_is_sliced_and_paced(self):
+        # Setup
+        bucket = TokenBucket(100, clock=self.clock, sleep=self.sleep)
+        released = []
+
+        # Execute
+        body = list(LimitedStream([b"a" * 250], [bucket], lambda: released.append(1)))
+
+        # Assert
+        self.assertEqual(body, [b"a" * 100, b"a" * 100, b"a" * 50])
+        self.assertEqual(self.slept, [1.0, 0.5])
+        self.assertEqual(released, [1])
+
+    def test_async_stream_awaits_pauses(self):
+        """No thread sleeps while an async body is paced."""
+        # Setup
+        bucket = TokenBucket(100, clock=self.clock, sleep=self.fail)
+        released = []
+        limited = LimitedStream([b"a" * 250], [bucket], lambda: released.append(1))
+        awaited = []
+
+        async def fake_sleep(seconds):
+            awaited.append(seconds)
+            self.now += seconds
+
+        async def collect_body():
+            return [x async for x in limited.aiter()]
+
+        # Execute
+        with mock.patch.object(download.asyncio, "sleep", fake_sleep):
+            body = asyncio.run(collect_body())
+
+        # Assert
+        self.assertEqual(body, [b"a" * 100, b"a" * 100, b"a" * 50])
+        self.assertEqual(awaited, [1.0, 0.5])
+        self.assertEqual(released, [1])
+
+
+class LimitsTest(DownloadTestCase):
+    """Concurrent download slots and pacing of `DOWNLOAD_LIMITS`."""
+
+    def setUp(self):
+        super().setUp()
+        limits = {"USER_STREAMS": 1, "CACHE": "limits"}
+        settings = override_settings(
+            DOWNLOAD_LIMITS=limits,
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "limits": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "download-limits",
+                },
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_user_limit(self):
+        # Setup
+        first = stream(self.get(), str(self.path))
+
+        # Execute
+        second = stream(self.get(), str(self.path))
+
+        # Assert
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second["Retry-After"], "10")
+
+    def test_slot_released_at_end(self):
+        # Setup
+        first = stream(self.get(), str(self.path))
+        self.body(first)
+
+        # Execute
+        second = stream(self.get(), str(self.path))
+
+        # Assert
+        self.assertEqual(second.status_code, 200)
+        self.body(second)
+
+    def test_other_user_allowed(self):
+        # Setup
+        first = stream(self.get(), str(self.path))
+
+        # Execute
+        request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.2")
+        second = stream(request, str(self.path))
+
+        # Assert
+        self.assertEqual(second.status_code, 200)
+        self.body(first)
+        self.body(second)
+
+    def test_paced_response_skips_sendfile(self):
+        # Setup
+        limits = {"RATE": 10**9}
+
+        # Execute
+        with override_settings(DOWNLOAD_LIMITS=limits):
+            response = stream(self.get(), str(self.path))
+            wrapper_free = response.file_to_stream is None
+            content = b"".join(response.streaming_content)
+
+        # Assert
+        self.assertTrue(wrapper_free)
+        self.assertEqual(content, self.content)
+
+    def test_async_paced_response(self):
+        # Setup
+        request = AsyncRequestFactory().get("/")
+
+        # Execute
+        with override_settings(DOWNLOAD_LIMITS={"RATE": 10**9}):
+            response = async_to_sync(astream)(request, str(self.path))
+            content = async_to_sync(collect)(response)
+
+        # Assert
+        self.assertTrue(response.is_async)
+        self.assertEqual(content, self.content)
+
+
+class ParseRangesTest(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_ranges("bytes=0-99", 1000), [(0, 99)])
+        self.assertEqual(parse_ranges("bytes=500-", 1000), [(500, 999)])
+        self.assertEqual(parse_ranges("bytes=-100", 1000), [(900, 999)])
+        self.assertEqual(parse_ranges("bytes=-5000", 1000), [(0, 999)])
+        self.assertEqual(parse_ranges("bytes=990-2000", 1000), [(990, 999)])
+
+    def test_coalesce(self):
+        self.assertEqual(
+            parse_ranges("bytes=0-99,50-150,-100", 1000), [(0, 150), (900, 999)]
+        )
+        self.assertEqual(parse_ranges("bytes=10-19,0-9", 1000), [(0, 19)])
+
+    def test_ignored(self):
+        for header in (None, "", "items=0-1", "bytes=", "bytes=5-1", "bytes=a-b"):
+            self.assertIsNone(parse_ranges(header, 1000), header)
+        many = "bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(100))
+        self.assertIsNone(parse_ranges(many, 1000))
+
+    def test_not_satisfiable(self):
+        # An unsatisfiable range is dropped, unless none remain.
+        self.assertEqual(parse_ranges("bytes=0-1,5000-", 1000), [(0, 1)])
+        for header in ("bytes=1000-", "bytes=-0"):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_ranges(header, 1000)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_ranges("bytes=-10", 0)
+
+
+class StreamFileResponseTest(DownloadTestCase):
+    def test_attachment(self):
+        # Execute
+        response = streamfile_response(str(self.path), "out.mp4")
+
+        # Assert
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertIn("filename=out.mp4", response["Content-Disposition"])
+        self.assertEqual(self.body(response), self.content)
+
+    def test_range(self):
+        # Execute
+        response = streamfile_response(
+            str(self.path), "out.mp4", range_header="bytes=10-"
+        )
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], str(len(self.content) - 10))
+        self.assertEqual(self.body(response), self.content[10:])
+
+
+class StreamZipResponseTest(DownloadTestCase):
+    def test_archive(self):
+        # Setup
+        notes = Path(self.tmpdir.name) / "notes.txt"
+        notes.write_bytes(b"trim " * 1000)
+
+        # Execute
+        response = streamzip_response(
+            [self.path, (notes, "docs/notes.txt")], "bundle.zip", chunk_size=1000
+        )
+        blocks = list(response.streaming_content)
+
+        # Assert
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn("filename=bundle.zip", response["Content-Disposition"])
+        self.assertNotIn("Content-Length", response)
+        self.assertTrue(all(blocks))
+        with zipfile.ZipFile(io.BytesIO(b"".join(blocks))) as archive:
+            self.assertIsNone(archive.testzip())
+            movie = archive.getinfo("movie.mp4")
+            text = archive.getinfo("docs/notes.txt")
+            self.assertEqual(archive.read(movie), self.content)
+            self.assertEqual(archive.read(text), b"trim " * 1000)
+        self.assertEqual(movie.compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(text.compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(text.compress_size, text.file_size)
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            streamzip_response([Path(self.tmpdir.name) / "nope.txt"], "a.zip")
+
+
+async def collect(response):
+    return b"".join([x async for x in response.streaming_content])
+
+
+class AsyncStreamTest(DownloadTestCase):
+    """Async bodies under ASGI."""
+
+    def view(self, path, **initkwargs):
+        class View(StreamFileView):
+            def get_path(self):
+                return path
+
+        return View.as_view(**initkwargs)
+
+    def test_astream(self):
+        # Setup
+        request = AsyncRequestFactory().get("/", headers={"range": "bytes=10-19"})
+
+        # Execute
+        response = async_to_sync(astream)(request, str(self.path))
+        content = async_to_sync(collect)(response)
+        response.file_to_stream.close()
+
+        # Assert
+        self.assertTrue(response.is_async)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.content[10:20])
+
+    def test_view_async_under_asgi(self):
+        # Execute
+        response = self.view(self.path)(AsyncRequestFactory().get("/"))
+        content = async_to_sync(collect)(response)
+        response.file_to_stream.close()
+
+        # Assert
+        self.assertTrue(response.is_async)
+        self.assertIn("filename=movie.mp4", response["Content-Disposition"])
+        self.assertEqual(content, self.content)
+
+    def test_view_sync_under_wsgi(self):
+        # Execute
+        response = self.view(self.path, attachment=False)(self.get())
+
+        # Assert
+        self.assertFalse(response.is_async)
+        self.assertNotIn("Content-Disposition", response)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_view_without_path(self):
+        with self.assertRaises(ImproperlyConfigured):
+            StreamFileView.as_view()(self.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
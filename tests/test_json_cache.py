@@ -0,0 +1,157 @@
+"""
+Test trim.views.json_cache module.
+
+Cached JSON bodies are served without a query until a row of the model
+changes.
+"""
+
+import json
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.test import RequestFactory
+
+from tests.cases import AuthTablesTestCase
+from trim.views import JsonDetailView, JsonListView
+from trim.views.json_cache import invalidate
+
+
+class CachedGroupListView(JsonListView):
+    model = Group
+    fields = ("id", "name")
+    cache_response = True
+
+
+class CachedGroupDetailView(JsonDetailView):
+    model = Group
+    fields = ("id", "name")
+    cache_response = True
+
+
+class GroupListView(JsonListView):
+    model = Group
+
+
+class JsonCacheTestCase(AuthTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.groups = [Group.objects.create(name=f"group-{i}") for i in range(3)]
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def get(self, view_class, path="/", headers=None, **kwargs):
+        request = RequestFactory().get(path, **(headers or {}))
+        return view_class.as_view()(request, **kwargs)
+
+    def names(self, response):
+        return [x["name"] for x in json.loads(response.content)["object_list"]]
+
+
+class ListCacheTest(JsonCacheTestCase):
+    def test_cached(self):
+        # Setup
+        first = self.get(CachedGroupListView)
+
+        # Execute
+        with self.assertNumQueries(0):
+            second = self.get(CachedGroupListView)
+
+        # Assert
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_save_invalidates(self):
+        # Setup
+        self.get(CachedGroupListView)
+
+        # Execute
+        Group.objects.create(name="group-new")
+        response = self.get(CachedGroupListView)
+
+        # Assert
+        self.assertIn("group-new", self.names(response))
+
+    def test_delete_invalidates(self):
+        # Setup
+        self.get(CachedGroupListView)
+
+        # Execute
+        Group.objects.get(name="group-0").delete()
+        response = self.get(CachedGroupListView)
+
+        # Assert
+        self.assertNotIn("group-0", self.names(response))
+
+    def test_querystring_keys(self):
+        # Setup
+        self.get(CachedGroupListView, "/?page=1")
+
+        # Execute
+        with self.assertNumQueries(0):
+            self.get(CachedGroupListView, "/?page=1")
+        with self.assertNumQueries(1):
+            self.get(CachedGroupListView, "/?page=2")
+
+    def test_m2m_change_invalidates(self):
+        # Setup
+        first = self.get(CachedGroupListView)
+
+        # Execute
+        self.groups[0].permissions.add(Permission.objects.first())
+        with self.assertNumQueries(1):
+            second = self.get(CachedGroupListView)
+
+        # Assert
+        self.assertEqual(second.content, first.content)
+
+    def test_manual_invalidate(self):
+        """`QuerySet.update()` sends no signal."""
+        # Setup
+        self.get(CachedGroupListView)
+        Group.objects.filter(name="group-1").update(name="group-renamed")
+
+        # Execute
+        invalidate(Group)
+        response = self.get(CachedGroupListView)
+
+        # Assert
+        self.assertIn("group-renamed", self.names(response))
+
+    def test_not_modified(self):
+        # Setup
+        etag = self.get(CachedGroupListView)["ETag"]
+
+        # Execute
+        response = self.get(CachedGroupListView, headers={"HTTP_IF_NONE_MATCH": etag})
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_uncached_view(self):
+        # Execute
+        response = self.get(GroupListView)
+
+        # Assert
+        self.assertFalse(response.has_header("ETag"))
+
+
+class DetailCacheTest(JsonCacheTestCase):
+    def test_object_invalidates_its_own_key(self):
+        # Setup
+        one, two = self.groups[:2]
+        self.get(CachedGroupDetailView, pk=one.pk)
+        self.get(CachedGroupDetailView, pk=two.pk)
+
+        # Execute
+        two.name = "group-changed"
+        two.save()
+
+        # Assert
+        with self.assertNumQueries(0):
+            self.get(CachedGroupDetailView, pk=one.pk)
+        with self.assertNumQueries(1):
+            response = self.get(CachedGroupDetailView, pk=two.pk)
+        data = json.loads(response.content)
+        self.assertEqual(data["object"]["name"], "group-changed")
@@ -0,0 +1,184 @@
+"""
+Test trim.views.keyset module.
+
+Pages are found by the ordering keys of a signed cursor, in one query each.
+"""
+
+import json
+
+from django.contrib.auth.models import Group
+from django.core import signing
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.utils.http import urlencode
+
+from tests.cases import AuthTablesTestCase
+from trim.views import JsonListView, OrderPaginatedListView
+from trim.views.keyset import InvalidCursor, KeysetPaginator
+
+
+class KeysetTestCase(AuthTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Names repeat, so the pk orders rows of equal keys.
+        Group.objects.bulk_create(
+            [Group(name=f"group-{i % 7:02}-{i:02}") for i in range(23)]
+        )
+
+
+class KeysetPaginatorTest(KeysetTestCase):
+    def walk(self, paginator):
+        pages = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = paginator.page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_forward(self):
+        # Setup
+        paginator = KeysetPaginator(Group.objects.all(), 10, "-name")
+        expected = list(Group.objects.order_by("-name", "pk"))
+
+        # Execute
+        pages = self.walk(paginator)
+
+        # Assert
+        self.assertEqual([len(x) for x in pages], [10, 10, 3])
+        self.assertEqual([x for page in pages for x in page], expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+
+    def test_backward(self):
+        # Setup
+        paginator = KeysetPaginator(Group.objects.all(), 10, ["name"])
+        pages = self.walk(paginator)
+
+        # Execute
+        previous = paginator.page(pages[2].previous_cursor)
+        first = paginator.page(previous.previous_cursor)
+
+        # Assert
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_tampered_cursor(self):
+        # Setup
+        paginator = KeysetPaginator(Group.objects.all(), 10, "name")
+        cursor = paginator.page().next_cursor
+
+        # Execute & Assert
+        with self.assertRaises(InvalidCursor):
+            paginator.page(cursor[:-2] + "xx")
+        forged = signing.dumps({"o": ["name", "pk"], "v": ["a", 1], "d": "n"})
+        with self.assertRaises(InvalidCursor):
+            paginator.page(forged)
+
+    def test_cursor_of_other_ordering(self):
+        # Setup
+        cursor = KeysetPaginator(Group.objects.all(), 10, "name").page().next_cursor
+
+        # Execute & Assert
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Group.objects.all(), 10, "-name").page(cursor)
+
+    def test_ordering_keeps_pk(self):
+        self.assertEqual(
+            KeysetPaginator(Group.objects.all(), 10, "-id").ordering, ["-id"]
+        )
+        self.assertEqual(
+            KeysetPaginator(Group.objects.all(), 10, "name").ordering, ["name", "pk"]
+        )
+
+
+class GroupListView(OrderPaginatedListView):
+    model = Group
+    keyset_pagination = True
+    paginate_by = 10
+    default_orderby = "name"
+    ordering_fields = (("name", ("Name", "name")),)
+
+
+class OrderPaginatedListViewTest(KeysetTestCase):
+    def paginate(self, **params):
+        view = GroupListView()
+        view.setup(RequestFactory().get("/", params))
+        queryset = view.get_queryset()
+        return view.paginate_queryset(queryset, view.get_paginate_by(queryset))
+
+    def test_pages(self):
+        # Execute
+        paginator, first, rows, is_paginated = self.paginate(direction="desc")
+        _, second, _, _ = self.paginate(direction="desc", cursor=first.next_cursor)
+
+        # Assert
+        self.assertTrue(is_paginated)
+        self.assertEqual(paginator.ordering, ["-name", "pk"])
+        names = [x.name for x in list(first) + list(second)]
+        self.assertEqual(names, sorted(names, reverse=True))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.paginate(cursor="nope")
+
+    def render_buttons(self, template_name, **params):
+        request = RequestFactory().get("/", {"order_by": "name", **params})
+        view = GroupListView()
+        view.setup(request)
+        queryset = view.get_queryset()
+        _, page, rows, _ = view.paginate_queryset(queryset, 10)
+        context = {"page_obj": page, "object_list": rows}
+        return page, render_to_string(template_name, context, request=request)
+
+    def test_page_buttons(self):
+        # Setup
+        first, html = self.render_buttons("trim/page-buttons.html")
+
+        # Execute
+        _, second_html = self.render_buttons(
+            "trim/page-buttons.html", cursor=first.next_cursor
+        )
+
+        # Assert
+        cursor = urlencode({"cursor": first.next_cursor})
+        self.assertIn(f'href="?order_by=name&amp;{cursor}">next', html)
+        self.assertNotIn("previous", html)
+        self.assertNotIn("page=", html)
+        self.assertNotIn("None", html)
+        self.assertIn('href="?order_by=name">&laquo; first', second_html)
+
+    def test_paginate_buttons(self):
+        # Execute
+        page, html = self.render_buttons("trim/paginate-buttons.html")
+
+        # Assert
+        self.assertIn(urlencode({"cursor": page.next_cursor}), html)
+        self.assertNotIn("pageClick(None)", html)
+        self.assertNotIn("of None", html)
+
+
+class JsonKeysetTest(KeysetTestCase):
+    def get(self, **params):
+        view = JsonListView.as_view(
+            model=Group, fields=("id", "name"), keyset_pagination=True, paginate_by=10
+        )
+        return json.loads(view(RequestFactory().get("/", params)).content)
+
+    def test_pages(self):
+        # Execute
+        with self.assertNumQueries(1):
+            first = self.get()
+        second = self.get(cursor=first["next"])
+
+        # Assert
+        self.assertNotIn("count", first)
+        self.assertIsNone(first["previous"])
+        ids = [x["id"] for x in first["object_list"] + second["object_list"]]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 20)
@@ -4,11 +4,28 @@ Test trim.merge module.
 Simple tests for file merging utility.
 """
 
+import hashlib
 import unittest
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-from trim.merge import FileExists, recombine, split_i
+from trim import merge
+from trim.merge import (
+    ChunkManifest,
+    ChunkMap,
+    FileExists,
+    MergeStats,
+    chunk_count,
+    chunks_digest,
+    copy_range,
+    create_sparse,
+    is_part,
+    promote,
+    recombine,
+    split_i,
+    write_at,
+)
 
 
 class SplitITest(unittest.TestCase):
@@ -90,6 +107,187 @@ class RecombineTest(unittest.TestCase):
             with self.assertRaises(FileExists):
                 recombine(tmppath)
 
+    def test_ignores_non_part_files(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            tmppath = Path(tmpdir)
+            (tmppath / "testfile.part_0").write_bytes(b"abc")
+            (tmppath / "delete-receipt.json").write_bytes(b"{}")
+            out = tmppath / "out"
+            out.mkdir()
+
+            # Execute
+            output = recombine(tmppath, out)
+
+            # Assert
+            self.assertEqual(output.read_bytes(), b"abc")
+
+    def test_reports_progress(self):
+        # Setup
+        seen = []
+        with TemporaryDirectory() as tmpdir:
+            tmppath = Path(tmpdir)
+            (tmppath / "testfile.part_0").write_bytes(b"a" * 10)
+            (tmppath / "testfile.part_1").write_bytes(b"b" * 5)
+
+            # Execute
+            recombine(tmppath, progress=lambda s: seen.append(s.as_dict()))
+
+        # Assert
+        self.assertEqual(seen[-1]["written"], 15)
+        self.assertEqual(seen[-1]["total"], 15)
+        self.assertTrue(seen[-1]["done"])
+
+    def test_hashes_while_writing(self):
+        # Setup
+        hasher = hashlib.sha256()
+        with TemporaryDirectory() as tmpdir:
+            tmppath = Path(tmpdir)
+            (tmppath / "testfile.part_0").write_bytes(b"Hello ")
+            (tmppath / "testfile.part_1").write_bytes(b"World")
+
+            # Execute
+            recombine(tmppath, hasher=hasher, buffer_size=4)
+
+        # Assert
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(b"Hello World").hexdigest())
+
+    def test_buffered_fallback(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            tmppath = Path(tmpdir)
+            (tmppath / "testfile.part_0").write_bytes(b"x" * 1000)
+            (tmppath / "testfile.part_1").write_bytes(b"y" * 999)
+
+            # Execute - a tiny buffer without the kernel copy calls.
+            with patch.object(merge, "_copy_file_range", None), patch.object(
+                merge, "_sendfile", None
+            ):
+                output = recombine(tmppath, buffer_size=64)
+
+            # Assert
+            self.assertEqual(output.read_bytes(), b"x" * 1000 + b"y" * 999)
+
+
+class CopyRangeTest(unittest.TestCase):
+    """Test the copy_range engine."""
+
+    def test_copies_count_from_position(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            dst = Path(tmpdir) / "dst"
+            src.write_bytes(b"0123456789")
+
+            # Execute
+            with open(src, "rb") as r, open(dst, "wb") as w:
+                r.seek(2)
+                count = copy_range(r.fileno(), w.fileno(), 5)
+
+            # Assert
+            self.assertEqual(count, 5)
+            self.assertEqual(dst.read_bytes(), b"23456")
+
+
+class IsPartTest(unittest.TestCase):
+    """Test is_part helper function."""
+
+    def test_part_names(self):
+        self.assertTrue(is_part("file.zip.part_3"))
+        self.assertFalse(is_part("file.zip"))
+        self.assertFalse(is_part("file.part_x"))
+
+
+class MergeStatsTest(unittest.TestCase):
+    """Test MergeStats counters."""
+
+    def test_eta_unknown_without_progress(self):
+        # Setup
+        stats = MergeStats(100)
+
+        # Assert
+        self.assertIsNone(stats.eta)
+        self.assertEqual(stats.as_dict()["written"], 0)
+
+
+class InplaceTest(unittest.TestCase):
+    """Test in-place assembly helpers."""
+
+    def test_write_at_offsets(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            target = create_sparse(Path(tmpdir) / "target", 6)
+
+            # Execute
+            write_at(target, 3, (b"de", b"f"))
+            write_at(target, 0, (b"abc",))
+
+            # Assert
+            self.assertEqual(target.read_bytes(), b"abcdef")
+
+    def test_chunk_map(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            chunk_map = ChunkMap(Path(tmpdir) / "chunks.map", 3).create()
+
+            # Execute
+            chunk_map.mark(2)
+            chunk_map.mark(0)
+
+            # Assert
+            self.assertEqual(chunk_map.received(), [0, 2])
+            self.assertEqual(chunk_map.missing(), [1])
+            self.assertFalse(chunk_map.is_full())
+            chunk_map.mark(1)
+            self.assertTrue(ChunkMap(chunk_map.filepath).is_full())
+
+    def test_chunk_map_rejects_bad_index(self):
+        with TemporaryDirectory() as tmpdir:
+            chunk_map = ChunkMap(Path(tmpdir) / "chunks.map", 2).create()
+            with self.assertRaises(IndexError):
+                chunk_map.mark(2)
+
+    def test_promote_refuses_existing(self):
+        with TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "a"
+            src.write_bytes(b"a")
+            (Path(tmpdir) / "b").write_bytes(b"b")
+            with self.assertRaises(FileExists):
+                promote(src, Path(tmpdir) / "b")
+
+    def test_chunks_digest(self):
+        # Setup
+        digests = [hashlib.sha256(x).hexdigest() for x in (b"a", b"b")]
+        joined = hashlib.sha256(b"a").digest() + hashlib.sha256(b"b").digest()
+
+        # Execute & Assert
+        self.assertEqual(chunks_digest(digests), hashlib.sha256(joined).hexdigest())
+
+    def test_manifest_records(self):
+        # Setup
+        with TemporaryDirectory() as tmpdir:
+            manifest = ChunkManifest(Path(tmpdir) / "manifest.jsonl")
+            manifest.write_session({"bytesize": 10})
+            manifest.add_chunk(1, 4, "aa")
+            manifest.add_chunk(0, 4, "bb", verified=True)
+            manifest.add_chunk(1, 4, "cc", verified=True)
+            with open(manifest.filepath, "ab") as stream:
+                stream.write(b'{"chunk": 2, "si')
+
+            # Execute
+            session, chunks = manifest.read()
+
+        # Assert
+        self.assertEqual(session, {"bytesize": 10})
+        self.assertEqual(sorted(chunks), ["0", "1"])
+        self.assertEqual(chunks["1"]["hash"], "cc")
+        self.assertTrue(chunks["0"]["verified"])
+
+    def test_chunk_count(self):
+        self.assertEqual(chunk_count(10, 4), 3)
+        self.assertEqual(chunk_count(8, 4), 2)
+        self.assertEqual(chunk_count(0, 4), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,186 @@
+"""
+Test trim.views.planner module.
+
+The relations read by a view are loaded with the rows, rather than a query
+per row.
+"""
+
+import io
+import json
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from tests.cases import AuthTablesTestCase
+from trim.views import JsonListView, crud
+from trim.views.planner import QueryPlan, plan, plan_queryset, plan_report
+
+
+class PlannerTestCase(AuthTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        permissions = list(Permission.objects.all()[:6])
+        for i in range(5):
+            group = Group.objects.create(name=f"group-{i}")
+            group.permissions.set(permissions[i:])
+
+
+class PlanTest(PlannerTestCase):
+    def test_all_fields(self):
+        # Execute
+        res = plan(Permission)
+        many = plan(Group, many=True)
+
+        # Assert
+        self.assertEqual(res, QueryPlan(["content_type"], [], None))
+        self.assertEqual(many, QueryPlan([], ["permissions"], None))
+
+    def test_named_fields(self):
+        # Execute
+        res = plan(Permission, ["name", "content_type__model"])
+        column = plan(Permission, ["name", "content_type_id"])
+
+        # Assert
+        self.assertEqual(res.select_related, ["content_type"])
+        self.assertEqual(res.only, ["name", "content_type__model"])
+        self.assertEqual(column, QueryPlan([], [], ["name", "content_type_id"]))
+
+    def test_many_fields(self):
+        # Execute
+        res = plan(Group, ["name", "permissions__content_type__model"])
+
+        # Assert
+        self.assertEqual(res.select_related, [])
+        self.assertEqual(res.prefetch_related, ["permissions__content_type"])
+        self.assertEqual(res.only, ["name"])
+
+    def test_unknown_name_reads_all_columns(self):
+        """A property may read any column, so none are deferred."""
+        # Execute
+        res = plan(Permission, ["natural_key", "content_type"])
+
+        # Assert
+        self.assertEqual(res.select_related, ["content_type"])
+        self.assertIsNone(res.only)
+
+    def test_relation_loads_all_columns(self):
+        # Execute
+        res = plan(Permission, ["content_type", "content_type__model"])
+
+        # Assert
+        self.assertEqual(res.only, ["content_type"])
+
+    def test_values_queryset_is_kept(self):
+        # Setup
+        queryset = Permission.objects.values("name")
+
+        # Execute
+        res = plan_queryset(queryset, ["content_type__model"])
+
+        # Assert
+        self.assertIs(res, queryset)
+
+
+class PlanReportTest(PlannerTestCase):
+    def test_report(self):
+        # Setup
+        queryset = Permission.objects.order_by("pk")[:10]
+
+        # Execute
+        report = plan_report(queryset, ["name", "content_type__model"])
+
+        # Assert
+        self.assertEqual(report.rows, 10)
+        self.assertEqual(report.before, 11)
+        self.assertEqual(report.after, 1)
+        self.assertIn("11 queries before, 1 after", str(report))
+
+    def test_report_many(self):
+        # Execute
+        report = plan_report(Group.objects.all(), many=True)
+
+        # Assert
+        self.assertEqual(report.before, 6)
+        self.assertEqual(report.after, 2)
+        self.assertEqual(report.as_dict()["prefetch_related"], ["permissions"])
+
+    def test_command(self):
+        # Setup
+        out = io.StringIO()
+
+        # Execute
+        call_command(
+            "query_plan", "auth.Permission", "--fields=content_type", stdout=out
+        )
+
+        # Assert
+        self.assertIn("queries before, 1 after", out.getvalue())
+
+
+class CrudPlanTest(PlannerTestCase):
+    def test_generated_views(self):
+        # Setup
+        views = crud(
+            Permission,
+            class_module_name=__name__,
+            success_url="/",
+            plan_fields=["name", "content_type__model"],
+        )
+        list_view, create_view = views[0](), views[1]()
+        list_view.setup(RequestFactory().get("/"))
+        create_view.setup(RequestFactory().get("/"))
+
+        # Execute
+        queryset = list_view.get_queryset()
+
+        # Assert
+        self.assertEqual(queryset.query.select_related, {"content_type": {}})
+        with self.assertNumQueries(1):
+            names = [x.content_type.model for x in queryset]
+        self.assertEqual(len(names), Permission.objects.count())
+        self.assertIs(create_view.get_queryset().query.select_related, False)
+
+
+class PermissionListView(JsonListView):
+    model = Permission
+    fields = ("name", "content_type__model")
+
+    def get_dump_object(self, obj):
+        return {"name": obj.name, "model": obj.content_type.model}
+
+
+class GroupListView(JsonListView):
+    model = Group
+
+    def get_dump_object(self, obj):
+        return {"name": obj.name}
+
+
+class JsonPlanTest(PlannerTestCase):
+    def render(self, view_class, **initkwargs):
+        view = view_class.as_view(**initkwargs)
+        return view(RequestFactory().get("/"))
+
+    def test_select_related(self):
+        # Execute
+        with self.assertNumQueries(1):
+            response = self.render(PermissionListView)
+
+        # Assert
+        data = json.loads(response.content)
+        self.assertEqual(data["count"], Permission.objects.count())
+
+    def test_serializer_prefetch(self):
+        """The serializer reads the permissions of each group."""
+        # Execute
+        with self.assertNumQueries(2):
+            response = self.render(GroupListView)
+
+        # Assert
+        self.assertEqual(len(json.loads(response.content)["object_list"]), 5)
+
+    def test_opt_out(self):
+        # Execute
+        with self.assertNumQueries(6):
+            self.render(GroupListView, query_plan=False)
@@ -0,0 +1,244 @@
+"""
+Test trim.response module.
+
+Files served from an LRU cache of memory mappings, and the shared cache of
+file metadata.
+"""
+
+import mimetypes
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.http import FileResponse
+from django.test import override_settings
+
+from trim import response as trim_response
+from trim.response import (
+    FileMetaCache,
+    MappedFileCache,
+    content_data_response,
+    content_type_response,
+)
+
+
+class MappedFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, data):
+        path = self.root / name
+        path.write_bytes(data)
+        return path
+
+    def test_hit_and_miss(self):
+        # Setup
+        cache = MappedFileCache(max_bytes=100)
+        path = self.write("a.png", b"a" * 10)
+
+        # Execute
+        first = cache.get(path)
+        second = cache.get(path)
+
+        # Assert
+        self.assertEqual(bytes(first), b"a" * 10)
+        self.assertIs(first, second)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_changed_file_is_mapped_again(self):
+        # Setup
+        cache = MappedFileCache(max_bytes=100)
+        path = self.write("a.png", b"a" * 10)
+        old = cache.get(path)
+
+        # Execute - replace the file, as a writer should.
+        replacement = self.write("a.tmp", b"b" * 12)
+        os.replace(replacement, path)
+        new = cache.get(path)
+
+        # Assert
+        self.assertEqual(bytes(old), b"a" * 10)
+        self.assertEqual(bytes(new), b"b" * 12)
+        self.assertEqual(cache.size, 12)
+
+    def test_budget_evicts_least_recent(self):
+        # Setup
+        cache = MappedFileCache(max_bytes=25)
+        a = self.write("a", b"a" * 10)
+        b = self.write("b", b"b" * 10)
+        c = self.write("c", b"c" * 10)
+
+        # Execute
+        cache.get(a)
+        cache.get(b)
+        cache.get(a)
+        cache.get(c)
+
+        # Assert
+        self.assertEqual(list(cache.entries), [str(a), str(c)])
+        self.assertEqual(cache.size, 20)
+
+    def test_uncacheable(self):
+        # Setup
+        cache = MappedFileCache(max_bytes=100, max_file_size=5)
+
+        # Assert
+        self.assertIsNone(cache.get(self.write("big", b"x" * 6)))
+        self.assertIsNone(cache.get(self.write("empty", b"")))
+        self.assertEqual(cache.size, 0)
+
+
+class MappedResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "doc.pdf"
+        self.path.write_bytes(b"%PDF-1.4 data")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @override_settings(RESPONSE_MMAP_CACHE={"MAX_BYTES": 1024})
+    def test_content_type_response(self):
+        # Execute
+        response = content_type_response(self.path)
+
+        # Assert
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(b"".join(response.streaming_content), b"%PDF-1.4 data")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Content-Length"], "13")
+        self.assertIn("ETag", response)
+
+    @override_settings(RESPONSE_MMAP_CACHE={"MAX_BYTES": 1024})
+    def test_content_data_response_path(self):
+        # Execute
+        response = content_data_response(self.path, "out.pdf")
+
+        # Assert
+        self.assertEqual(b"".join(response.streaming_content), b"%PDF-1.4 data")
+        self.assertEqual(response["Content-Disposition"], "filename=out.pdf")
+
+    @override_settings(RESPONSE_MMAP_CACHE={"MAX_BYTES": 1024})
+    def test_content_data_response_str_is_data(self):
+        # Execute
+        response = content_data_response("hello world", "a.txt")
+
+        # Assert
+        self.assertEqual(b"".join(response.streaming_content), b"hello world")
+
+    @override_settings(RESPONSE_MMAP_CACHE={"MAX_BYTES": 1024 * 1024})
+    def test_body_slices_the_mapping(self):
+        """The body is sent in slices of the cached mapping, not a copy."""
+        # Setup
+        data = os.urandom(trim_response.MAPPED_BLOCK_SIZE * 2 + 10)
+        self.path.write_bytes(data)
+        view = trim_response.get_mapped_cache().get(self.path)
+
+        # Execute
+        parts = list(trim_response.iter_mapped(view))
+        response = content_type_response(self.path)
+        sent = list(response.streaming_content)
+
+        # Assert
+        self.assertEqual([len(x) for x in parts], [65536, 65536, 10])
+        self.assertTrue(all(x.obj is view.obj for x in parts))
+        self.assertLessEqual(max(len(x) for x in sent), len(parts[0]))
+        self.assertEqual(b"".join(sent), data)
+
+    def test_disabled(self):
+        # Execute
+        response = content_type_response(self.path)
+
+        # Assert
+        self.assertIsInstance(response, FileResponse)
+        response.file_to_stream.close()
+
+
+class FileMetaCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hit_and_change(self):
+        # Setup
+        cache = FileMetaCache()
+        path = self.root / "a.css"
+        path.write_bytes(b"body {}")
+
+        # Execute
+        first = cache.get(path)
+        second = cache.get(path)
+        path.write_bytes(b"body { color: red }")
+        os.utime(path, ns=(0, first.stat_result.st_mtime_ns + 10**9))
+        third = cache.get(path)
+
+        # Assert
+        self.assertEqual(first.content_type, "text/css")
+        self.assertEqual(first.size, 7)
+        self.assertEqual(first.etag, second.etag)
+        self.assertNotEqual(first.etag, third.etag)
+        self.assertEqual(third.size, 19)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_bounded(self):
+        # Setup
+        cache = FileMetaCache(max_entries=2)
+        for name in "abc":
+            (self.root / name).write_bytes(b"x")
+
+        # Execute
+        for name in "abc":
+            cache.get(self.root / name)
+
+        # Assert
+        self.assertEqual(
+            list(cache.entries), [str(self.root / "b"), str(self.root / "c")]
+        )
+
+    def test_sniffed_once(self):
+        # Setup
+        path = self.root / "noext"
+        path.write_bytes(b"%PDF-1.4")
+        calls = []
+
+        def from_file(filename, mime=False):
+            calls.append(filename)
+            return "application/pdf"
+
+        fake_magic = SimpleNamespace(from_file=from_file, MagicException=Exception)
+        cache = FileMetaCache()
+
+        # Execute
+        with patch.object(trim_response, "magic", fake_magic):
+            first = cache.get(path)
+            cache.get(path)
+
+        # Assert
+        self.assertEqual(first.content_type, "application/pdf")
+        self.assertEqual(calls, [str(path)])
+
+    def test_content_type_response_guess(self):
+        # Setup
+        path = self.root / "app.js"
+        path.write_bytes(b"1;")
+
+        # Execute
+        response = content_type_response(path)
+
+        # Assert
+        self.assertEqual(response["Content-Type"], mimetypes.guess_type("a.js")[0])
+        response.file_to_stream.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+"""
+Test trim.views.serialized module.
+
+JSON list views render in memory, or stream the list in chunks.
+"""
+
+import datetime
+import json
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from django import http
+from django.contrib.auth.models import Group
+from django.test import RequestFactory
+
+from tests.cases import AuthTablesTestCase
+from trim.views import JsonListView, serialized
+from trim.views.serialized import dumps
+
+
+class GroupListView(JsonListView):
+    model = Group
+    fields = ("id", "name")
+
+
+class JsonListViewTest(AuthTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.bulk_create([Group(name=f"group-{i:02}") for i in range(25)])
+
+    def render(self, **initkwargs):
+        view = GroupListView.as_view(**initkwargs)
+        return view(RequestFactory().get("/"))
+
+    def stream_body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_in_memory(self):
+        # Execute
+        response = self.render()
+        data = json.loads(response.content)
+
+        # Assert
+        self.assertEqual(data["count"], 25)
+        self.assertEqual(data["object_list"][0]["name"], "group-00")
+
+    def test_count_reuses_rows(self):
+        """The rows read with `values_list()` are counted, without a
+        `COUNT(*)`.
+        """
+        # Execute
+        with self.assertNumQueries(1):
+            response = self.render()
+
+        # Assert
+        self.assertEqual(json.loads(response.content)["count"], 25)
+
+    def test_stream_matches_in_memory(self):
+        # Setup
+        expected = json.loads(self.render().content)
+
+        # Execute
+        response = self.render(stream=True, stream_chunk_size=10)
+        body = self.stream_body(response)
+
+        # Assert
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(body), expected)
+        self.assertEqual(list(json.loads(body)), ["object_list", "count"])
+
+    def test_stream_count_is_one_query(self):
+        # Execute
+        with self.assertNumQueries(1):
+            response = self.render(stream=True)
+
+        # Assert
+        self.assertEqual(json.loads(self.stream_body(response))["count"], 25)
+
+    def test_stream_without_count(self):
+        # Execute
+        with self.assertNumQueries(0):
+            response = self.render(
+                stream=True, include_count=False, response_extra={"v": 2}
+            )
+
+        # Assert
+        self.assertEqual(json.loads(self.stream_body(response))["v"], 2)
+        self.assertNotIn(
+            "count",
+            json.loads(self.stream_body(self.render(stream=True, include_count=False))),
+        )
+
+    def test_stream_empty(self):
+        # Setup
+        Group.objects.all().delete()
+
+        # Execute
+        response = self.render(stream=True)
+
+        # Assert
+        self.assertEqual(
+            json.loads(self.stream_body(response)), {"object_list": [], "count": 0}
+        )
+
+
+class ValuesFastPathTest(AuthTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.bulk_create([Group(name=f"group-{i:02}") for i in range(5)])
+
+    def view(self, **attrs):
+        view = type("View", (GroupListView,), attrs)()
+        view.setup(RequestFactory().get("/"))
+        return view
+
+    def test_values_rows(self):
+        # Setup
+        view = self.view()
+
+        # Execute
+        with self.assertNumQueries(1):
+            rows = view.serialize_result(Group.objects.order_by("id"))
+
+        # Assert
+        self.assertEqual(view.get_values_fields(Group.objects.all()), ["id", "name"])
+        self.assertEqual(rows[0], {"id": rows[0]["id"], "name": "group-00"})
+
+    def test_same_as_serializer(self):
+        # Setup
+        queryset = Group.objects.order_by("id")
+
+        # Execute
+        fast = self.view().serialize_result(queryset)
+        slow = self.view(values_fast_path=False).serialize_result(queryset)
+
+        # Assert
+        self.assertEqual(fast, slow)
+
+    def test_all_fields(self):
+        # Execute
+        fields = self.view(fields=None).get_values_fields(Group.objects.all())
+
+        # Assert
+        self.assertEqual(fields, ["id", "name"])
+
+    def test_falls_back(self):
+        # Setup
+        queryset = Group.objects.all()
+
+        def get_dump_object(self, obj):
+            return {"name": obj.name.upper()}
+
+        # Assert
+        self.assertIsNone(
+            self.view(fields=("name", "natural_key")).get_values_fields(queryset)
+        )
+        self.assertIsNone(
+            self.view(fields=("permissions",)).get_values_fields(queryset)
+        )
+        self.assertIsNone(self.view().get_values_fields(queryset.values("name")))
+        self.assertIsNone(self.view().get_values_fields(list(queryset)))
+        custom = self.view(get_dump_object=get_dump_object)
+        self.assertIsNone(custom.get_values_fields(queryset))
+        self.assertEqual(custom.serialize_result(queryset)[0], {"name": "GROUP-00"})
+
+
+class DumpsTest(unittest.TestCase):
+    data = {
+        "price": Decimal("9.99"),
+        "when": datetime.datetime(2025, 1, 15, 10, 30, 0, 123456),
+        "day": datetime.date(2025, 1, 15),
+        "list": [1, "a", None],
+    }
+
+    def test_matches_django_encoder(self):
+        # Setup
+        from django.core.serializers.json import DjangoJSONEncoder
+
+        expected = json.loads(json.dumps(self.data, cls=DjangoJSONEncoder))
+
+        # Execute
+        fast = json.loads(dumps(self.data))
+        with patch.object(serialized, "orjson", None), patch.object(
+            serialized, "ujson", None
+        ):
+            plain = json.loads(dumps(self.data))
+
+        # Assert
+        self.assertEqual(fast, expected)
+        self.assertEqual(plain, expected)
+
+    def test_response_safe(self):
+        with self.assertRaises(TypeError):
+            serialized.JsonResponse([1, 2])
+        self.assertEqual(serialized.JsonResponse([1], safe=False).content, b"[1]")
+
+    def test_response_is_django_json_response(self):
+        # Execute
+        response = serialized.JsonResponse({"a": 1})
+
+        # Assert
+        self.assertIsInstance(response, http.JsonResponse)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_response_encoder_and_params(self):
+        # Setup
+        class Encoder(json.JSONEncoder):
+            def default(self, o):
+                return "set" if isinstance(o, set) else super().default(o)
+
+        # Execute
+        response = serialized.JsonResponse(
+            {"b": set(), "a": 1}, encoder=Encoder, json_dumps_params={"indent": 1}
+        )
+
+        # Assert
+        self.assertEqual(response.content, b'{\n "b": "set",\n "a": 1\n}')
@@ -0,0 +1,766 @@
+"""
+Test trim.views.upload module.
+
+Run the chunked upload views through a complete upload and merge.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponseBase
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+
+from trim import merge as merge_mod
+from trim.upload_tasks import get_runner
+from trim.views import upload
+
+
+def make_view(view_class, method="post", data=None, **kwargs):
+    request = getattr(RequestFactory(), method)("/", data or {})
+    request.user = AnonymousUser()
+    view = view_class()
+    view.setup(request, **kwargs)
+    return view, request
+
+
+def post_upload(content, chunk_size, mode=upload.PARTS, file_uuid=""):
+    data = {
+        "filename": "movie.bin",
+        "filepath": "movie.bin",
+        "filetype": "application/octet-stream",
+        "byte_size": len(content),
+        "chunk_size": chunk_size,
+        "file_uuid": file_uuid,
+    }
+    view_class = type("View", (upload.UploadAssetView,), {"upload_mode": mode})
+    view, request = make_view(view_class, data=data)
+    return json.loads(view.post(request).content)
+
+
+def start_upload(content, chunk_size, mode=upload.PARTS):
+    return post_upload(content, chunk_size, mode)["file_uuid"]
+
+
+def send_chunk(file_uuid, index, data, chunk_hash=""):
+    payload = {
+        "file_uuid": file_uuid,
+        "chunk_index": index,
+        "filepart": SimpleUploadedFile("blob", data),
+        "chunk_hash": chunk_hash,
+    }
+    view, request = make_view(upload.UploadChunkView, data=payload)
+    return view.post(request)
+
+
+def send_raw(data, headers=None, **kwargs):
+    request = RequestFactory().post(
+        "/", data, content_type="application/octet-stream", headers=headers
+    )
+    request.user = AnonymousUser()
+    view = upload.UploadRawChunkView()
+    view.setup(request, **kwargs)
+    return view.dispatch(request, **kwargs)
+
+
+def status(file_uuid):
+    view, request = make_view(upload.UploadStatusView, method="get", uuid=file_uuid)
+    return json.loads(view.get(request).content)
+
+
+def progress(file_uuid):
+    view, request = make_view(upload.UploadProgressView, method="get", uuid=file_uuid)
+    return json.loads(view.get(request).content)
+
+
+def merge(file_uuid):
+    view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+    ok = view.perform_all()
+    return ok, view.get_asset()
+
+
+class UploadTestCase(unittest.TestCase):
+    content = b"0123456789"
+    chunk_size = 4
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.settings = override_settings(CHUNK_UPLOAD_DIR=self.tmpdir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def chunks(self):
+        size = self.chunk_size
+        return [self.content[i : i + size] for i in range(0, len(self.content), size)]
+
+
+class PartsUploadTest(UploadTestCase):
+    """Chunks stored as .part_N files and recombined."""
+
+    def test_upload_and_merge(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, data)
+
+        # Execute
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(ok)
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+        self.assertTrue(asset["verification"]["size"])
+
+    def test_missing_chunk_does_not_merge(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        chunks = self.chunks()
+        send_chunk(file_uuid, 0, chunks[0])
+        send_chunk(file_uuid, 2, chunks[2])
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+
+        # Execute
+        ok = view.perform_all()
+
+        # Assert
+        self.assertFalse(ok)
+        self.assertEqual(view.missing_chunks, [1])
+        self.assertNotIn("output", view.get_asset())
+        self.assertIsNone(view.get_merge_state())
+
+
+class InplaceUploadTest(UploadTestCase):
+    """Chunks written at their offset within one file."""
+
+    def test_out_of_order_chunks(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+        chunks = list(enumerate(self.chunks()))
+
+        # Execute
+        for index, data in reversed(chunks):
+            send_chunk(file_uuid, index, data)
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(ok)
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+        self.assertEqual(output.name, "movie.bin")
+
+    def test_incomplete_upload_does_not_merge(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+        send_chunk(file_uuid, 0, self.chunks()[0])
+
+        # Execute
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertFalse(ok)
+        self.assertNotIn("output", asset)
+
+    def test_short_chunk_rejected(self):
+        """A short middle chunk would leave a hole in the preallocated file."""
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+        view, request = make_view(upload.UploadChunkView)
+        data = {
+            "file_uuid": file_uuid,
+            "chunk_index": 1,
+            "filepart": SimpleUploadedFile("blob", self.chunks()[1][:2]),
+        }
+
+        # Execute
+        with self.assertRaises(upload.ChunkError):
+            view.save_file_part(data)
+        response = send_chunk(file_uuid, 2, self.chunks()[2][:1])
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(status(file_uuid)["received"], [])
+
+
+class ConcurrentChunkTest(UploadTestCase):
+    """Chunks sent together, repeated and out of range."""
+
+    content = bytes(range(256)) * 8
+    chunk_size = 100
+
+    def send_all(self, file_uuid):
+        jobs = list(enumerate(self.chunks()))
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            return list(pool.map(lambda x: send_chunk(file_uuid, *x), jobs))
+
+    def test_concurrent_parts(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+
+        # Execute
+        responses = self.send_all(file_uuid)
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+
+    def test_concurrent_inplace(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+
+        # Execute
+        self.send_all(file_uuid)
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(ok)
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+
+    def test_resend_replaces_chunk(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, b"x" * len(data))
+
+        # Execute
+        send_chunk(file_uuid, 0, self.chunks()[0])
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, data)
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+
+    def test_status_lists_missing(self):
+        # Setup
+        for mode in (upload.PARTS, upload.INPLACE):
+            file_uuid = start_upload(self.content, self.chunk_size, mode)
+            send_chunk(file_uuid, 1, self.chunks()[1])
+            send_chunk(file_uuid, 4, self.chunks()[4])
+
+            # Execute
+            result = status(file_uuid)
+
+            # Assert
+            self.assertEqual(result["chunk_count"], 21)
+            self.assertEqual(result["received"], [1, 4])
+            self.assertEqual(result["missing"][:4], [0, 2, 3, 5])
+
+    def test_chunk_out_of_range(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+
+        # Execute
+        response = send_chunk(file_uuid, 21, b"x")
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(json.loads(response.content)["ok"])
+
+    def test_unknown_upload(self):
+        self.assertEqual(send_chunk("nope", 0, b"x").status_code, 400)
+        self.assertFalse(status("nope")["ok"])
+
+
+class ChecksumTest(UploadTestCase):
+    """Chunk hashes checked on arrival, file hashes taken at merge."""
+
+    def sha(self, data):
+        return hashlib.sha256(data).hexdigest()
+
+    def send_hashed(self, file_uuid):
+        for index, data in enumerate(self.chunks()):
+            response = send_chunk(file_uuid, index, data, self.sha(data))
+            self.assertEqual(response.status_code, 200)
+
+    def test_parts_file_hash(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        self.send_hashed(file_uuid)
+
+        # Execute
+        with override_settings(CHUNK_UPLOAD_HASH_FILE=True):
+            ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertEqual(asset["output"]["hash"]["file"], self.sha(self.content))
+        self.assertTrue(asset["verification"]["chunks"])
+
+    def test_parts_kernel_copy_by_default(self):
+        """Without a file hash the merge is not forced through a buffer."""
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        self.send_hashed(file_uuid)
+
+        # Execute
+        copy_range = patch.object(merge_mod, "copy_range", wraps=merge_mod.copy_range)
+        with copy_range as copied:
+            ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(copied.called)
+        hashers = [(c.args + (None,) * 6)[5] for c in copied.call_args_list]
+        self.assertEqual(set(hashers), {None})
+        self.assertIsNone(asset["output"]["hash"]["file"])
+        self.assertTrue(asset["verification"]["chunks"])
+
+    def test_inplace_chunks_digest(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+        self.send_hashed(file_uuid)
+
+        # Execute
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        digests = b"".join(hashlib.sha256(c).digest() for c in self.chunks())
+        hashes = asset["output"]["hash"]
+        self.assertIsNone(hashes["file"])
+        self.assertEqual(hashes["chunks"], hashlib.sha256(digests).hexdigest())
+        self.assertTrue(asset["verification"]["chunks"])
+
+    def test_algorithm_given_to_client(self):
+        """The client hashes chunks with the algorithm of the server."""
+        # Execute
+        with override_settings(CHUNK_UPLOAD_HASH="sha512"):
+            result = post_upload(self.content, self.chunk_size)
+            data = self.chunks()[0]
+            digest = hashlib.new(result["hash_algorithm"], data).hexdigest()
+            response = send_chunk(result["file_uuid"], 0, data, digest)
+
+        # Assert
+        self.assertEqual(result["hash_algorithm"], "sha512")
+        self.assertEqual(response.status_code, 200)
+
+    def test_mismatch_rejects_chunk(self):
+        for mode in (upload.PARTS, upload.INPLACE):
+            # Setup
+            file_uuid = start_upload(self.content, self.chunk_size, mode)
+
+            # Execute
+            response = send_chunk(file_uuid, 0, self.chunks()[0], self.sha(b"bad"))
+
+            # Assert
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(status(file_uuid)["received"], [])
+
+    def test_unhashed_chunks_are_not_verified(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, data)
+
+        # Execute
+        ok, asset = merge(file_uuid)
+
+        # Assert
+        self.assertTrue(asset["verification"]["size"])
+        self.assertFalse(asset["verification"]["chunks"])
+
+
+class ResumeTest(UploadTestCase):
+    """Resume an upload from the durable manifest."""
+
+    content = b"abcdefghijklmnopqrstuvwxyz"
+
+    def test_resume_after_session_loss(self):
+        for mode in (upload.PARTS, upload.INPLACE):
+            # Setup - two chunks arrive, then the session store is lost.
+            file_uuid = start_upload(self.content, self.chunk_size, mode)
+            send_chunk(file_uuid, 0, self.chunks()[0])
+            send_chunk(file_uuid, 3, self.chunks()[3])
+            upload.get_cache().delete(file_uuid)
+
+            # Execute
+            result = post_upload(self.content, self.chunk_size, mode, file_uuid)
+            for index in result["missing"]:
+                send_chunk(file_uuid, index, self.chunks()[index])
+            ok, asset = merge(file_uuid)
+
+            # Assert
+            self.assertTrue(result["resumed"])
+            self.assertEqual(result["file_uuid"], file_uuid)
+            self.assertEqual(result["missing"], [1, 2, 4, 5, 6])
+            output = Path(self.tmpdir.name) / asset["output"]["path"]
+            self.assertEqual(output.read_bytes(), self.content)
+
+    def test_different_file_starts_new_upload(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+
+        # Execute
+        result = post_upload(self.content + b"!", self.chunk_size, file_uuid=file_uuid)
+
+        # Assert
+        self.assertNotEqual(result["file_uuid"], file_uuid)
+        self.assertNotIn("resumed", result)
+
+    def test_finished_upload_is_not_resumed(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, data)
+        merge(file_uuid)
+        upload.get_cache().delete(file_uuid)
+
+        # Execute
+        result = post_upload(self.content, self.chunk_size, file_uuid=file_uuid)
+
+        # Assert
+        self.assertNotEqual(result["file_uuid"], file_uuid)
+
+    def test_bad_uuid_is_ignored(self):
+        result = post_upload(self.content, self.chunk_size, file_uuid="../../etc")
+        self.assertNotIn("resumed", result)
+
+
+class BackgroundMergeTest(UploadTestCase):
+    """The merge queued on a runner, with progress in the session store."""
+
+    def upload_all(self, mode=upload.PARTS):
+        file_uuid = start_upload(self.content, self.chunk_size, mode)
+        for index, data in enumerate(self.chunks()):
+            send_chunk(file_uuid, index, data)
+        return file_uuid
+
+    def start_merge(self, file_uuid):
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        return view, view.start_merge()
+
+    @override_settings(
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ThreadRunner"}
+    )
+    def test_thread_runner_merges(self):
+        for mode in (upload.PARTS, upload.INPLACE):
+            # Setup
+            file_uuid = self.upload_all(mode)
+
+            # Execute
+            view, started = self.start_merge(file_uuid)
+            get_runner().shutdown(wait=True)
+            result = progress(file_uuid)
+
+            # Assert
+            self.assertTrue(started)
+            self.assertTrue(result["done"])
+            self.assertEqual(result["state"], upload.DONE)
+            self.assertEqual(result["written"], len(self.content))
+            output = Path(self.tmpdir.name) / view.get_asset()["output"]["path"]
+            self.assertEqual(output.read_bytes(), self.content)
+
+    @override_settings(
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ImmediateRunner"}
+    )
+    def test_merge_starts_once(self):
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        view.claim_merge()
+
+        # Execute
+        _, second = self.start_merge(file_uuid)
+
+        # Assert
+        self.assertFalse(second)
+        self.assertEqual(progress(file_uuid)["state"], upload.QUEUED)
+
+    @override_settings(
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ImmediateRunner"}
+    )
+    def test_view_options_reach_merge(self):
+        """Attributes given with `as_view(**initkwargs)` apply to the job."""
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        view.hash_file = True
+
+        # Execute
+        started = view.start_merge()
+
+        # Assert
+        self.assertTrue(started)
+        hashes = view.get_asset()["output"]["hash"]
+        self.assertEqual(hashes["file"], hashlib.sha256(self.content).hexdigest())
+
+    def test_unimportable_view_is_not_claimed(self):
+        # Setup
+        class LocalMergeView(upload.MergeAssetView):
+            pass
+
+        file_uuid = self.upload_all()
+        view, request = make_view(LocalMergeView, uuid=file_uuid)
+
+        # Execute
+        with self.assertRaises(ImproperlyConfigured):
+            view.start_merge()
+
+        # Assert
+        self.assertIsNone(progress(file_uuid)["state"])
+
+    def test_job_failing_to_start_fails_claim(self):
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        view.claim_merge()
+
+        # Execute
+        with self.assertRaises(ImportError):
+            upload.merge_job("trim.views.upload.MissingView", file_uuid, "")
+
+        # Assert
+        self.assertEqual(progress(file_uuid)["state"], upload.FAILED)
+
+    def test_submit_error_fails_claim(self):
+        # Setup
+        file_uuid = self.upload_all()
+        runner = patch.object(upload, "get_runner")
+
+        # Execute
+        with runner as get_runner_mock:
+            get_runner_mock.return_value.submit.side_effect = RuntimeError("down")
+            with self.assertRaises(RuntimeError):
+                self.start_merge(file_uuid)
+
+        # Assert
+        result = progress(file_uuid)
+        self.assertEqual(result["state"], upload.FAILED)
+        self.assertFalse(
+            make_view(upload.MergeAssetView, uuid=file_uuid)[0].is_merging()
+        )
+
+    def test_stale_merge_restarts(self):
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        view.set_merge_state(upload.RUNNING)
+
+        # Execute
+        later = time.time() + upload.MERGE_STALE + 1
+        with patch.object(time, "time", return_value=later):
+            merging = view.is_merging()
+
+        # Assert
+        self.assertTrue(view.is_merging())
+        self.assertFalse(merging)
+
+    def test_incomplete_upload_is_not_queued(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size, upload.INPLACE)
+        send_chunk(file_uuid, 0, self.chunks()[0])
+
+        # Execute
+        view, started = self.start_merge(file_uuid)
+
+        # Assert
+        self.assertFalse(started)
+        self.assertIsNone(progress(file_uuid)["state"])
+
+    def test_failed_merge_records_error(self):
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+
+        # Execute
+        with patch.object(view, "assemble", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                view.perform_all()
+
+        # Assert
+        result = progress(file_uuid)
+        self.assertEqual(result["state"], upload.FAILED)
+        self.assertEqual(result["error"], "disk full")
+        self.assertFalse(result["done"])
+
+    @override_settings(
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ImmediateRunner"}
+    )
+    def test_delete_cache_purges_parts(self):
+        # Setup
+        file_uuid = self.upload_all()
+        view, request = make_view(upload.MergeAssetView, uuid=file_uuid)
+        parts_dir = Path(self.tmpdir.name) / view.get_parts_dir()
+
+        # Execute
+        view.perform_all(delete_cache=True)
+
+        # Assert
+        asset = view.get_asset()
+        self.assertFalse(parts_dir.exists())
+        self.assertFalse(Path(asset["deletion"]["trash"]).exists())
+        output = Path(self.tmpdir.name) / asset["output"]["path"]
+        self.assertEqual(output.read_bytes(), self.content)
+
+    def test_progress_unknown_upload(self):
+        self.assertFalse(progress("nope")["ok"])
+
+
+class RawChunkTest(UploadTestCase):
+    """Chunks sent as the raw request body."""
+
+    def test_url_kwargs(self):
+        for mode in (upload.PARTS, upload.INPLACE):
+            # Setup
+            file_uuid = start_upload(self.content, self.chunk_size, mode)
+
+            # Execute
+            for index, data in reversed(list(enumerate(self.chunks()))):
+                response = send_raw(data, uuid=file_uuid, index=index)
+                self.assertEqual(response.status_code, 200)
+            ok, asset = merge(file_uuid)
+
+            # Assert
+            output = Path(self.tmpdir.name) / asset["output"]["path"]
+            self.assertEqual(output.read_bytes(), self.content)
+
+    def test_headers(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        data = self.chunks()[1]
+        headers = {
+            "X-File-UUID": file_uuid,
+            "X-Chunk-Index": "1",
+            "X-Chunk-Hash": hashlib.sha256(data).hexdigest(),
+        }
+
+        # Execute
+        response = send_raw(data, headers=headers)
+
+        # Assert
+        self.assertEqual(json.loads(response.content)["chunk_index"], 1)
+        self.assertEqual(status(file_uuid)["received"], [1])
+
+    def test_rejected_chunks(self):
+        # Setup
+        file_uuid = start_upload(self.content, self.chunk_size)
+        data = self.chunks()[0]
+
+        # Execute
+        no_index = send_raw(data, headers={"X-File-UUID": file_uuid})
+        bad_hash = send_raw(
+            data, headers={"X-Chunk-Hash": "00"}, uuid=file_uuid, index=0
+        )
+        view, request = make_view(upload.UploadRawChunkView)
+        body = upload.RequestBody(io.BytesIO(data[:2]), len(data))
+        chunk = {"file_uuid": file_uuid, "chunk_index": 0, "filepart": body}
+        with self.assertRaises(upload.ChunkError):
+            view.save_file_part(chunk)
+
+        # Assert
+        self.assertEqual(no_index.status_code, 400)
+        self.assertEqual(bad_hash.status_code, 400)
+        self.assertEqual(status(file_uuid)["received"], [])
+        parts_dir = Path(self.tmpdir.name) / "anonymous" / file_uuid
+        self.assertEqual([p.name for p in parts_dir.iterdir()], ["manifest.jsonl"])
+
+    def test_get_not_allowed(self):
+        request = RequestFactory().get("/")
+        response = upload.UploadRawChunkView.as_view()(request)
+        self.assertEqual(response.status_code, 405)
+
+
+class AsyncUploadTest(UploadTestCase):
+    """The async views, with chunks sent concurrently on one event loop."""
+
+    content = bytes(range(256)) * 4
+    chunk_size = 100
+
+    async def call(self, view_class, data=None, method="post", **kwargs):
+        request = getattr(AsyncRequestFactory(), method)("/", data or {})
+        request.user = AnonymousUser()
+        return await view_class.as_view()(request, **kwargs)
+
+    async def upload(self, mode):
+        data = {
+            "filename": "movie.bin",
+            "filepath": "movie.bin",
+            "filetype": "application/octet-stream",
+            "byte_size": len(self.content),
+            "chunk_size": self.chunk_size,
+        }
+        view_class = type("View", (upload.AsyncUploadAssetView,), {"upload_mode": mode})
+        response = await self.call(view_class, data)
+        file_uuid = json.loads(response.content)["file_uuid"]
+
+        sends = [
+            self.call(
+                upload.AsyncUploadChunkView,
+                {
+                    "file_uuid": file_uuid,
+                    "chunk_index": index,
+                    "filepart": SimpleUploadedFile("blob", data),
+                },
+            )
+            for index, data in enumerate(self.chunks())
+        ]
+        responses = await asyncio.gather(*sends)
+        status = await self.call(
+            upload.AsyncUploadStatusView, method="get", uuid=file_uuid
+        )
+        return file_uuid, responses, json.loads(status.content)
+
+    def test_async_views(self):
+        for mode in (upload.PARTS, upload.INPLACE):
+            # Execute
+            file_uuid, responses, result = asyncio.run(self.upload(mode))
+            ok, asset = merge(file_uuid)
+
+            # Assert
+            self.assertTrue(upload.AsyncUploadChunkView.view_is_async)
+            self.assertTrue(all(r.status_code == 200 for r in responses))
+            self.assertEqual(result["missing"], [])
+            output = Path(self.tmpdir.name) / asset["output"]["path"]
+            self.assertEqual(output.read_bytes(), self.content)
+
+    def test_async_put(self):
+        """A PUT runs the sync `post` of the view, as `FormView.put` does."""
+        # Setup
+        request = RequestFactory().put("/")
+        request.user = AnonymousUser()
+        expected = upload.UploadChunkView.as_view()(request)
+
+        # Execute
+        response = asyncio.run(self.call(upload.AsyncUploadChunkView, method="put"))
+
+        # Assert
+        self.assertIsInstance(response, HttpResponseBase)
+        self.assertEqual(response.status_code, expected.status_code)
+
+    def test_pool_thread_closes_connections(self):
+        # Setup
+        sensitive = type(
+            "View", (upload.AsyncUploadStatusView,), {"thread_sensitive": True}
+        )
+        file_uuid = start_upload(self.content, self.chunk_size)
+
+        # Execute
+        with patch.object(upload.connections, "close_all") as close_all:
+            asyncio.run(
+                self.call(upload.AsyncUploadStatusView, method="get", uuid=file_uuid)
+            )
+            pool_calls = close_all.call_count
+            asyncio.run(self.call(sensitive, method="get", uuid=file_uuid))
+
+        # Assert
+        self.assertEqual(pool_calls, 1)
+        self.assertEqual(close_all.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Test trim.upload_cleanup module.
+
+Parts directories move to the trash at once and are removed in batches.
+"""
+
+import io
+import os
+import time
+import unittest
+import uuid
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from trim import upload_cleanup
+from trim.upload_cleanup import (
+    TRASH_NAME,
+    empty_trash,
+    find_abandoned,
+    remove_tree,
+    sweep,
+    trash,
+)
+from trim.views.upload import unlink_dir_files
+
+
+def make_upload(root, username="anonymous", age=0):
+    path = Path(root) / username / str(uuid.uuid4())
+    (path / "nested").mkdir(parents=True)
+    (path / "movie.bin.part_0").write_bytes(b"x" * 10)
+    (path / "nested" / "movie.bin.part_1").write_bytes(b"y" * 5)
+    if age:
+        then = time.time() - age
+        for p in (path / "nested", path / "movie.bin.part_0", path):
+            os.utime(p, (then, then))
+    return path
+
+
+class CleanupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.settings = override_settings(CHUNK_UPLOAD_DIR=self.tmpdir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+
+class RemoveTest(CleanupTestCase):
+    def test_remove_tree_counts(self):
+        # Setup
+        path = make_upload(self.root)
+
+        # Execute
+        with patch.object(time, "sleep") as sleep:
+            stats = remove_tree(path, batch_size=1, pause=0.5)
+
+        # Assert
+        self.assertFalse(path.exists())
+        self.assertEqual(stats.as_dict(), {"files": 2, "dirs": 2, "bytes": 15})
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_trash_and_empty(self):
+        # Setup
+        path = make_upload(self.root)
+
+        # Execute
+        trashed = trash(path)
+        moved = trashed.exists()
+        stats = empty_trash()
+
+        # Assert
+        self.assertFalse(path.exists())
+        self.assertTrue(moved)
+        self.assertEqual(trashed.parent, self.root / TRASH_NAME)
+        self.assertEqual(stats.bytes, 15)
+        self.assertEqual(list((self.root / TRASH_NAME).iterdir()), [])
+
+    def test_empty_trash_entry_removed_meanwhile(self):
+        """A concurrent cleanup removing an entry first is skipped."""
+        # Setup
+        trash_dir = self.root / TRASH_NAME
+        trash_dir.mkdir()
+        (trash_dir / "gone").write_bytes(b"x" * 10)
+        (trash_dir / "kept").write_bytes(b"y" * 5)
+        scandir = os.scandir
+
+        def scandir_then_remove(path):
+            entries = list(scandir(path))
+            (trash_dir / "gone").unlink()
+            return iter(entries)
+
+        # Execute
+        with patch.object(upload_cleanup.os, "scandir", scandir_then_remove):
+            stats = empty_trash()
+
+        # Assert
+        self.assertEqual(stats.as_dict(), {"files": 1, "dirs": 0, "bytes": 5})
+        self.assertEqual(list(trash_dir.iterdir()), [])
+
+    def test_unlink_dir_files(self):
+        # Setup
+        path = make_upload(self.root)
+
+        # Execute
+        result = unlink_dir_files(path)
+
+        # Assert
+        self.assertEqual(sorted(result["files"]), ["movie.bin.part_0", "nested"])
+        self.assertEqual(result["new_count"], 0)
+        self.assertTrue(path.exists())
+
+
+class SweepTest(CleanupTestCase):
+    def test_sweep_abandoned(self):
+        # Setup
+        old = make_upload(self.root, age=60)
+        fresh = make_upload(self.root)
+        finished = self.root / "finished" / "anonymous"
+        finished.mkdir(parents=True)
+        (finished / "movie.bin").write_bytes(b"z")
+        os.utime(finished, (0, 0))
+
+        # Execute
+        abandoned = find_abandoned(ttl=30)
+        stats = sweep(ttl=30)
+
+        # Assert
+        self.assertEqual(abandoned, [old])
+        self.assertFalse(old.exists())
+        self.assertTrue(fresh.exists())
+        self.assertTrue((finished / "movie.bin").exists())
+        self.assertEqual(stats.bytes, 15)
+
+    @override_settings(
+        CHUNK_UPLOAD_SWEEP_INTERVAL=60,
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ImmediateRunner"},
+    )
+    def test_schedule_sweep(self):
+        # Setup
+        make_upload(self.root, age=upload_cleanup.DEFAULT_SWEEP_TTL + 60)
+
+        # Execute
+        with patch.object(upload_cleanup, "last_sweep", None):
+            first = upload_cleanup.schedule_sweep()
+            second = upload_cleanup.schedule_sweep()
+
+        # Assert
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(list((self.root / "anonymous").iterdir()), [])
+
+    def test_command(self):
+        # Setup
+        make_upload(self.root, age=60)
+        out = io.StringIO()
+
+        # Execute
+        call_command("upload_sweep", ttl=30, stdout=out)
+
+        # Assert
+        self.assertIn("2 files, 2 dirs, 15 bytes", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
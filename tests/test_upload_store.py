@@ -0,0 +1,167 @@
+"""
+Test trim.upload_store module.
+
+Each store keeps JSON sessions against a key and drops them after the TTL.
+"""
+
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.test import override_settings
+
+from trim import upload_store
+from trim.upload_store import (
+    DjangoCacheStore,
+    LocalStore,
+    LockTimeout,
+    SQLiteStore,
+    get_store,
+)
+
+
+class StoreContract(object):
+    """Shared tests for every store."""
+
+    def make_store(self, ttl=None):
+        raise NotImplementedError
+
+    def test_set_and_get(self):
+        # Setup
+        store = self.make_store()
+
+        # Execute
+        store.set("abc", {"filename": "a.bin", "bytesize": 10})
+
+        # Assert
+        self.assertEqual(store.get("abc"), {"filename": "a.bin", "bytesize": 10})
+        self.assertEqual(store["abc"]["bytesize"], 10)
+        self.assertIn("abc", store)
+
+    def test_missing_key(self):
+        # Setup
+        store = self.make_store()
+
+        # Assert
+        self.assertIsNone(store.get("nope"))
+        self.assertNotIn("nope", store)
+        with self.assertRaises(KeyError):
+            store["nope"]
+
+    def test_delete(self):
+        # Setup
+        store = self.make_store()
+        store["abc"] = {"a": 1}
+
+        # Execute
+        del store["abc"]
+
+        # Assert
+        self.assertIsNone(store.get("abc"))
+
+    def test_expired_sessions_are_hidden_and_evicted(self):
+        # Setup
+        store = self.make_store(ttl=10)
+        store.set("old", {"a": 1})
+
+        # Execute
+        with patch.object(time, "time", return_value=time.time() + 60):
+            hidden = store.get("old")
+            evicted = store.evict()
+
+        # Assert
+        self.assertIsNone(hidden)
+        self.assertEqual(evicted, 1)
+
+    def test_lock_is_exclusive(self):
+        # Setup
+        store = self.make_store()
+        store.set("abc", {"count": 0})
+
+        def increment(_):
+            with store.lock("abc"):
+                info = store.get("abc")
+                info["count"] += 1
+                store.set("abc", info)
+
+        # Execute
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(increment, range(20)))
+
+        # Assert
+        self.assertEqual(store.get("abc")["count"], 20)
+
+
+class LocalStoreTest(StoreContract, unittest.TestCase):
+    def make_store(self, ttl=None):
+        return LocalStore(ttl)
+
+
+class SQLiteStoreTest(StoreContract, unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_store(self, ttl=None):
+        return SQLiteStore(ttl, path=Path(self.tmpdir.name) / "s.sqlite3")
+
+    def test_shared_between_instances(self):
+        # Setup - two stores act as two workers on one file.
+        first = self.make_store()
+        second = self.make_store()
+
+        # Execute
+        first.set("abc", {"done": False})
+
+        # Assert
+        self.assertEqual(second.get("abc"), {"done": False})
+
+
+class DjangoCacheStoreTest(unittest.TestCase):
+    def test_set_and_get(self):
+        # Setup
+        store = DjangoCacheStore(prefix="test-upload:")
+
+        # Execute
+        store.set("abc", {"a": 1})
+
+        # Assert
+        self.assertEqual(store.get("abc"), {"a": 1})
+        store.delete("abc")
+        self.assertIsNone(store.get("abc"))
+
+    def test_lock_timeout(self):
+        # Setup
+        store = DjangoCacheStore(prefix="test-lock:")
+
+        # Execute & Assert
+        with store.lock("abc"):
+            with self.assertRaises(LockTimeout):
+                with store.lock("abc", timeout=0.05):
+                    pass
+
+
+class GetStoreTest(unittest.TestCase):
+    def test_default_backend(self):
+        self.assertIsInstance(get_store(), DjangoCacheStore)
+
+    @override_settings(
+        CHUNK_UPLOAD_STORE={"BACKEND": "trim.upload_store.LocalStore", "TTL": 5}
+    )
+    def test_configured_backend(self):
+        # Execute
+        store = get_store()
+
+        # Assert
+        self.assertIsInstance(store, LocalStore)
+        self.assertEqual(store.ttl, 5)
+        self.assertIs(get_store(), store)
+
+
+if __name__ == "__main__":
+    unittest.main()
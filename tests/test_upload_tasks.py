@@ -0,0 +1,59 @@
+"""
+Test trim.upload_tasks module.
+
+Runners take a dotted job path and keyword arguments.
+"""
+
+import unittest
+
+from django.test import override_settings
+
+from trim.upload_tasks import ImmediateRunner, ThreadRunner, call, get_runner
+
+
+def add(a, b):
+    return a + b
+
+
+class RunnerTest(unittest.TestCase):
+    def test_call(self):
+        self.assertEqual(call("tests.test_upload_tasks.add", a=1, b=2), 3)
+
+    def test_immediate_runner(self):
+        # Execute
+        result = ImmediateRunner().submit("tests.test_upload_tasks.add", a=1, b=2)
+
+        # Assert
+        self.assertEqual(result, 3)
+
+    def test_thread_runner(self):
+        # Setup
+        runner = ThreadRunner(workers=1)
+
+        # Execute
+        future = runner.submit("tests.test_upload_tasks.add", a=2, b=3)
+        runner.shutdown(wait=True)
+
+        # Assert
+        self.assertEqual(future.result(), 5)
+        self.assertIsNone(runner.executor)
+
+
+class GetRunnerTest(unittest.TestCase):
+    def test_default_backend(self):
+        self.assertIsInstance(get_runner(), ThreadRunner)
+
+    @override_settings(
+        CHUNK_UPLOAD_RUNNER={"BACKEND": "trim.upload_tasks.ImmediateRunner"}
+    )
+    def test_configured_backend(self):
+        # Execute
+        runner = get_runner()
+
+        # Assert
+        self.assertIsInstance(runner, ImmediateRunner)
+        self.assertIs(get_runner(), runner)
+
+
+if __name__ == "__main__":
+    unittest.main()